@@ -1,8 +1,10 @@
 import logging
 from copy import deepcopy
+from threading import Lock, local
 from exporters.bypasses.base import BaseBypass
 from exporters.bypasses.s3_bypass_state import S3BypassState
 from exporters.readers.s3_reader import get_bucket
+from exporters.task_pool import BoundedTaskPool
 
 
 class BaseS3Bypass(BaseBypass):
@@ -17,10 +19,16 @@ class BaseS3Bypass(BaseBypass):
         - writer has no option items_limit set in configuration.
         - writer has default items_per_buffer_write and size_per_buffer_write per default.
         - writer has default write_buffer.
+
+    Keys are copied by bypass_concurrency threads at the same time (an
+    exporter option, 1 by default). boto connections are not thread safe,
+    so every thread uses its own source bucket connection.
     """
 
     def __init__(self, config, metadata):
         super(BaseS3Bypass, self).__init__(config, metadata)
+        self.lock = Lock()
+        self._thread_data = local()
         self.bypass_state = None
         self.set_metadata('keys_written', [])
         self.set_metadata('items_count', 0)
@@ -65,26 +73,48 @@ class BaseS3Bypass(BaseBypass):
             reader_aws_key,
             reader_aws_secret)
         self.total_items = self.bypass_state.stats['total_count']
-        source_bucket = get_bucket(
-            self.read_option('reader', 'bucket'), reader_aws_key, reader_aws_secret)
         keys_to_copy = deepcopy(self.bypass_state.pending_keys())
-        for key in keys_to_copy:
-            self._copy_key(source_bucket, key)
-            self.bypass_state.commit_copied_key(key)
-            logging.log(logging.INFO, 'Copied key {}'.format(key))
+        concurrency = self.config.bypass_concurrency
+        if concurrency <= 1:
+            for key in keys_to_copy:
+                self._copy_and_commit_key(key)
+            return
+        pool = BoundedTaskPool(concurrency, name='bypass')
+        try:
+            for key in keys_to_copy:
+                pool.submit(self._copy_and_commit_key, key)
+            pool.wait()
+        finally:
+            pool.close()
+
+    @property
+    def source_bucket(self):
+        bucket = getattr(self._thread_data, 'source_bucket', None)
+        if bucket is None:
+            bucket = self._thread_data.source_bucket = get_bucket(
+                self.read_option('reader', 'bucket'),
+                self.read_option('reader', 'aws_access_key_id'),
+                self.read_option('reader', 'aws_secret_access_key'))
+        return bucket
+
+    def _copy_and_commit_key(self, key):
+        self._copy_key(key)
+        self.bypass_state.commit_copied_key(key)
+        logging.log(logging.INFO, 'Copied key {}'.format(key))
 
     def _update_count_metadata(self, key, total):
         items_count = self.get_metadata('items_count')
         items_count += total
         self.set_metadata('items_count', items_count)
 
-    def _copy_key(self, source_bucket, key_name):
-        key = source_bucket.get_key(key_name)
+    def _copy_key(self, key_name):
+        key = self.source_bucket.get_key(key_name)
         if key.get_metadata('total'):
             total = int(key.get_metadata('total'))
-            self.increment_items(total)
+            with self.lock:
+                self.increment_items(total)
+                self._update_count_metadata(key, total)
             self.bypass_state.increment_items(total)
-            self._update_count_metadata(key, total)
         else:
             self.valid_total_count = False
         self._copy_s3_key(key)
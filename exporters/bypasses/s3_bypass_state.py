@@ -1,39 +1,65 @@
+from threading import Lock
+
 from exporters.module_loader import ModuleLoader
+from exporters.persistence.journal import JournaledState
 from exporters.readers.s3_reader import S3BucketKeysFetcher
 
 
 class S3BypassState(object):
+    """
+    Keeps track of the keys copied by S3 bypasses. It can be updated from
+    several threads at the same time.
+
+    Copied keys are appended to the persistence journal, and the list of
+    pending keys is only committed when the journal is compacted.
+    """
 
     def __init__(self, config, metadata, aws_key, aws_secret):
         self.config = config
+        self.lock = Lock()
         module_loader = ModuleLoader()
         self.state = module_loader.load_persistence(config.persistence_options, metadata)
-        self.state_position = self.state.get_last_position()
+        self.journal = JournaledState(self.state)
+        self.state_position, entries = self.journal.load()
+        self.done = []
         if not self.state_position:
-            self.pending = S3BucketKeysFetcher(
+            self.keys = S3BucketKeysFetcher(
                 self.config.reader_options['options'], aws_key, aws_secret).pending_keys()
-            self.done = []
             self.skipped = []
             self.stats = {'total_count': 0}
-            self.state.commit_position(self._get_state())
         else:
-            self.pending = self.state_position['pending']
-            self.done = []
+            self.keys = self.state_position['pending']
             self.skipped = self.state_position['done']
-            self.keys = self.pending
             self.stats = self.state_position.get('stats', {'total_count': 0})
+        self._pending = set(self.keys)
+        self._replay(entries)
+        if not self.state_position:
+            self.journal.compact(self._get_state())
+
+    def _replay(self, entries):
+        for entry in entries:
+            if entry['key'] in self._pending:
+                self._pending.remove(entry['key'])
+                self.skipped.append(entry['key'])
+            self.stats = entry['stats']
+
+    @property
+    def pending(self):
+        return [key for key in self.keys if key in self._pending]
 
     def _get_state(self):
         return dict(pending=self.pending, done=self.done, skipped=self.skipped,
                     stats=self.stats)
 
     def commit_copied_key(self, key):
-        self.pending.remove(key)
-        self.done.append(key)
-        self.state.commit_position(self._get_state())
+        with self.lock:
+            self._pending.discard(key)
+            self.done.append(key)
+            self.journal.append(dict(key=key, stats=dict(self.stats)), self._get_state)
 
     def increment_items(self, items_number):
-        self.stats['total_count'] += items_number
+        with self.lock:
+            self.stats['total_count'] += items_number
 
     def pending_keys(self):
         return self.pending
@@ -5,8 +5,9 @@ from exporters.bypasses.base_s3_bypass import BaseS3Bypass
 from exporters.default_retries import retry_long
 from exporters.progress_callback import BotoUploadProgress, BotoDownloadProgress
 from exporters.utils import get_boto_connection
-from exporters.utils import TmpFile, split_file, calculate_multipart_etag, CHUNK_SIZE
-from exporters.writers.s3_writer import should_use_multipart_upload, multipart_upload
+from exporters.utils import TmpFile, calculate_multipart_etag
+from exporters.writers.s3_writer import should_use_multipart_upload, multipart_upload, \
+    upload_file_parts, bind_multipart_upload
 
 
 def _add_permissions(user_id, key):
@@ -60,7 +61,8 @@ class S3Bypass(BaseS3Bypass):
 
     This bypass tries to directly copy the S3 keys between the read and write buckets. If
     is is not possible due to permission issues, it will download the key from the read bucket
-    and directly upload it to the write bucket.
+    and directly upload it to the write bucket. Big keys are uploaded in parts, using the
+    multipart_part_size and multipart_concurrency options of the writer.
     """
 
     def __init__(self, config, metadata):
@@ -83,14 +85,8 @@ class S3Bypass(BaseS3Bypass):
 
     def execute(self):
         writer_options = self.config.writer_options['options']
-        conn = get_boto_connection(
-            self.read_option('writer', 'aws_access_key_id'),
-            self.read_option('writer', 'aws_secret_access_key'),
-            self.read_option('writer', 'aws_region'),
-            self.read_option('writer', 'bucket'),
-            self.read_option('writer', 'host')
-        )
-        self.dest_bucket = conn.get_bucket(self.read_option('writer', 'bucket'), validate=False)
+        self.multipart_part_size = self.read_option('writer', 'multipart_part_size')
+        self.multipart_concurrency = self.read_option('writer', 'multipart_concurrency')
         self.dest_filebase = self._get_filebase(writer_options)
         super(S3Bypass, self).execute()
         if writer_options.get('save_pointer'):
@@ -98,6 +94,22 @@ class S3Bypass(BaseS3Bypass):
                 self.dest_bucket, writer_options.get(
                     'save_pointer'), writer_options.get('filebase'))
 
+    @property
+    def dest_bucket(self):
+        # Like the source bucket, every thread uses its own connection
+        bucket = getattr(self._thread_data, 'dest_bucket', None)
+        if bucket is None:
+            conn = get_boto_connection(
+                self.read_option('writer', 'aws_access_key_id'),
+                self.read_option('writer', 'aws_secret_access_key'),
+                self.read_option('writer', 'aws_region'),
+                self.read_option('writer', 'bucket'),
+                self.read_option('writer', 'host')
+            )
+            bucket = self._thread_data.dest_bucket = conn.get_bucket(
+                self.read_option('writer', 'bucket'), validate=False)
+        return bucket
+
     @retry_long
     def _write_s3_pointer(self, dest_bucket, save_pointer, filebase):
         with closing(dest_bucket.new_key(save_pointer)) as key:
@@ -169,16 +181,25 @@ class S3Bypass(BaseS3Bypass):
 
     @retry_long
     def _upload_chunk(self, mp, chunk):
+        # A failed attempt may have read part of the chunk already
+        chunk.bytes.seek(0)
+        mp = bind_multipart_upload(mp, self.dest_bucket)
         mp.upload_part_from_file(chunk.bytes, part_num=chunk.number)
 
+    def _upload_part(self, mp, chunk):
+        try:
+            self._upload_chunk(mp, chunk)
+        finally:
+            chunk.bytes.close()
+        self.logger.info('Uploaded chunk number {}'.format(chunk.number))
+
     def _upload_large_file(self, bucket, dump_path, key_name):
         from boto.exception import S3ResponseError
         self.logger.info('Using multipart S3 uploader')
         with multipart_upload(bucket, key_name) as mp:
-            for chunk in split_file(dump_path):
-                self._upload_chunk(mp, chunk)
-                self.logger.info(
-                    'Uploaded chunk number {}'.format(chunk.number))
+            upload_file_parts(mp, dump_path, self._upload_part,
+                              part_size=self.multipart_part_size,
+                              concurrency=self.multipart_concurrency)
         try:
             with closing(bucket.get_key(key_name)) as key:
                 self._ensure_proper_key_permissions(key)
@@ -191,7 +212,7 @@ class S3Bypass(BaseS3Bypass):
         from boto.exception import S3ResponseError
         try:
             dest_key = dest_bucket.get_key(dest_key_name)
-            md5 = calculate_multipart_etag(path, CHUNK_SIZE)
+            md5 = calculate_multipart_etag(path, self.multipart_part_size)
             self._warn_if_etags_differ(key, dest_key, source_md5=md5)
         except S3ResponseError:
             self.logger.warning(
@@ -202,7 +223,7 @@ class S3Bypass(BaseS3Bypass):
         with TmpFile() as tmp_filename:
             download_progress = BotoDownloadProgress(self.logger)
             key.get_contents_to_filename(tmp_filename, cb=download_progress)
-            if should_use_multipart_upload(tmp_filename, dest_bucket):
+            if should_use_multipart_upload(tmp_filename, dest_bucket, self.multipart_part_size):
                 self._upload_large_file(dest_bucket, tmp_filename, dest_key_name)
                 self._check_multipart_copy_integrity(key, dest_bucket, dest_key_name, tmp_filename)
             else:
@@ -218,10 +239,10 @@ class S3Bypass(BaseS3Bypass):
             'key_name': dest_key_name,
             'number_of_records': int(total),
         }
-        keys_written = self.get_metadata('keys_written')
-        keys_written.append(key_info)
-
-        self.set_metadata('keys_written', keys_written)
+        with self.lock:
+            keys_written = self.get_metadata('keys_written')
+            keys_written.append(key_info)
+            self.set_metadata('keys_written', keys_written)
 
     @retry_long
     def _copy_s3_key(self, key):
@@ -1,36 +1,68 @@
 import logging
 from collections import namedtuple
 from contextlib import closing
+from threading import Lock
 
 from exporters.bypasses.base import BaseBypass
 from exporters.module_loader import ModuleLoader
+from exporters.persistence.journal import JournaledState
 from exporters.iterio import cohere_stream
+from exporters.task_pool import BoundedTaskPool, ByteBudget
 
 Stream = namedtuple('Stream', 'filename size meta')
 
 
 class StreamBypassState(object):
+    """
+    Keeps track of the streams copied by stream bypasses. Copied streams are
+    appended to the persistence journal, and the whole state is only
+    committed when the journal is compacted. Streams can be committed in any
+    order and from several threads at the same time.
+    """
+
     def __init__(self, config, metadata):
+        self.lock = Lock()
         module_loader = ModuleLoader()
         self.state = module_loader.load_persistence(config.persistence_options, metadata)
-        self.state_position = self.state.get_last_position()
+        self.journal = JournaledState(self.state)
+        self.state_position, entries = self.journal.load()
+        self.done = []
         if not self.state_position:
-            self.done = []
             self.skipped = []
             self.stats = {'bytes_copied': 0}
-            self.state.commit_position(self._get_state())
         else:
-            self.done = []
             self.skipped = self.state_position['done']
             self.stats = self.state_position.get('stats', {'bytes_copied': 0})
+        self._skipped_ids = {self._stream_id(stream) for stream in self.skipped}
+        for entry in entries:
+            self._add_skipped(entry['stream'])
+            self.stats = entry['stats']
+        if not self.state_position:
+            self.journal.compact(self._get_state())
+
+    @staticmethod
+    def _stream_id(stream):
+        # Streams loaded from JSON based persistence backends are lists
+        filename, size = stream[:2]
+        return filename, size
+
+    def _add_skipped(self, stream):
+        stream_id = self._stream_id(stream)
+        if stream_id not in self._skipped_ids:
+            self._skipped_ids.add(stream_id)
+            self.skipped.append(stream)
+
+    def is_skipped(self, stream):
+        return self._stream_id(stream) in self._skipped_ids
 
     def _get_state(self):
         return dict(done=self.done, skipped=self.skipped, stats=self.stats)
 
     def commit_copied(self, stream):
-        self.increment_bytes(stream.size)
-        self.done.append(stream)
-        self.state.commit_position(self._get_state())
+        with self.lock:
+            self.increment_bytes(stream.size)
+            self.done.append(stream)
+            self.journal.append(dict(stream=stream, stats=dict(self.stats)), self._get_state)
 
     def increment_bytes(self, cnt):
         self.stats['bytes_copied'] += cnt
@@ -54,6 +86,14 @@ class StreamBypass(BaseBypass):
         - writer has no option items_limit set in configuration.
         - writer has default items_per_buffer_write and size_per_buffer_write per default.
         - writer has default write_buffer.
+
+    With the stream_bypass_concurrency exporter option, that many streams are
+    copied at the same time. The sizes of the streams being copied are kept
+    under the stream_bypass_memory_budget exporter option (in bytes, 64MB by
+    default). Streams are only copied concurrently by writers whose
+    write_stream() can be called from several threads at the same time
+    (supports_concurrent_streams), otherwise they are copied one at a time.
+    The reader open_stream() is called from the copying threads too.
     """
 
     def __init__(self, config, metadata):
@@ -115,18 +155,42 @@ class StreamBypass(BaseBypass):
         reader = module_loader.load_reader(self.config.reader_options, self.metadata)
         writer = module_loader.load_writer(self.config.writer_options, self.metadata)
         with closing(reader), closing(writer):
-            for stream in reader.get_read_streams():
-                if stream not in self.bypass_state.skipped:
-                    file_obj = cohere_stream(reader.open_stream(stream))
-                    logging.log(logging.INFO, 'Starting to copy file {}'.format(stream.filename))
-                    try:
-                        writer.write_stream(stream, file_obj)
-                    finally:
-                        file_obj.close()
-                    logging.log(logging.INFO, 'Finished copying file {}'.format(stream.filename))
-                    self.bypass_state.commit_copied(stream)
-                else:
-                    logging.log(logging.INFO, 'Skip file {}'.format(stream.filename))
+            concurrency = self.config.stream_bypass_concurrency
+            if concurrency > 1 and not writer.supports_concurrent_streams:
+                self.logger.warning(
+                    '{} does not support writing streams concurrently, they will be '
+                    'copied one at a time'.format(writer.__class__.__name__))
+                concurrency = 1
+            if concurrency <= 1:
+                for stream in reader.get_read_streams():
+                    self._copy_stream(reader, writer, stream)
+                return
+            budget = ByteBudget(self.config.stream_bypass_memory_budget)
+            pool = BoundedTaskPool(concurrency, name='stream-bypass')
+            try:
+                for stream in reader.get_read_streams():
+                    pool.submit(self._copy_stream, reader, writer, stream, budget)
+                pool.wait()
+            finally:
+                pool.close()
+
+    def _copy_stream(self, reader, writer, stream, budget=None):
+        if self.bypass_state.is_skipped(stream):
+            logging.log(logging.INFO, 'Skip file {}'.format(stream.filename))
+            return
+        reserved = budget.acquire(stream.size) if budget else 0
+        try:
+            file_obj = cohere_stream(reader.open_stream(stream))
+            logging.log(logging.INFO, 'Starting to copy file {}'.format(stream.filename))
+            try:
+                writer.write_stream(stream, file_obj)
+            finally:
+                file_obj.close()
+        finally:
+            if budget:
+                budget.release(reserved)
+        logging.log(logging.INFO, 'Finished copying file {}'.format(stream.filename))
+        self.bypass_state.commit_copied(stream)
 
     def close(self):
         if self.bypass_state:
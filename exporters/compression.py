@@ -8,7 +8,8 @@ class StreamZipFile(object):
 
     def __init__(self, path):
         self.path = path
-        os.mknod(self.path)
+        if not os.path.exists(self.path):
+            os.mknod(self.path)
         self.tmp_filename = path[:-4]
         self.tmp_file = open(self.tmp_filename, 'a')
 
@@ -28,12 +29,29 @@ def get_compress_file(compression_format):
     return FILE_COMPRESSION[compression_format]
 
 
+def get_compress_stream(compression_format):
+    """
+    Returns a function that receives a file object open for writing and its
+    path, and returns a file object that compresses the data written to it
+    into the given one. None is returned for formats that can only be
+    written to a path (like zip).
+    """
+    if compression_format not in FILE_COMPRESSION:
+        raise UnsupportedCompressionFormat(compression_format)
+    return STREAM_COMPRESSION.get(compression_format)
+
+
 FILE_COMPRESSION = {
     'gz': lambda path: gzip.open(path, 'a'),
     'zip': StreamZipFile,
     'none': lambda path: open(path, 'a'),
 }
 
+STREAM_COMPRESSION = {
+    'gz': lambda fileobj, path: gzip.GzipFile(filename=path, mode='wb', fileobj=fileobj),
+    'none': lambda fileobj, path: fileobj,
+}
+
 
 try:
     from bz2file import BZ2File
@@ -42,3 +60,4 @@ except ImportError:
     logging.info('Install bz2file to enable BZ2 compression.')
 else:
     FILE_COMPRESSION['bz2'] = lambda path: BZ2File(path, 'a')
+    STREAM_COMPRESSION['bz2'] = lambda fileobj, path: BZ2File(fileobj, 'w')
@@ -1,3 +1,4 @@
+from collections import deque
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
 import sys
 import zlib
@@ -6,7 +7,44 @@ import six
 __all__ = ['BaseDecompressor', 'ZLibDecompressor', 'NoDecompressor']
 
 
+class RestartPoints(object):
+    """
+    Keeps the offsets of a stream where decompression can be started again,
+    so that a partly read stream can be reopened close to where it was left
+    instead of from the beginning.
+
+    Offsets are (compressed offset, decompressed offset) pairs. Compressed
+    offsets are absolute, decompressed offsets are counted from where the
+    stream was opened, at compressed_start.
+    """
+
+    def __init__(self, compressed_start=0):
+        self.compressed_start = compressed_start
+        self.points = deque([(compressed_start, 0)])
+        self.every_offset = False
+
+    def add(self, compressed_offset, decompressed_offset):
+        self.points.append((self.compressed_start + compressed_offset, decompressed_offset))
+
+    def resume_point(self, decompressed_offset):
+        """
+        Returns a (compressed offset, decompressed bytes to skip) tuple telling
+        how to reopen the stream to continue reading at decompressed_offset.
+        Offsets must be asked in increasing order.
+        """
+        if self.every_offset:
+            return self.compressed_start + decompressed_offset, 0
+        points = self.points
+        while len(points) > 1 and points[1][1] <= decompressed_offset:
+            points.popleft()
+        compressed_offset, start = points[0]
+        return compressed_offset, decompressed_offset - start
+
+
 class BaseDecompressor(BasePipelineItem):
+    # Decompressors accepting a restart_points argument in decompress()
+    supports_restart_points = False
+
     def decompress(self):
         raise NotImplementedError()
 
@@ -19,16 +57,26 @@ def create_decompressor():
 
 
 class ZLibDecompressor(BaseDecompressor):
-    def decompress(self, stream):
+    """
+    Decompresses zlib and gzip streams. Every member of a multi-member gzip
+    stream (like concatenated gzip files) is a restart point.
+    """
+    supports_restart_points = True
+
+    def decompress(self, stream, restart_points=None):
         try:
             dec = create_decompressor()
+            decompressed = 0
             for chunk in stream:
                 rv = dec.decompress(chunk)
                 if rv:
+                    decompressed += len(rv)
                     yield rv
                 if dec.unused_data:
                     stream.unshift(dec.unused_data)
                     dec = create_decompressor()
+                    if restart_points is not None:
+                        restart_points.add(stream.tell(), decompressed)
         except zlib.error as e:
             msg = str(e)
             if msg.startswith('Error -3 '):
@@ -37,5 +85,9 @@ class ZLibDecompressor(BaseDecompressor):
 
 
 class NoDecompressor(BaseDecompressor):
-    def decompress(self, stream):
+    supports_restart_points = True
+
+    def decompress(self, stream, restart_points=None):
+        if restart_points is not None:
+            restart_points.every_offset = True
         return stream  # Input already uncompressed
@@ -24,3 +24,4 @@ DEFAULT_DECOMPRESSOR_CONFIG = {
 }
 DEFAULT_LOGGER_LEVEL = 'INFO'
 DEFAULT_LOGGER_NAME = 'export-pipeline'
+DEFAULT_STREAM_BYPASS_MEMORY_BUDGET = 64 * 1024 * 1024
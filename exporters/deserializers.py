@@ -1,20 +1,71 @@
+from exporters.json_codecs import get_json_codec
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
-from exporters.records.base_record import BaseRecord
-import json
+from exporters.records.base_record import BaseRecord, SourcedRecord
+from exporters.records.lazy_record import LazyRecord
 import csv
+import six
 
 __all__ = ['BaseDeserializer', 'JsonLinesDeserializer', 'CSVDeserializer']
 
 
 class BaseDeserializer(BasePipelineItem):
+    # Deserializers that, when they yield an item, have consumed from the
+    # stream exactly the bytes of the items yielded so far, so that the
+    # stream position can be used to resume reading after that item
+    supports_byte_offsets = False
+
+    # Function telling if a raw line may contain an item that passes the
+    # filters (see BaseFilter.raw_line_filter). Deserializers supporting it
+    # yield None instead of the items of rejected lines, so they are still
+    # counted when resuming a stream.
+    line_filter = None
+
+    # If True, deserializers supporting it yield SourcedRecord objects
+    # keeping the raw data of every item
+    keep_source = False
+
     def deserialize(self, stream):
         raise NotImplementedError()
 
 
 class JsonLinesDeserializer(BaseDeserializer):
+    """
+    Deserializes items from a stream with one JSON object per line.
+
+        - json_codec(str)
+            JSON library used to decode items: json (default), orjson, rapidjson, ujson
+            or auto, to use the fastest one installed.
+
+        - lazy_records(bool)
+            If True, items are returned as LazyRecord objects, which only decode the fields
+            that are read until the item is transformed or written. Useful when filters drop
+            most of the items of wide records.
+    """
+    supported_options = {
+        'json_codec': {'type': six.string_types, 'default': 'json'},
+        'lazy_records': {'type': bool, 'default': False},
+    }
+    supports_byte_offsets = True
+
+    def __init__(self, *args, **kwargs):
+        super(JsonLinesDeserializer, self).__init__(*args, **kwargs)
+        self.codec = get_json_codec(self.read_option('json_codec'))
+        self.lazy_records = self.read_option('lazy_records')
+
     def deserialize(self, stream):
+        loads = self.codec.loads
+        line_filter = self.line_filter
+        keep_source = self.keep_source
+        lazy_records = self.lazy_records
         for line in stream.iterlines():
-            yield BaseRecord(json.loads(line))
+            if line_filter is not None and not line_filter(line):
+                yield None
+            elif lazy_records:
+                yield LazyRecord(line, loads, keep_source)
+            elif keep_source:
+                yield SourcedRecord(loads(line), line.rstrip('\r\n'))
+            else:
+                yield BaseRecord(loads(line))
 
 
 class CSVDeserializer(BaseDeserializer):
@@ -35,3 +35,7 @@ class ConfigCheckError(ConfigurationError):
                     '  {}: {}'.format(field, error) for field, error in errors.iteritems())
                 error_messages.append('{}:\n{}'.format(section, section_errors))
         return '{}\n{}'.format(self.message, '\n'.join(error_messages))
+
+
+class IncompleteDownloadError(IOError):
+    "Downloaded data doesn't have the expected size."
@@ -1,10 +1,14 @@
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
+from exporters.records.record_batch import is_record_batch
 
 
 class BaseExportFormatter(BasePipelineItem):
 
     file_extension = None
     item_separator = '\n'
+    # Formatters writing the source of records (see SourcedRecord) as it is,
+    # so readers should keep it when items are not changed
+    passthrough_sources = False
 
     def __init__(self, options, metadata=None):
         super(BaseExportFormatter, self).__init__(options, metadata)
@@ -12,6 +16,22 @@ class BaseExportFormatter(BasePipelineItem):
     def format(self, item):
         raise NotImplementedError
 
+    def format_columns(self, batch):
+        """
+        Receives a RecordBatch and returns the list of its formatted records.
+        Formatters able to work on whole columns should override it.
+        """
+        return [self.format(item) for item in batch]
+
+    def format_batch(self, items):
+        """
+        Receives a list of items (or a RecordBatch) and returns them formatted
+        and joined with item_separator, to be written at once.
+        """
+        if is_record_batch(items):
+            return self.item_separator.join(self.format_columns(items))
+        return self.item_separator.join([self.format(item) for item in items])
+
     def format_header(self):
         return ''
 
@@ -4,6 +4,7 @@ import six
 from exporters.utils import str_list
 from exporters.exceptions import ConfigurationError
 from exporters.export_formatter.base_export_formatter import BaseExportFormatter
+from exporters.records.record_batch import MISSING, is_record_batch
 
 
 class CSVExportFormatter(BaseExportFormatter):
@@ -54,10 +55,11 @@ class CSVExportFormatter(BaseExportFormatter):
             return key, value.encode('utf-8')
         return key, value
 
-    def _create_csv_writer(self, outputf):
+    def _create_csv_writer(self, outputf, lineterminator='\r\n'):
         return csv.DictWriter(outputf, fieldnames=self.fields,
                               quoting=csv.QUOTE_NONNUMERIC,
                               delimiter=self.delimiter,
+                              lineterminator=lineterminator,
                               extrasaction='ignore')
 
     def _item_to_csv(self, item):
@@ -68,6 +70,40 @@ class CSVExportFormatter(BaseExportFormatter):
         writer.writerow(item)
         return output.getvalue().rstrip()
 
+    def _encode_column(self, values):
+        from boltons.iterutils import remap
+        encoded = []
+        for value in values:
+            if value is MISSING:
+                value = ''
+            elif isinstance(value, six.text_type):
+                value = value.encode('utf-8')
+            elif isinstance(value, (dict, list, tuple)):
+                value = remap(value, visit=self._encode_string)
+            encoded.append(value)
+        return encoded
+
+    def format_columns(self, batch):
+        output = io.BytesIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, delimiter=self.delimiter)
+        rows = zip(*[self._encode_column(batch.column(field)) for field in self.fields])
+        offsets = [0]
+        for row in rows:
+            writer.writerow(row)
+            offsets.append(output.tell())
+        content = output.getvalue()
+        return [content[start:end].rstrip() for start, end in zip(offsets, offsets[1:])]
+
+    def format_batch(self, items):
+        if is_record_batch(items):
+            return super(CSVExportFormatter, self).format_batch(items)
+        from boltons.iterutils import remap
+        output = io.BytesIO()
+        writer = self._create_csv_writer(output, lineterminator=self.item_separator)
+        for item in items:
+            writer.writerow(remap(item, visit=self._encode_string))
+        return output.getvalue()[:-len(self.item_separator)]
+
     def format_header(self):
         if self.show_titles:
             output = io.BytesIO()
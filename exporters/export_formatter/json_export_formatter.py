@@ -1,12 +1,7 @@
-import json
-import datetime
+import six
 from exporters.export_formatter.base_export_formatter import BaseExportFormatter
-
-
-def default(o):
-    if isinstance(o, datetime.datetime):
-        return o.isoformat()
-    return json.JSONEncoder.default(o)
+from exporters.json_codecs import default, get_json_codec  # NOQA
+from exporters.records.record_batch import is_record_batch
 
 
 class JsonExportFormatter(BaseExportFormatter):
@@ -17,11 +12,22 @@ class JsonExportFormatter(BaseExportFormatter):
         - pretty_print(bool)
             If set to True, items will be exported with an ident of 2 and keys sorted, they
             will exported with a text line otherwise.
+
+        - json_codec(str)
+            JSON library used to encode items: json (default), orjson, rapidjson, ujson
+            or auto, to use the fastest one installed.
+
+        - raw_passthrough(bool)
+            If set to True, items read from JSON lines by stream readers are written as
+            the original lines when no transform is configured, instead of encoding them
+            again. Ignored if pretty_print is set.
     """
 
     supported_options = {
         'pretty_print': {'type': bool, 'default': False},
-        'jsonlines': {'type': bool, 'default': True}
+        'jsonlines': {'type': bool, 'default': True},
+        'json_codec': {'type': six.string_types, 'default': 'json'},
+        'raw_passthrough': {'type': bool, 'default': False},
     }
 
     file_extension = 'jl'
@@ -33,10 +39,37 @@ class JsonExportFormatter(BaseExportFormatter):
         if not self.jsonlines:
             self.file_extension = 'json'
             self.item_separator = ',\n'
+        self.codec = get_json_codec(self.read_option('json_codec'),
+                                    pretty_print=self.pretty_print)
+        self.passthrough_sources = self.read_option('raw_passthrough') and not self.pretty_print
+        self._dumps = self._passthrough_dumps() if self.passthrough_sources else self.codec.dumps
+
+    def _passthrough_dumps(self):
+        dumps = self.codec.dumps
+        # Sources are bytes, they are decoded for codecs returning text
+        decode = isinstance(dumps({}), six.text_type)
+
+        def passthrough_dumps(item):
+            source = getattr(item, 'source', None)
+            if source is None:
+                return dumps(item)
+            if decode:
+                return source.decode('utf-8')
+            return source
+        return passthrough_dumps
 
     def format(self, item):
-        options = dict(indent=2, sort_keys=True) if self.pretty_print else dict()
-        return json.dumps(item, default=default, **options)
+        return self._dumps(item)
+
+    def format_columns(self, batch):
+        dumps = self.codec.dumps
+        return [dumps(item) for item in batch]
+
+    def format_batch(self, items):
+        if is_record_batch(items):
+            items = items.iter_records()
+        dumps = self._dumps
+        return self.item_separator.join([dumps(item) for item in items])
 
     def format_header(self):
         if self.jsonlines:
@@ -43,14 +43,23 @@ class XMLExportFormatter(BaseExportFormatter):
     def format_footer(self):
         return '\n</{}>'.format(self.root_name)
 
-    def format(self, item):
-        import dicttoxml
-        dicttoxml.LOG.setLevel(logging.WARNING)
-        fields_len = len(self.fields_order)
-        ordered_item = collections.OrderedDict(
-            sorted(item.items(),
-                   key=lambda kv: self.fields_order.get(kv[0], fields_len))
-        )
+    def _field_position(self, kv):
+        return self.fields_order.get(kv[0], len(self.fields_order))
+
+    def _item_to_xml(self, dicttoxml, item):
+        ordered_item = collections.OrderedDict(sorted(item.items(), key=self._field_position))
         return '<{0}>{1}</{0}>'.format(
             self.item_name, dicttoxml.dicttoxml(ordered_item, root=False,
                                                 attr_type=self.attr_type))
+
+    def _load_dicttoxml(self):
+        import dicttoxml
+        dicttoxml.LOG.setLevel(logging.WARNING)
+        return dicttoxml
+
+    def format(self, item):
+        return self._item_to_xml(self._load_dicttoxml(), item)
+
+    def format_batch(self, items):
+        dicttoxml = self._load_dicttoxml()
+        return self.item_separator.join([self._item_to_xml(dicttoxml, item) for item in items])
@@ -1,8 +1,14 @@
 import datetime
+import multiprocessing
 import traceback
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from contextlib import closing
+from copy import deepcopy
+from functools import partial
 from exporters.default_retries import disable_retries
+from exporters.exceptions import ConfigurationError
+from exporters.export_managers import multiprocess_pipeline
+from exporters.export_managers.threaded_pipeline import StagedPipeline
 from exporters.exporter_config import ExporterConfig
 from exporters.logger.base_logger import ExportManagerLogger
 from exporters.meta import ExportMeta
@@ -11,16 +17,19 @@ from exporters.notifications.notifiers_list import NotifiersList
 from exporters.notifications.receiver_groups import CLIENTS, TEAM
 from exporters.writers.base_writer import ItemsLimitReached
 from exporters.readers.base_stream_reader import is_stream_reader
-from six.moves.queue import Queue
-from threading import Thread
-import time
+from exporters.records.lazy_record import materialize_records
+from exporters.records.record_batch import materialize_batch
+from exporters.transform.no_transform import NoTransform
 
 
 class BaseExporter(object):
     def __init__(self, configuration):
         self.config = ExporterConfig(configuration)
-        self.threaded = self.config.exporter_options.get('threaded', False)
+        self.mode = self.config.mode
+        self.threaded = self.mode == 'threaded'
         self.queue_size = self.config.exporter_options.get('thread_queue_size', 100)
+        self.processes = (self.config.exporter_options.get('processes') or
+                          multiprocessing.cpu_count())
         self.logger = ExportManagerLogger(self.config.log_options)
         self.module_loader = ModuleLoader()
         metadata = ExportMeta(configuration)
@@ -38,12 +47,19 @@ class BaseExporter(object):
             self.config.filter_before_options, metadata)
         self.filter_after = self.module_loader.load_filter(
             self.config.filter_after_options, metadata)
+        self._check_filters_state()
+        self.prefilter_lines = self.config.prefilter_lines and is_stream_reader(self.reader)
+        if self.prefilter_lines:
+            self.reader.deserializer.line_filter = self.filter_before.raw_line_filter()
         self.transform = self.module_loader.load_transform(
             self.config.transform_options, metadata)
         self.export_formatter = self.module_loader.load_formatter(
             self.config.formatter_options, metadata)
         self.writer = self.module_loader.load_writer(
             self.config.writer_options, metadata, export_formatter=self.export_formatter)
+        if (is_stream_reader(self.reader) and isinstance(self.transform, NoTransform) and
+                self.export_formatter.passthrough_sources):
+            self.reader.deserializer.keep_source = True
         self.persistence = self.module_loader.load_persistence(
             self.config.persistence_options, metadata)
         self.grouper = self.module_loader.load_grouper(
@@ -60,43 +76,89 @@ class BaseExporter(object):
         times = OrderedDict([('started', datetime.datetime.now())])
         self.logger.debug('Getting new batch')
         if self.config.exporter_options.get('forced_reads'):
-            next_batch = list(self.reader.get_next_batch())
+            next_batch = materialize_batch(self.reader.get_next_batch())
         else:
             next_batch = self.reader.get_next_batch()
         times.update(read=datetime.datetime.now())
         next_batch = self.filter_before.filter_batch(next_batch)
         times.update(filtered=datetime.datetime.now())
-        next_batch = self.transform.transform_batch(next_batch)
+        next_batch = self._transform_batch(next_batch)
         times.update(transformed=datetime.datetime.now())
         next_batch = self.filter_after.filter_batch(next_batch)
         times.update(filtered_after=datetime.datetime.now())
         next_batch = self.grouper.group_batch(next_batch)
         times.update(grouped=datetime.datetime.now())
         try:
-            self.writer.write_batch(batch=next_batch)
+            self.writer.write_batch(batch=materialize_records(next_batch))
             times.update(written=datetime.datetime.now())
-            last_position = self._get_last_position()
-            self.persistence.commit_position(last_position)
+            self.filter_before.count_rejected_lines(self._pop_rejected_lines())
+            self.persistence.checkpoint(self._get_last_position)
             times.update(persisted=datetime.datetime.now())
         except ItemsLimitReached:
             # we have written some amount of records up to the limit
             times.update(written=datetime.datetime.now())
+            self.filter_before.count_rejected_lines(self._pop_rejected_lines())
             self._iteration_stats_report(times)
             raise
         else:
             self._iteration_stats_report(times)
 
-    def _get_last_position(self):
-        last_position = self.reader.get_last_position()
+    def _pop_rejected_lines(self):
+        # Lines dropped by the reader with the prefilter since the last call
+        if not self.prefilter_lines:
+            return 0
+        rejected_lines, self.reader.rejected_lines = self.reader.rejected_lines, 0
+        return rejected_lines
+
+    def _transform_batch(self, batch):
+        # Transforms may use lazy records as plain dicts, so they are decoded first
+        if not isinstance(self.transform, NoTransform):
+            batch = materialize_records(batch)
+        return self.transform.transform_batch(batch)
+
+    def _get_last_position(self, reader_position=None):
+        # The position is only committed once the files with its items are uploaded
+        self.writer.wait_for_uploads()
+        last_position = reader_position
+        if last_position is None:
+            last_position = self.reader.get_last_position()
         last_position['writer_metadata'] = self.writer.get_all_metadata()
+        if self.mode == 'sequential':
+            # In the other modes filters run ahead of the written batches
+            filters_state = self._get_filters_state()
+            if filters_state:
+                last_position['filters_state'] = filters_state
         return last_position
 
+    def _check_filters_state(self):
+        # Filters state is only checkpointed in sequential mode (see _get_last_position)
+        if self.mode == 'sequential':
+            return
+        for name in ('filter_before', 'filter_after'):
+            item_filter = getattr(self, name)
+            if item_filter.has_persistent_state():
+                raise ConfigurationError(
+                    '{} keeps a state that is only saved in the persistence checkpoints '
+                    'in sequential mode, it can not be used in {} mode'.format(
+                        item_filter.__class__.__name__, self.mode))
+
+    def _get_filters_state(self):
+        filters_state = {}
+        for name in ('filter_before', 'filter_after'):
+            state = getattr(self, name).get_state()
+            if state is not None:
+                filters_state[name] = state
+        return filters_state
+
     def _init_export_job(self):
         self.notifiers.notify_start_dump(receivers=[CLIENTS, TEAM])
         last_position = self.persistence.get_last_position()
         if last_position is not None:
             self.writer.update_metadata(last_position.get('writer_metadata'))
             self.metadata.accurate_items_count = last_position.get('accurate_items_count', False)
+            filters_state = last_position.get('filters_state', {})
+            self.filter_before.set_state(filters_state.get('filter_before'))
+            self.filter_after.set_state(filters_state.get('filter_after'))
         self.reader.set_last_position(last_position)
 
     def _clean_export_job(self):
@@ -105,7 +167,11 @@ class BaseExporter(object):
         except:
             raise
         finally:
-            self.writer.close()
+            try:
+                self.writer.close()
+            finally:
+                self.filter_before.close()
+                self.filter_after.close()
 
     def _finish_export_job(self):
         self.writer.finish_writing()
@@ -170,59 +236,135 @@ class BaseExporter(object):
                 break
         self.writer.flush()
 
-    def _reader_thread(self):
-        self.logger.info('Starting reader thread')
-        while not self.reader.is_finished():
-            self.process_queue.put(list(self.reader.get_next_batch()))
-            qsize = self.process_queue.qsize()
-            if qsize > 0.5*self.queue_size:
-                # Queues are getting full, throttle the reader so the processor/writer can keep up
-                time.sleep((qsize*10.0 / self.queue_size) - 5)
-        self.reader_finished = True
-
-    def _process_thread(self):
-        self.logger.info('Starting processing thread')
-        while not self.reader_finished or not self.process_queue.empty():
-            next_batch = self.process_queue.get()
-            next_batch = self.filter_before.filter_batch(next_batch)
-            next_batch = self.transform.transform_batch(next_batch)
-            next_batch = self.filter_after.filter_batch(next_batch)
-            next_batch = self.grouper.group_batch(next_batch)
-            self.writer_queue.put(next_batch)
-        self.process_finished = True
-
-    def _writer_thread(self):
-        self.logger.info('Starting writer thread')
-        while not self.process_finished or not self.writer_queue.empty():
-            batch = self.writer_queue.get()
+    def _process_in_main(self, module_names, batch):
+        for name in module_names:
+            batch = multiprocess_pipeline.process_with(name, getattr(self, name), batch)
+        return batch
+
+    def _write_processed_batch(self, pending_batch, after_workers):
+        times = OrderedDict([('started', datetime.datetime.now())])
+        async_result, reader_position = pending_batch
+        batch, metadata_changes = async_result.get()
+        multiprocess_pipeline.merge_metadata_changes(self.metadata.per_module, metadata_changes)
+        batch = self._process_in_main(after_workers, batch)
+        times.update(processed=datetime.datetime.now())
+        try:
             self.writer.write_batch(batch=batch)
-        self.writer.finish_writing()
+            times.update(written=datetime.datetime.now())
+            self.persistence.checkpoint(partial(self._get_last_position, reader_position))
+            times.update(persisted=datetime.datetime.now())
+        except ItemsLimitReached:
+            times.update(written=datetime.datetime.now())
+            self._iteration_stats_report(times)
+            raise
+        else:
+            self._iteration_stats_report(times)
+
+    def _run_multiprocess(self):
+        """
+        Reads and writes batches in the main process, while the processing
+        modules run in a pool of worker processes, except the filters keeping
+        state between batches (see multiprocess_pipeline). Batches are written
+        (and their reader position committed) in the same order they were read.
+        """
+        before_workers, in_workers, after_workers = \
+            multiprocess_pipeline.split_processing_modules(
+                {name: getattr(self, name) for name in multiprocess_pipeline.PROCESSING_MODULES})
+        if not in_workers:
+            self.logger.info('No processing module to run in worker processes, '
+                             'running the pipeline in the main process')
+            self._run_pipeline()
+            return
+        self.logger.info('Running {} in worker processes'.format(', '.join(in_workers)))
+        pool = multiprocessing.Pool(self.processes,
+                                    initializer=multiprocess_pipeline.init_worker,
+                                    initargs=(self.config.configuration, in_workers))
+        max_pending_batches = 2 * self.processes
+        pending = deque()
+        try:
+            while not self.reader.is_finished():
+                batch = materialize_batch(self.reader.get_next_batch())
+                reader_position = deepcopy(self.reader.get_last_position())
+                self.filter_before.count_rejected_lines(self._pop_rejected_lines())
+                batch = self._process_in_main(before_workers, batch)
+                batch = materialize_batch(materialize_records(batch))
+                async_result = pool.apply_async(multiprocess_pipeline.process_batch, (batch,))
+                pending.append((async_result, reader_position))
+                if len(pending) >= max_pending_batches:
+                    self._write_processed_batch(pending.popleft(), after_workers)
+            while pending:
+                self._write_processed_batch(pending.popleft(), after_workers)
+        except ItemsLimitReached as e:
+            self.logger.info('{!r}'.format(e))
+        finally:
+            pool.terminate()
+            pool.join()
         self.writer.flush()
 
+    def _read_batches(self):
+        while not self.reader.is_finished():
+            times = OrderedDict([('started', datetime.datetime.now())])
+            batch = materialize_batch(self.reader.get_next_batch())
+            times.update(read=datetime.datetime.now())
+            reader_position = deepcopy(self.reader.get_last_position())
+            yield {'batch': batch, 'position': reader_position, 'times': times,
+                   'rejected_lines': self._pop_rejected_lines()}
+
+    def _process_batch(self, unit):
+        self.filter_before.count_rejected_lines(unit['rejected_lines'])
+        next_batch = self.filter_before.filter_batch(unit['batch'])
+        next_batch = self._transform_batch(next_batch)
+        next_batch = self.filter_after.filter_batch(next_batch)
+        next_batch = self.grouper.group_batch(next_batch)
+        unit['batch'] = materialize_batch(materialize_records(next_batch))
+        unit['times'].update(processed=datetime.datetime.now())
+        return unit
+
+    def _write_batch(self, unit):
+        times = unit['times']
+        try:
+            self.writer.write_batch(batch=unit['batch'])
+            times.update(written=datetime.datetime.now())
+            self.persistence.checkpoint(partial(self._get_last_position, unit['position']))
+            times.update(persisted=datetime.datetime.now())
+        except ItemsLimitReached:
+            times.update(written=datetime.datetime.now())
+            self._threaded_iteration_stats_report(times)
+            raise
+        else:
+            self._threaded_iteration_stats_report(times)
+
+    def _threaded_iteration_stats_report(self, times):
+        times.update(stages=self.staged_pipeline.stats_report())
+        self._iteration_stats_report(times)
+
     def _run_threads(self):
-        self.reader_finished = False
-        self.process_finished = False
-        self.process_queue = Queue(self.queue_size)
-        self.writer_queue = Queue(self.queue_size)
-        reader_thread = Thread(target=self._reader_thread)
-        process_thread = Thread(target=self._process_thread)
-        writer_thread = Thread(target=self._writer_thread)
-        reader_thread.start()
-        process_thread.start()
-        writer_thread.start()
-        reader_thread.join()
-        process_thread.join()
-        writer_thread.join()
+        """
+        Runs reader, processing modules and writer in their own threads,
+        connected by queues of thread_queue_size batches.
+        """
+        self.staged_pipeline = StagedPipeline(
+            source=('read', self._read_batches),
+            stages=[('process', self._process_batch), ('write', self._write_batch)],
+            queue_size=self.queue_size)
+        try:
+            self.staged_pipeline.run()
+        except ItemsLimitReached as e:
+            self.logger.info('{!r}'.format(e))
+        self.writer.flush()
 
     def export(self):
         if not self.bypass():
             try:
                 self._init_export_job()
-                if self.threaded:
+                if self.mode == 'threaded':
                     self._run_threads()
+                elif self.mode == 'multiprocess':
+                    self._run_multiprocess()
                 else:
                     self._run_pipeline()
-                    self._finish_export_job()
+                self.persistence.flush_checkpoints()
+                self._finish_export_job()
                 self._final_stats_report()
                 self.persistence.close()
                 self.notifiers.notify_complete_dump(receivers=[CLIENTS, TEAM])
@@ -0,0 +1,137 @@
+"""
+Support for running the processing part of the export pipeline (filter_before,
+transform, filter_after and grouper) in a pool of worker processes.
+
+Filters keeping state between batches (see BaseFilter.keeps_state, e.g.
+DupeFilter) have to see every item in the same order they were read, so they
+run in the main process: a stateful filter_before runs before sending the
+batches to the workers, and a stateful filter_after runs, followed by the
+grouper, as batches are written. The rest of the modules run in the workers,
+skipping the ones that do nothing (NoFilter, NoTransform and NoGrouper).
+
+Every worker process builds its own copy of its modules from the export
+configuration, so they don't need to be picklable. Batches are sent to the
+workers as lists of records, and the processed records are sent back
+together with the changes the modules made to their metadata, so they can be
+merged into the main process ExportMeta.
+"""
+import numbers
+from copy import deepcopy
+
+from exporters.exporter_config import ExporterConfig
+from exporters.filters.no_filter import NoFilter
+from exporters.groupers.no_grouper import NoGrouper
+from exporters.meta import ExportMeta
+from exporters.module_loader import ModuleLoader
+from exporters.records.record_batch import materialize_batch
+from exporters.transform.no_transform import NoTransform
+
+# Modules every batch goes through before reaching the writer, in order
+PROCESSING_MODULES = ('filter_before', 'transform', 'filter_after', 'grouper')
+
+# Processing modules and metadata of the current worker process, set up by init_worker()
+_worker_modules = None
+_worker_metadata = None
+
+
+def split_processing_modules(modules):
+    """
+    Receives a dict with the processing modules of an exporter by name, and
+    returns a tuple with the names of the ones to run in the main process
+    before sending batches to the workers, in the worker processes, and in
+    the main process once the batches are back from the workers.
+    """
+    names = list(PROCESSING_MODULES)
+    before, after = [], []
+    if modules['filter_before'].keeps_state():
+        before, names = names[:1], names[1:]
+    if modules['filter_after'].keeps_state():
+        # The grouper must run after filter_after
+        names, after = names[:-2], names[-2:]
+    in_workers = [name for name in names
+                  if not isinstance(modules[name], (NoFilter, NoTransform, NoGrouper))]
+    return before, in_workers, after
+
+
+def process_with(name, module, batch):
+    """
+    Runs batch through the processing module called name.
+    """
+    if name == 'transform':
+        return module.transform_batch(batch)
+    if name == 'grouper':
+        return module.group_batch(batch)
+    return module.filter_batch(batch)
+
+
+def _is_counter(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def metadata_changes(before, after):
+    """
+    Returns the per module metadata changes between two snapshots. Numeric
+    values are returned as increments, any other value is returned as is
+    if it has been modified.
+    """
+    changes = {}
+    for module, values in after.items():
+        previous = before.get(module, {})
+        module_changes = {}
+        for key, value in values.items():
+            if _is_counter(value) and _is_counter(previous.get(key, 0)):
+                if value != previous.get(key, 0):
+                    module_changes[key] = value - previous.get(key, 0)
+            elif key not in previous or previous[key] != value:
+                module_changes[key] = value
+        if module_changes:
+            changes[module] = module_changes
+    return changes
+
+
+def merge_metadata_changes(per_module, changes):
+    """
+    Applies the changes returned by metadata_changes() to the per_module
+    metadata of an ExportMeta object.
+    """
+    for module, module_changes in changes.items():
+        values = per_module[module]
+        for key, value in module_changes.items():
+            if _is_counter(value) and _is_counter(values.get(key, 0)):
+                values[key] = values.get(key, 0) + value
+            else:
+                values[key] = value
+
+
+def _load_module(name, config, metadata):
+    module_loader = ModuleLoader()
+    if name == 'transform':
+        return module_loader.load_transform(config.transform_options, metadata)
+    if name == 'grouper':
+        return module_loader.load_grouper(config.grouper_options, metadata)
+    return module_loader.load_filter(getattr(config, name + '_options'), metadata)
+
+
+def init_worker(configuration, module_names):
+    """
+    Pool initializer, loads the processing modules called module_names in
+    the worker process.
+    """
+    global _worker_modules, _worker_metadata
+    _worker_metadata = ExportMeta(configuration)
+    config = ExporterConfig(configuration)
+    _worker_modules = [(name, _load_module(name, config, _worker_metadata))
+                       for name in module_names]
+
+
+def process_batch(batch):
+    """
+    Runs a batch through the worker processing modules. Returns a tuple with
+    the processed records (a list, or a RecordBatch for columnar batches)
+    and the metadata changes done while processing them.
+    """
+    per_module = _worker_metadata.per_module
+    before = deepcopy(dict(per_module))
+    for name, module in _worker_modules:
+        batch = process_with(name, module, batch)
+    return materialize_batch(batch), metadata_changes(before, per_module)
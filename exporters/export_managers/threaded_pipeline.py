@@ -0,0 +1,169 @@
+"""
+Staged pipeline engine used by the threaded export mode.
+
+Every stage runs in its own thread and stages are connected by bounded
+queues, so a slow stage makes the previous ones block instead of letting
+batches pile up in memory. End of data is signaled with a sentinel that
+flows through all the queues, and an error in any stage stops the whole
+pipeline and is re-raised by run().
+"""
+import sys
+import time
+from collections import OrderedDict
+from threading import Event, Thread, Lock
+
+import six
+from six.moves.queue import Queue, Empty, Full
+
+
+_END_OF_DATA = object()
+
+
+class _PipelineAborted(Exception):
+    """
+    Raised inside a stage thread when another stage has failed.
+    """
+
+
+class StageStats(object):
+    """
+    Counters gathered for a pipeline stage:
+
+        - processed: number of batches handled by the stage
+        - queue_depth: batches waiting in the stage input queue the last time it read from it
+        - max_queue_depth: maximum queue_depth seen
+        - input_wait: seconds spent waiting for batches from the previous stage
+        - output_wait: seconds spent blocked because the next stage queue was full
+    """
+
+    def __init__(self):
+        self.processed = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.input_wait = 0.0
+        self.output_wait = 0.0
+
+    def update_queue_depth(self, depth):
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def to_dict(self):
+        return OrderedDict([
+            ('processed', self.processed),
+            ('queue_depth', self.queue_depth),
+            ('max_queue_depth', self.max_queue_depth),
+            ('input_wait', round(self.input_wait, 6)),
+            ('output_wait', round(self.output_wait, 6)),
+        ])
+
+
+class StagedPipeline(object):
+    """
+    Runs a source and a list of stages, each of them in its own thread.
+
+        - source is a (name, callable) tuple. The callable must return an
+          iterable of work units.
+        - stages is a list of (name, callable) tuples. Every callable
+          receives a work unit and returns the work unit for the next
+          stage. The value returned by the last stage is discarded.
+    """
+
+    def __init__(self, source, stages, queue_size=100, poll_interval=0.1):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.queues = [Queue(queue_size) for _ in stages]
+        self.stats = OrderedDict(
+            (name, StageStats()) for name, _ in [source] + list(stages))
+        self._aborted = Event()
+        self._error = None
+        self._error_lock = Lock()
+
+    def stats_report(self):
+        return OrderedDict((name, stats.to_dict()) for name, stats in self.stats.items())
+
+    def _set_error(self):
+        with self._error_lock:
+            if self._error is None:
+                self._error = sys.exc_info()
+        self._aborted.set()
+
+    def _put(self, queue, unit, stats):
+        started = time.time()
+        try:
+            while True:
+                if self._aborted.is_set():
+                    raise _PipelineAborted()
+                try:
+                    queue.put(unit, timeout=self.poll_interval)
+                    return
+                except Full:
+                    pass
+        finally:
+            stats.output_wait += time.time() - started
+
+    def _get(self, queue, stats):
+        stats.update_queue_depth(queue.qsize())
+        started = time.time()
+        try:
+            while True:
+                if self._aborted.is_set():
+                    raise _PipelineAborted()
+                try:
+                    return queue.get(timeout=self.poll_interval)
+                except Empty:
+                    pass
+        finally:
+            stats.input_wait += time.time() - started
+
+    def _run_source(self):
+        name, func = self.source
+        stats = self.stats[name]
+        output = self.queues[0]
+        try:
+            for unit in func():
+                stats.processed += 1
+                self._put(output, unit, stats)
+            self._put(output, _END_OF_DATA, stats)
+        except _PipelineAborted:
+            pass
+        except Exception:
+            self._set_error()
+
+    def _run_stage(self, position):
+        name, func = self.stages[position]
+        stats = self.stats[name]
+        input_queue = self.queues[position]
+        output = self.queues[position + 1] if position + 1 < len(self.queues) else None
+        try:
+            while True:
+                unit = self._get(input_queue, stats)
+                if unit is _END_OF_DATA:
+                    break
+                result = func(unit)
+                stats.processed += 1
+                if output is not None:
+                    self._put(output, result, stats)
+            if output is not None:
+                self._put(output, _END_OF_DATA, stats)
+        except _PipelineAborted:
+            pass
+        except Exception:
+            self._set_error()
+
+    def run(self):
+        """
+        Starts all the stages and waits for them to finish. If any of them
+        failed, the first error is raised again.
+        """
+        threads = [Thread(target=self._run_source, name=self.source[0])]
+        threads.extend(Thread(target=self._run_stage, args=(position,), name=name)
+                       for position, (name, _) in enumerate(self.stages))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            six.reraise(*self._error)
@@ -3,13 +3,13 @@ from importlib import import_module
 from inspect import isclass
 import json
 from exporters.utils import maybe_cast_list
-from exporters.exceptions import ConfigCheckError
+from exporters.exceptions import ConfigCheckError, ConfigurationError
 from exporters.readers.base_stream_reader import StreamBasedReader
 from exporters.defaults import (
     DEFAULT_FILTER_CONFIG, DEFAULT_GROUPER_CONFIG, DEFAULT_PERSISTENCE_CONFIG,
     DEFAULT_STATS_MANAGER_CCONFIG, DEFAULT_FORMATTER_CONFIG, DEFAULT_LOGGER_LEVEL,
     DEFAULT_LOGGER_NAME, DEFAULT_TRANSFORM_CONFIG, DEFAULT_DECOMPRESSOR_CONFIG,
-    DEFAULT_DESERIALIZER_CONFIG
+    DEFAULT_DESERIALIZER_CONFIG, DEFAULT_STREAM_BYPASS_MEMORY_BUDGET
 )
 
 
@@ -59,10 +59,36 @@ class ExporterConfig(object):
     def prevent_bypass(self):
         return self.exporter_options.get('prevent_bypass', False)
 
+    @property
+    def bypass_concurrency(self):
+        return self.exporter_options.get('bypass_concurrency', 1)
+
+    @property
+    def stream_bypass_concurrency(self):
+        return self.exporter_options.get('stream_bypass_concurrency', 1)
+
+    @property
+    def stream_bypass_memory_budget(self):
+        return self.exporter_options.get('stream_bypass_memory_budget',
+                                         DEFAULT_STREAM_BYPASS_MEMORY_BUDGET)
+
+    @property
+    def prefilter_lines(self):
+        return self.exporter_options.get('prefilter_lines', False)
+
     @property
     def disable_retries(self):
         return self.exporter_options.get('disable_retries', False)
 
+    @property
+    def mode(self):
+        default_mode = 'threaded' if self.exporter_options.get('threaded') else 'sequential'
+        mode = self.exporter_options.get('mode', default_mode)
+        if mode not in EXPORTER_MODES:
+            raise ConfigurationError('Unsupported exporter mode {!r}, it should be one of: '
+                                     '{}'.format(mode, ', '.join(EXPORTER_MODES)))
+        return mode
+
     def get_supported_options(self, module_type):
         options_name = '{}_options'.format(module_type)
         if not hasattr(self, options_name):
@@ -90,6 +116,9 @@ def module_options():
     return options
 
 
+EXPORTER_MODES = ('sequential', 'threaded', 'multiprocess')
+
+
 REQUIRED_CONFIG_SECTIONS = frozenset(['reader', 'writer'])
 STREAM_READER_SECTIONS = frozenset(['decompressor', 'deserializer'])
 
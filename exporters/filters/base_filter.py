@@ -1,5 +1,6 @@
 from exporters.logger.base_logger import FilterLogger
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
+from exporters.records.record_batch import is_record_batch
 
 
 class BaseFilter(BasePipelineItem):
@@ -25,6 +26,32 @@ class BaseFilter(BasePipelineItem):
         """
         Receives the batch, filters it, and returns it.
         """
+        if is_record_batch(batch):
+            return self._filter_record_batch(batch)
+        return self._filter_items(batch)
+
+    def _filter_record_batch(self, batch):
+        mask = self.filter_columns(batch)
+        filtered = batch.take(mask)
+        self._count_filtered(len(batch) - len(filtered), len(batch))
+        return filtered
+
+    def _count_filtered(self, filtered_out, total):
+        self.set_metadata('filtered_out', self.get_metadata('filtered_out') + filtered_out)
+        previous_total, self.total = self.total, self.total + total
+        if self.total // self.log_at_every > previous_total // self.log_at_every:
+            self.logger.info('Filtered out %d records from %d total' %
+                             (self.get_metadata('filtered_out'), self.total))
+
+    def count_rejected_lines(self, count):
+        """
+        Counts as filtered out the items of count lines that stream readers
+        dropped using raw_line_filter(), which never reach filter_batch().
+        """
+        if count:
+            self._count_filtered(count, count)
+
+    def _filter_items(self, batch):
         for item in batch:
             if self.filter(item):
                 yield item
@@ -41,6 +68,58 @@ class BaseFilter(BasePipelineItem):
         """
         raise NotImplementedError
 
+    def filter_columns(self, batch):
+        """
+        It receives a RecordBatch and returns a list of booleans telling which
+        of its records must be included. Filters able to work on whole columns
+        should override it, by default filter() is called for every record.
+        """
+        return [self.filter(item) for item in batch]
+
+    def raw_line_filter(self):
+        """
+        Returns a function receiving a raw JSON line and returning False if
+        the item in it can't pass the filter, so stream readers can drop the
+        line without decoding it. It must be conservative: lines it doesn't
+        reject are decoded and filtered as usual. None is returned if the
+        filter can't check raw lines.
+        """
+        return None
+
+    def keeps_state(self):
+        """
+        Returns True if the filter keeps a state between batches, so it must
+        see every item in the same order they were read. The multiprocess
+        mode of the exporter only runs filters that don't in worker processes.
+        """
+        return self.has_persistent_state()
+
+    def has_persistent_state(self):
+        """
+        Returns True if get_state() returns a state that must be saved in the
+        persistence checkpoints for resumed jobs to filter items correctly.
+        """
+        return False
+
+    def get_state(self):
+        """
+        Returns the state the filter keeps between batches, to be saved in
+        the persistence checkpoints, or None if there is nothing to save.
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restores the state returned by get_state() when a job is resumed.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the resources held by the filter when the export ends.
+        """
+        pass
+
     def set_metadata(self, key, value, module='filter'):
         super(BaseFilter, self).set_metadata(key, value, module)
 
@@ -1,5 +1,252 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+
+from exporters.exceptions import ConfigurationError
 from exporters.filters.base_filter import BaseFilter
 
+DEFAULT_BLOOM_CAPACITY = 10 * 1000 * 1000
+DEFAULT_BLOOM_ERROR_RATE = 0.001
+
+
+def _serialize_key(key):
+    # 1 and '1' are different keys
+    return json.dumps(key, sort_keys=True)
+
+
+class TemporaryIndexPath(object):
+    """
+    Path of an index file, in a temporary folder if no path is given.
+    The folder is only created when the path is used, and it is removed
+    by remove().
+    """
+
+    def __init__(self, path, file_name):
+        self._path = path
+        self.file_name = file_name
+        self.temporary_dir = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self.temporary_dir = tempfile.mkdtemp()
+            self._path = os.path.join(self.temporary_dir, self.file_name)
+        return self._path
+
+    @path.setter
+    def path(self, value):
+        self.remove()
+        self._path = value
+
+    def remove(self):
+        if self.temporary_dir is not None:
+            shutil.rmtree(self.temporary_dir, ignore_errors=True)
+            self.temporary_dir = None
+            self._path = None
+
+
+class MemoryKeyIndex(object):
+    """
+    Keeps every key in a set. It is exact and fast, but memory grows with the
+    number of keys and it is not kept in the checkpoints.
+    """
+    persistent = False
+
+    def __init__(self):
+        self.keys = set()
+
+    def add(self, key):
+        """
+        Adds key to the index, returning False if it was already there.
+        """
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def get_state(self):
+        return None
+
+    def set_state(self, state):
+        pass
+
+    def close(self):
+        pass
+
+
+class BloomKeyIndex(object):
+    """
+    Bloom filter sized for capacity keys with the given false positive rate.
+    If max_memory (in bytes) is not enough for that, the filter uses
+    max_memory and the false positive rate grows accordingly. New keys are
+    never reported as duplicates, but false positives make some new keys
+    be filtered out.
+
+    The bits are saved to a file per checkpoint, named after path and the
+    checkpoint number, and only that file name is kept in the checkpoint.
+    The files of the last two checkpoints are kept, in case the newest one
+    could not be committed.
+    """
+    persistent = True
+
+    def __init__(self, capacity, error_rate, max_memory=None, path=None, logger=None):
+        size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        if max_memory and size > max_memory * 8:
+            size = max_memory * 8
+            if logger:
+                logger.warning(
+                    'Bloom filter limited to {} bytes, the expected false positive '
+                    'rate for {} keys is {:.6f}'.format(
+                        max_memory, capacity, self.expected_error_rate(size, capacity)))
+        self.size = max(size, 8)
+        self.hashes = max(1, int(round(float(self.size) / capacity * math.log(2))))
+        self.bits = bytearray(int(math.ceil(self.size / 8.0)))
+        self.count = 0
+        self.index_path = TemporaryIndexPath(path, 'dupe_filter.bloom')
+        self.logger = logger
+        self.generation = 0
+
+    @staticmethod
+    def expected_error_rate(size, capacity):
+        hashes = max(1, int(round(float(size) / capacity * math.log(2))))
+        return (1 - math.exp(-float(hashes) * capacity / size)) ** hashes
+
+    def _positions(self, key):
+        digest = hashlib.md5(_serialize_key(key).encode('utf-8')).digest()
+        first, second = struct.unpack('<QQ', digest)
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key):
+        """
+        Adds key to the index, returning False if it was (probably) already
+        there.
+        """
+        new = False
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    @staticmethod
+    def _bits_path(path, generation):
+        return '{}.{}'.format(path, generation)
+
+    def get_state(self):
+        path = self.index_path.path
+        bits_path = self._bits_path(path, self.generation)
+        with open(bits_path + '.tmp', 'wb') as f:
+            f.write(self.bits)
+        os.rename(bits_path + '.tmp', bits_path)
+        old_bits_path = self._bits_path(path, self.generation - 2)
+        if os.path.exists(old_bits_path):
+            os.remove(old_bits_path)
+        state = {
+            'path': path,
+            'generation': self.generation,
+            'size': self.size,
+            'hashes': self.hashes,
+            'count': self.count,
+        }
+        self.generation += 1
+        return state
+
+    def set_state(self, state):
+        bits_path = self._bits_path(state['path'], state['generation'])
+        bits_length = int(math.ceil(state['size'] / 8.0))
+        if not os.path.exists(bits_path) or os.path.getsize(bits_path) != bits_length:
+            if self.logger:
+                self.logger.warning(
+                    'Dupe filter index {} not found, keys seen before resuming '
+                    'the job are lost'.format(bits_path))
+            return
+        with open(bits_path, 'rb') as f:
+            self.bits = bytearray(f.read())
+        self.size = state['size']
+        self.hashes = state['hashes']
+        self.count = state['count']
+        self.index_path.path = state['path']
+        self.generation = state['generation'] + 1
+
+    def close(self):
+        self.index_path.remove()
+
+
+class SqliteKeyIndex(object):
+    """
+    Exact index of keys stored in a sqlite database, so memory doesn't grow
+    with the number of keys.
+
+    Every key is stored with the number of the checkpoint it belongs to.
+    Keys added after the checkpoint a job is resumed from are removed,
+    because the items they came from were never written.
+    """
+    persistent = True
+
+    def __init__(self, path=None, logger=None):
+        self.index_path = TemporaryIndexPath(path, 'dupe_filter.sqlite')
+        self.logger = logger
+        self._connection = None
+        self.generation = 0
+
+    @property
+    def connection(self):
+        # Opened on first use, so that resumed jobs don't create an index
+        # just to replace it with the checkpointed one
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.index_path.path, check_same_thread=False)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, generation INTEGER)')
+            self._connection.commit()
+        return self._connection
+
+    def add(self, key):
+        """
+        Adds key to the index, returning False if it was already there.
+        """
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO keys (key, generation) VALUES (?, ?)',
+            (_serialize_key(key), self.generation))
+        return cursor.rowcount == 1
+
+    def get_state(self):
+        self.connection.commit()
+        state = {'path': self.index_path.path, 'generation': self.generation}
+        self.generation += 1
+        return state
+
+    def set_state(self, state):
+        if not os.path.exists(state['path']):
+            if self.logger:
+                self.logger.warning(
+                    'Dupe filter index {} not found, keys seen before resuming '
+                    'the job are lost'.format(state['path']))
+            return
+        self._close_connection()
+        self.index_path.path = state['path']
+        self.connection.execute('DELETE FROM keys WHERE generation > ?',
+                                (state['generation'],))
+        self.connection.commit()
+        self.generation = state['generation'] + 1
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def close(self):
+        self._close_connection()
+        self.index_path.remove()
+
 
 class DupeFilter(BaseFilter):
     """
@@ -7,19 +254,70 @@ class DupeFilter(BaseFilter):
 
         - key_field (str)
             item's key to be used to identify dupes
+
+        - mode (str)
+            How seen keys are kept. "memory" (the default) keeps them in a
+            set. "bloom" uses a Bloom filter with bounded memory, which may
+            filter out a few unique items (see error_rate). "sqlite" keeps
+            an exact index on disk. The index of the bloom and sqlite modes is
+            saved in the persistence checkpoints (in the sequential mode of
+            the exporter, other modes are rejected), so resumed jobs keep
+            filtering the keys seen before. The bloom mode saves all its bits
+            on every checkpoint (about 18MB with the default capacity and
+            error_rate), so the checkpoint_every_batches or
+            checkpoint_interval_seconds persistence options should be set
+            to save them less often.
+
+        - capacity (int)
+            Expected number of unique keys, used to size the Bloom filter.
+
+        - error_rate (float)
+            False positive rate of the Bloom filter when it holds capacity
+            keys. 0.001 by default.
+
+        - max_memory (int)
+            Maximum size of the Bloom filter in bytes. If it is not enough for
+            capacity and error_rate, the false positive rate will be higher.
+
+        - index_path (str)
+            Path of the sqlite index, or prefix of the files the Bloom filter
+            is saved to. A temporary folder, removed when the export ends, is
+            used if not set, so it should be set to a durable location for
+            jobs to be resumed.
     """
     # List of options
     supported_options = {
-        'key_field': {'type': basestring, 'default': '_key'}
+        'key_field': {'type': basestring, 'default': '_key'},
+        'mode': {'type': basestring, 'default': 'memory'},
+        'capacity': {'type': int, 'default': DEFAULT_BLOOM_CAPACITY},
+        'error_rate': {'type': float, 'default': DEFAULT_BLOOM_ERROR_RATE},
+        'max_memory': {'type': int, 'default': None},
+        'index_path': {'type': basestring, 'default': None},
     }
 
     def __init__(self, *args, **kwargs):
         super(DupeFilter, self).__init__(*args, **kwargs)
         self.key_field = self.read_option('key_field')
-        self.key_set = set()
+        self.mode = self.read_option('mode')
+        self.key_index = self._create_key_index()
         self.logger.info('{} initialized. Key field: "{}"'.format(
             self.__class__.__name__, self.key_field))
 
+    def _create_key_index(self):
+        if self.mode == 'memory':
+            return MemoryKeyIndex()
+        if self.mode == 'bloom':
+            error_rate = self.read_option('error_rate')
+            if not 0 < error_rate < 1:
+                raise ConfigurationError('error_rate must be between 0 and 1')
+            return BloomKeyIndex(self.read_option('capacity'), error_rate,
+                                 self.read_option('max_memory'),
+                                 self.read_option('index_path'), self.logger)
+        if self.mode == 'sqlite':
+            return SqliteKeyIndex(self.read_option('index_path'), self.logger)
+        raise ConfigurationError('Unsupported DupeFilter mode {!r}, it should be one of: '
+                                 'memory, bloom, sqlite'.format(self.mode))
+
     def filter(self, item):
         items_key = item.get(self.key_field)
         if not items_key:  # unable to determine duplicates, won't be filtered
@@ -27,7 +325,20 @@ class DupeFilter(BaseFilter):
                                 ' unable to filter it.')
             return True
 
-        if items_key not in self.key_set:
-            self.key_set.add(items_key)
-            return True
-        return False
+        return self.key_index.add(items_key)
+
+    def keeps_state(self):
+        return True
+
+    def has_persistent_state(self):
+        return self.key_index.persistent
+
+    def get_state(self):
+        return self.key_index.get_state()
+
+    def set_state(self, state):
+        if state is not None:
+            self.key_index.set_state(state)
+
+    def close(self):
+        self.key_index.close()
@@ -1,8 +1,9 @@
 import re
 import six
+from collections import Mapping, namedtuple
 
 from exporters.filters.base_filter import BaseFilter
-from exporters.utils import nested_dict_value
+from exporters.records.record_batch import MISSING
 from exporters.utils import dict_list
 import operator
 
@@ -22,6 +23,126 @@ OPERATORS = {
 
 DEFAULT_OPERATOR = '=='
 
+# Keys are checked from the cheapest operator to the most expensive one
+OPERATOR_COSTS = {'==': 0, 'in': 1, 'contains': 2, 're_match': 3}
+
+# A key of the filter compiled at init: get(item) returns the value of the
+# key (or MISSING), follow(value) does the same from the value of the first
+# key of the path and match(value) tells if it must be kept
+CompiledKey = namedtuple('CompiledKey', 'name path get follow match cost')
+
+
+def compile_operator(op, expected):
+    """
+    Returns a function telling if a found value matches expected with op,
+    doing once all the work that only depends on expected.
+    """
+    if op == '==':
+        return lambda found: found == expected
+    if op == 're_match':
+        regex = re.compile(expected)
+        return lambda found: regex.match(u'%s' % found) is not None
+    if op == 'in' and isinstance(expected, (list, tuple, set, frozenset)):
+        try:
+            expected_set = frozenset(expected)
+        except TypeError:  # unhashable expected values
+            return lambda found: found in expected
+
+        def match_in(found):
+            try:
+                return found in expected_set
+            except TypeError:  # unhashable found value
+                return found in expected
+        return match_in
+    function = OPERATORS[op]
+    return lambda found: function(found, expected)
+
+
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
+# str() of True, False, None, inf and nan start with these letters, so a
+# regex starting with them could match values that are not JSON strings
+NON_STRING_INITIALS = set('TFNin')
+
+
+def _raw_string(value):
+    """
+    Returns value as it appears in a JSON line without escape sequences, or
+    None if it is not a string or it would need to be escaped.
+    """
+    if not isinstance(value, six.string_types):
+        return None
+    if isinstance(value, six.text_type):
+        value = value.encode('utf-8')
+    if any(char in value for char in '"\\') or any(ord(char) < 32 for char in value):
+        return None
+    return value
+
+
+def regex_literal_prefix(pattern):
+    """
+    Returns the literal text every string matched by pattern (with
+    re.match) starts with, which may be empty.
+    """
+    if '|' in pattern:
+        return ''
+    prefix = []
+    for char in pattern:
+        if char in REGEX_SPECIAL_CHARS:
+            if char in '*?{' and prefix:
+                prefix.pop()  # the last char may not be there
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+def raw_line_check(op, expected):
+    """
+    Returns a function telling if a raw JSON line (without backslashes) may
+    contain a value matching expected with op, or None if op and expected
+    can't be checked on raw lines.
+    """
+    if op == '==':
+        needle = _raw_string(expected)
+        if needle is not None:
+            needle = '"' + needle + '"'
+            return lambda line: needle in line
+    elif op == 'in' and isinstance(expected, (list, tuple, set, frozenset)) and expected:
+        needles = [_raw_string(value) for value in expected]
+        if None not in needles:
+            needles = ['"' + needle + '"' for needle in set(needles)]
+            return lambda line: any(needle in line for needle in needles)
+    elif op == 'contains':
+        # found can be a string containing expected or a list with it
+        needle = _raw_string(expected)
+        if needle:
+            return lambda line: needle in line
+    elif op == 're_match':
+        prefix = _raw_string(regex_literal_prefix(expected))
+        if prefix and prefix[0].isalpha() and prefix[0] not in NON_STRING_INITIALS:
+            needle = '"' + prefix
+            return lambda line: needle in line
+    return None
+
+
+def compile_path(path):
+    """
+    Returns a function getting the value found following path (a list of
+    keys) from an item, or MISSING if any of the keys can't be found.
+    """
+    def get(item):
+        value = item
+        for key in path:
+            if not isinstance(value, Mapping):
+                raise TypeError(
+                    'Could not get key {} from {} for item {} and value {}'.format(
+                        key, value, item, path))
+            value = value.get(key, MISSING)
+            if value is MISSING:
+                break
+        return value
+    return get
+
 
 class KeyValueBaseFilter(BaseFilter):
     "Base class to key-value filters"
@@ -36,6 +157,7 @@ class KeyValueBaseFilter(BaseFilter):
         self.keys = self.read_option('keys')
         self.nested_field_separator = self.read_option('nested_field_separator')
         self._validate_keys_operator()
+        self.plan = self._compile_plan()
         self.logger.info('{} has been initiated. Keys: {}'.format(
             self.__class__.__name__, self.keys))
 
@@ -45,23 +167,90 @@ class KeyValueBaseFilter(BaseFilter):
             if op and op not in OPERATORS:
                 raise InvalidOperator('{} operator not valid in key {}'.format(op, key))
 
-    def filter(self, item):
+    def _compile_plan(self):
+        """
+        Compiles the keys into the list of checks done for every item:
+        nested paths are split, operators prepared and keys sorted so the
+        cheapest checks are done first.
+        """
+        plan = []
         for key in self.keys:
+            name = key['name']
             if self.nested_field_separator:
-                nested_fields = key['name'].split(self.nested_field_separator)
-                try:
-                    value = nested_dict_value(item, nested_fields)
-                except KeyError:
-                    self.logger.debug('Missing path {} from item. Item dismissed'.format(
-                            nested_fields))
-                    return False
+                path = name.split(self.nested_field_separator)
+                get = compile_path(path)
             else:
-                value = item[key['name']]
-            if not self._match_value(
-                    value, key['value'], OPERATORS[key.get('operator', DEFAULT_OPERATOR)]):
+                path = [name]
+                get = operator.itemgetter(name)
+            op = key.get('operator', DEFAULT_OPERATOR)
+            cost = (OPERATOR_COSTS.get(op, len(OPERATOR_COSTS)), len(path))
+            plan.append(CompiledKey(name, path, get, compile_path(path[1:]),
+                                    self._compile_match(key), cost))
+        return sorted(plan, key=lambda compiled_key: compiled_key.cost)
+
+    def _compile_match(self, key):
+        """
+        Returns a function telling if a found value matches the key.
+        Derived classes can override it to prepare their matching once.
+        """
+        expected = key['value']
+        op = OPERATORS[key.get('operator', DEFAULT_OPERATOR)]
+        return lambda found: self._match_value(found, expected, op)
+
+    def _raw_line_check(self, key):
+        """
+        Returns a conservative check of the key on raw JSON lines (see
+        raw_line_check), or None if it can't be done.
+        """
+        return None
+
+    def raw_line_filter(self):
+        if not self.nested_field_separator:
+            # Items missing a key raise KeyError, they must not be dropped
+            return None
+        checks = [check for check in (self._raw_line_check(key) for key in self.keys)
+                  if check is not None]
+        if not checks:
+            return None
+
+        def line_filter(line):
+            if '\\' in line:  # escaped strings would not be found verbatim
+                return True
+            for check in checks:
+                if not check(line):
+                    return False
+            return True
+        return line_filter
+
+    def filter(self, item):
+        for compiled_key in self.plan:
+            value = compiled_key.get(item)
+            if value is MISSING:
+                self.logger.debug('Missing path {} from item. Item dismissed'.format(
+                        compiled_key.path))
+                return False
+            if not compiled_key.match(value):
                 return False
         return True
 
+    def filter_columns(self, batch):
+        # Like filter(), every key is only checked on the records that passed
+        # the previous ones, so errors are raised for the same records
+        mask = [True] * len(batch)
+        for compiled_key in self.plan:
+            follow, match = compiled_key.follow, compiled_key.match
+            values = batch.column(compiled_key.path[0])
+            for index, value in enumerate(values):
+                if not mask[index]:
+                    continue
+                if value is MISSING:
+                    if not self.nested_field_separator:
+                        raise KeyError(compiled_key.name)
+                else:
+                    value = follow(value)
+                mask[index] = value is not MISSING and match(value)
+        return mask
+
     def _match_value(self, value_found, value_expected, op=None):
         """Return True if value found matches the expected.
         Should be overriden by derived classes implementing custom match.
@@ -81,6 +270,12 @@ class KeyValueFilter(KeyValueBaseFilter):
     def _match_value(self, found, expected, op):
         return op(found, expected)
 
+    def _compile_match(self, key):
+        return compile_operator(key.get('operator', DEFAULT_OPERATOR), key['value'])
+
+    def _raw_line_check(self, key):
+        return raw_line_check(key.get('operator', DEFAULT_OPERATOR), key['value'])
+
 
 class KeyValueRegexFilter(KeyValueBaseFilter):
     """
@@ -95,3 +290,10 @@ class KeyValueRegexFilter(KeyValueBaseFilter):
         if found is None:
             return False
         return OPERATORS['re_match'](found, expected)
+
+    def _compile_match(self, key):
+        regex = re.compile(key['value'])
+        return lambda found: found is not None and regex.match(u'%s' % found) is not None
+
+    def _raw_line_check(self, key):
+        return raw_line_check('re_match', key['value'])
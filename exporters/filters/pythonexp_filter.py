@@ -33,13 +33,22 @@ class PythonexpFilter(BaseFilter):
         self.expression = self.read_option('python_expression')
         self.imports = load_imports(self.read_option('imports'))
         self.interpreter = Interpreter()
+        self.interpreter.check(self.expression)
+        self.context = create_context(**self.imports)
         self.logger.info('PythonexpFilter has been initiated.'
                          ' Expression: {!r}'.format(self.expression))
 
     def filter(self, item):
         try:
-            context = create_context(item=item, **self.imports)
-            return self.interpreter.eval(self.expression, context=context)
+            self.context['item'] = item
+            return self.interpreter.eval(self.expression, context=self.context)
+        except Exception as ex:
+            self.logger.error(str(ex))
+            raise
+
+    def filter_columns(self, batch):
+        try:
+            return self.interpreter.eval_batch(self.expression, batch, context=self.context)
         except Exception as ex:
             self.logger.error(str(ex))
             raise
@@ -1,4 +1,5 @@
 from exporters.groupers.base_grouper import BaseGrouper
+from exporters.records.record_batch import MISSING, is_record_batch
 from exporters.utils import str_list
 
 
@@ -27,7 +28,26 @@ class FileKeyGrouper(BaseGrouper):
                 membership = 'unknown'
             return membership
 
+    def _membership_column(self, batch, key):
+        values = batch.nested_column(key.split('.'))
+        return ['unknown' if value is MISSING or value is None else value
+                for value in values]
+
+    def _group_record_batch(self, batch):
+        columns = [self._membership_column(batch, key) for key in self.keys]
+        if columns:
+            memberships = zip(*columns)
+        else:
+            memberships = [()] * len(batch)
+        batch.set_group_memberships(self.keys, memberships)
+        return batch
+
     def group_batch(self, batch):
+        if is_record_batch(batch):
+            return self._group_record_batch(batch)
+        return self._group_items(batch)
+
+    def _group_items(self, batch):
         for item in batch:
             item.group_key = self.keys
             membership = []
@@ -1,5 +1,6 @@
 from exporters.groupers.base_grouper import BaseGrouper
 from exporters.python_interpreter import Interpreter, create_context
+from exporters.records.record_batch import is_record_batch
 from exporters.utils import str_list
 
 
@@ -18,19 +19,40 @@ class PythonExpGrouper(BaseGrouper):
         super(PythonExpGrouper, self).__init__(*args, **kwargs)
         self.expressions = self.read_option('python_expressions', [])
         self.interpreter = Interpreter()
+        for expression in self.expressions:
+            self.interpreter.check(expression)
+        self.context = create_context()
 
     def _get_membership(self, item):
         try:
-            context = create_context(item=item)
+            self.context['item'] = item
             return [
-                self.interpreter.eval(expression, context=context)
+                self.interpreter.eval(expression, context=self.context)
                 for expression in self.expressions
             ]
         except Exception as ex:
             self.logger.error(str(ex))
             raise
 
+    def _group_record_batch(self, batch):
+        try:
+            columns = [
+                self.interpreter.eval_batch(expression, batch, context=self.context)
+                for expression in self.expressions
+            ]
+        except Exception as ex:
+            self.logger.error(str(ex))
+            raise
+        memberships = zip(*columns) if columns else [()] * len(batch)
+        batch.set_group_memberships([], memberships)
+        return batch
+
     def group_batch(self, batch):
+        if is_record_batch(batch):
+            return self._group_record_batch(batch)
+        return self._group_items(batch)
+
+    def _group_items(self, batch):
         for item in batch:
             item.group_membership = tuple(self._get_membership(item))
             yield item
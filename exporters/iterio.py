@@ -1,4 +1,7 @@
-def cohere_stream(stream):
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def cohere_stream(stream, chunk_size=DEFAULT_CHUNK_SIZE):
     """
     Convert into an IterIO object.
 
@@ -9,7 +12,7 @@ def cohere_stream(stream):
     """
     if isinstance(stream, IterIO):
         return stream
-    return IterIO(stream)
+    return IterIO(stream, chunk_size=chunk_size)
 
 
 def iterate_chunks(file, chunk_size):
@@ -30,9 +33,15 @@ class IterIO(object):
     - chunks: iterator yields chunks that can be of various sizes. If iterator
               is a file-like object, chunks are of size chunk_size
     - lines:  iterator yields lines like standard file-like objects
+
+    Data pulled from the underlying iterator and not consumed yet is kept in
+    a buffer together with the position of the first unconsumed byte, so
+    reading lines or sized blocks never copies the pending data more than
+    once, no matter how long the lines are.
     """
-    def __init__(self, iterator, mode="chunks", chunk_size=1024):
-        self._unconsumed = []
+    def __init__(self, iterator, mode="chunks", chunk_size=DEFAULT_CHUNK_SIZE):
+        self._buffer = ''
+        self._buffer_pos = 0
         self.mode = mode
         self._pos = 0
         self._file = iterator
@@ -53,7 +62,37 @@ class IterIO(object):
         """
         if chunk:
             self._pos -= len(chunk)
-            self._unconsumed.append(chunk)
+            self._buffer = chunk + self._buffer[self._buffer_pos:]
+            self._buffer_pos = 0
+
+    def _fill_buffer(self):
+        """
+        Replaces the (fully consumed) buffer with the next chunk from the
+        underlying iterator. Raises StopIteration when there is no more data.
+        """
+        self._buffer = next(self._iterator)
+        self._buffer_pos = 0
+
+    def _consume_buffer(self, end):
+        data = self._buffer[self._buffer_pos:end]
+        self._buffer_pos = end
+        self._pos += len(data)
+        return data
+
+    def _skip(self, size):
+        """
+        Discards the next size bytes without keeping them in memory.
+        """
+        try:
+            while size > 0:
+                if self._buffer_pos >= len(self._buffer):
+                    self._fill_buffer()
+                end = min(len(self._buffer), self._buffer_pos + size)
+                size -= end - self._buffer_pos
+                self._pos += end - self._buffer_pos
+                self._buffer_pos = end
+        except StopIteration:
+            pass
 
     def __iter__(self):
         return self
@@ -67,17 +106,16 @@ class IterIO(object):
                 raise StopIteration
             return line
 
+    __next__ = next
+
     def next_chunk(self):
         """
         Read a chunk of arbitrary size from the underlying iterator. To get a
         chunk of an specific size, use read()
         """
-        if self._unconsumed:
-            data = self._unconsumed.pop()
-        else:
-            data = self._iterator.next()  # Might raise StopIteration
-        self._pos += len(data)
-        return data
+        while self._buffer_pos >= len(self._buffer):
+            self._fill_buffer()  # Might raise StopIteration
+        return self._consume_buffer(len(self._buffer))
 
     def read(self, size=None):
         """
@@ -86,50 +124,63 @@ class IterIO(object):
         If the size argument is negative or None, read until EOF is reached.
         Return an empty string at EOF.
         """
-        if size is None or size < 0:
-            return "".join(list(self))
-        else:
-            data_chunks = []
-            data_readed = 0
-            try:
-                while data_readed < size:
-                    chunk = self.next_chunk()
-                    data_chunks.append(chunk)
-                    data_readed += len(chunk)
-            except StopIteration:
-                pass
-
-            if data_readed > size:
-                last_chunk = data_chunks.pop()
-                extra_length = data_readed - size
-                last_chunk, extra_data = last_chunk[:-extra_length], last_chunk[-extra_length:]
-                self.unshift(extra_data)
-                data_chunks.append(last_chunk)
-            return "".join(data_chunks)
+        data_chunks = []
+        data_readed = 0
+        try:
+            while size is None or size < 0 or data_readed < size:
+                if self._buffer_pos >= len(self._buffer):
+                    self._fill_buffer()
+                if size is None or size < 0:
+                    end = len(self._buffer)
+                else:
+                    end = min(len(self._buffer), self._buffer_pos + size - data_readed)
+                chunk = self._consume_buffer(end)
+                data_chunks.append(chunk)
+                data_readed += len(chunk)
+        except StopIteration:
+            pass
+        return "".join(data_chunks)
 
     def readline(self):
         """
         Read until a new-line character is encountered
         """
-        line = ""
-        n_pos = -1
+        line_chunks = []
         try:
-            while n_pos < 0:
-                line += self.next_chunk()
-                n_pos = line.find('\n')
+            while True:
+                if self._buffer_pos >= len(self._buffer):
+                    self._fill_buffer()
+                n_pos = self._buffer.find('\n', self._buffer_pos)
+                if n_pos >= 0:
+                    line_chunks.append(self._consume_buffer(n_pos + 1))
+                    break
+                line_chunks.append(self._consume_buffer(len(self._buffer)))
         except StopIteration:
             pass
-
-        if n_pos >= 0:
-            line, extra = line[:n_pos+1], line[n_pos+1:]
-            self.unshift(extra)
-        return line
+        return "".join(line_chunks)
 
     def iterlines(self):
-        line = self.readline()
-        while line:
-            yield line
+        """
+        Iterate the lines of the stream. Every chunk is split at once, only
+        lines spanning several chunks are built from pieces.
+        """
+        while True:
             line = self.readline()
+            if not line:
+                return
+            yield line
+            buffer = self._buffer
+            if self._buffer_pos >= len(buffer):
+                continue
+            pieces = buffer[self._buffer_pos:].split('\n')
+            for piece in pieces[:-1]:
+                line = piece + '\n'
+                self._buffer_pos = buffer_pos = self._buffer_pos + len(line)
+                self._pos += len(line)
+                yield line
+                if self._buffer is not buffer or self._buffer_pos != buffer_pos:
+                    # The stream has been read while yielding the line
+                    break
 
     def readlines(self):
         """
@@ -152,7 +203,8 @@ class IterIO(object):
         if callable(getattr(self._file, 'close', None)):
             self._iterator.close()
         self._iterator = None
-        self._unconsumed = None
+        self._buffer = ''
+        self._buffer_pos = 0
         self.closed = True
 
     def seek(self, offset, from_what=0):
@@ -174,7 +226,7 @@ class IterIO(object):
             if offset < 0:
                 raise NotImplementedError("Can't seek backwards")
             else:
-                self.read(offset)
+                self._skip(offset)
         else:
             raise NotImplementedError("Can't seek from there")
         return self.tell()
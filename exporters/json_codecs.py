@@ -0,0 +1,133 @@
+"""
+JSON encoding and decoding backends.
+
+The standard library json module is always available. Faster libraries
+(orjson, rapidjson, ujson) are registered only when they are installed and
+support a default hook, which is needed to serialize datetime objects.
+"""
+import datetime
+import json
+import logging
+
+from exporters.exceptions import ConfigurationError
+
+
+def default(o):
+    if isinstance(o, datetime.datetime):
+        return o.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(o))
+
+
+class StdlibJsonCodec(object):
+    """
+    Codec using the standard library json module. Encoder and decoder are
+    built only once.
+    """
+
+    def __init__(self, pretty_print=False):
+        options = dict(indent=2, sort_keys=True) if pretty_print else dict()
+        self._encoder = json.JSONEncoder(default=default, **options)
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+
+JSON_CODECS = {
+    'json': StdlibJsonCodec,
+}
+
+# Codecs used by the "auto" codec, in order of preference
+PREFERRED_JSON_CODECS = ('orjson', 'rapidjson', 'ujson', 'json')
+
+
+def _supports_default_hook(dumps):
+    try:
+        return dumps(datetime.datetime(2000, 1, 1), default=default) == '"2000-01-01T00:00:00"'
+    except Exception:
+        return False
+
+
+try:
+    import orjson
+except ImportError:
+    logging.info('Install orjson to enable the orjson JSON codec.')
+else:
+    class OrjsonCodec(object):
+
+        def __init__(self, pretty_print=False):
+            self._option = orjson.OPT_PASSTHROUGH_DATETIME
+            if pretty_print:
+                self._option |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+
+        def dumps(self, obj):
+            return orjson.dumps(obj, default=default, option=self._option).decode('utf-8')
+
+        def loads(self, data):
+            return orjson.loads(data)
+
+    JSON_CODECS['orjson'] = OrjsonCodec
+
+
+try:
+    import rapidjson
+except ImportError:
+    logging.info('Install python-rapidjson to enable the rapidjson JSON codec.')
+else:
+    class RapidjsonCodec(object):
+
+        def __init__(self, pretty_print=False):
+            self._options = dict(indent=2, sort_keys=True) if pretty_print else dict()
+
+        def dumps(self, obj):
+            return rapidjson.dumps(obj, default=default, **self._options)
+
+        def loads(self, data):
+            return rapidjson.loads(data)
+
+    JSON_CODECS['rapidjson'] = RapidjsonCodec
+
+
+try:
+    import ujson
+except ImportError:
+    logging.info('Install ujson to enable the ujson JSON codec.')
+else:
+    if _supports_default_hook(ujson.dumps):
+        class UjsonCodec(object):
+
+            def __init__(self, pretty_print=False):
+                self._options = dict(escape_forward_slashes=False)
+                if pretty_print:
+                    self._options.update(indent=2, sort_keys=True)
+
+            def dumps(self, obj):
+                return ujson.dumps(obj, default=default, **self._options)
+
+            def loads(self, data):
+                return ujson.loads(data)
+
+        JSON_CODECS['ujson'] = UjsonCodec
+    else:
+        logging.info('Installed ujson version does not support default hooks, '
+                     'upgrade it to enable the ujson JSON codec.')
+
+
+def get_json_codec(name, pretty_print=False):
+    """
+    Returns an instance of the codec registered with the given name. "auto"
+    picks the fastest available one. Known codecs that are not installed
+    fall back to the standard library json module.
+    """
+    if name == 'auto':
+        name = next(codec for codec in PREFERRED_JSON_CODECS if codec in JSON_CODECS)
+    elif name not in PREFERRED_JSON_CODECS:
+        raise ConfigurationError('The JSON codec can only be "auto" or one of the '
+                                 'following: "{}"'.format(PREFERRED_JSON_CODECS))
+    elif name not in JSON_CODECS:
+        logging.warning('JSON codec {} is not available, using json instead'.format(name))
+        name = 'json'
+    return JSON_CODECS[name](pretty_print=pretty_print)
@@ -23,6 +23,13 @@ class Job(Base):
     configuration = Column(Text, nullable=False)
 
 
+class JournalEntry(Base):
+    __tablename__ = 'journal_entry'
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, nullable=False, index=True)
+    entry = Column(Text, nullable=False)
+
+
 class BaseAlchemyPersistence(BasePersistence):
     supported_options = {
         'user': {'type': six.string_types},
@@ -62,18 +69,44 @@ class BaseAlchemyPersistence(BasePersistence):
         job = self.session.query(Job).filter(Job.id == self.persistence_state_id).first()
         return json.loads(job.last_position)
 
-    def commit_position(self, last_position=None):
+    def _update_position(self, last_position):
         self.last_position = last_position
-
         self.session.query(Job).filter(Job.id == self.persistence_state_id).update(
             {"last_position": json.dumps(self.last_position),
-             "last_committed": datetime.datetime.now()}, synchronize_session='fetch')
+             "last_committed": datetime.datetime.now()}, synchronize_session=False)
+
+    def commit_position(self, last_position=None):
+        self._update_position(last_position)
         self.session.commit()
         self.logger.debug('Commited batch number ' + str(self.last_position) +
                           ' of job: ' + str(self.persistence_state_id))
         self.set_metadata('commited_positions',
                           self.get_metadata('commited_positions') + 1)
 
+    def append_to_journal(self, entries):
+        self.session.add_all([
+            JournalEntry(job_id=self.persistence_state_id, entry=json.dumps(entry))
+            for entry in entries
+        ])
+        self.session.commit()
+
+    def read_journal(self):
+        if not self.engine:
+            self._db_init()
+        entries = self.session.query(JournalEntry.entry).filter(
+            JournalEntry.job_id == self.persistence_state_id).order_by(JournalEntry.id)
+        return [json.loads(entry) for entry, in entries]
+
+    def compact_journal(self, last_position):
+        # Position and journal are updated in the same transaction
+        self._update_position(last_position)
+        self.session.query(JournalEntry).filter(
+            JournalEntry.job_id == self.persistence_state_id).delete(synchronize_session=False)
+        self.session.commit()
+        self.logger.debug('Compacted journal of job: ' + str(self.persistence_state_id))
+        self.set_metadata('commited_positions',
+                          self.get_metadata('commited_positions') + 1)
+
     def generate_new_job(self):
         if not self.engine:
             self._db_init()
@@ -89,11 +122,18 @@ class BaseAlchemyPersistence(BasePersistence):
     def close(self):
         self.session.query(Job).filter(Job.id == self.persistence_state_id).update(
             dict(job_finished=True, last_committed=datetime.datetime.now()),
-            synchronize_session='fetch'
+            synchronize_session=False
         )
         self.session.commit()
         self.session.close()
 
+    def delete(self):
+        # The job row is kept as a record of the export, only its journal is removed
+        self.session.query(JournalEntry).filter(
+            JournalEntry.job_id == self.persistence_state_id).delete(synchronize_session=False)
+        self.session.commit()
+        self.session.close()
+
     @classmethod
     def build_db_conn_uri(cls, **kwargs):
         """Build the database connection URI from the given keyword arguments
@@ -142,7 +182,8 @@ class BaseAlchemyPersistence(BasePersistence):
 
 _docstring = """
 Manage export persistence using a {protocol} database as a backend.
-It will add a row for every job in a table called Jobs.
+It will add a row for every job in a table called Jobs, and journal
+entries to a table called journal_entry.
 
 - user (str)
 Username with access to {protocol} database
@@ -1,16 +1,109 @@
 import json
+import sys
+import time
+from copy import deepcopy
+from threading import Condition, Thread
+
+import six
+
 from exporters.logger.base_logger import PersistenceLogger
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
 
 
+class AsyncPositionCommitter(object):
+    """
+    Commits positions in a background thread. Only the latest position
+    matters, so positions submitted while a commit is running replace each
+    other and just the last one is committed.
+    """
+
+    def __init__(self, commit_position):
+        self.commit_position = commit_position
+        self._condition = Condition()
+        self._position = None
+        self._has_position = False
+        self._committing = False
+        self._error = None
+        self._thread = Thread(target=self._run, name='persistence-commit')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._has_position:
+                    self._condition.wait()
+                position = self._position
+                self._has_position = False
+                self._committing = True
+            try:
+                self.commit_position(position)
+            except Exception:
+                with self._condition:
+                    self._error = sys.exc_info()
+            finally:
+                with self._condition:
+                    self._committing = False
+                    self._condition.notify_all()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            six.reraise(*error)
+
+    def submit(self, position):
+        with self._condition:
+            self._raise_error()
+            self._position = position
+            self._has_position = True
+            self._condition.notify_all()
+
+    def wait(self):
+        """
+        Blocks until the last submitted position has been committed.
+        """
+        with self._condition:
+            while self._has_position or self._committing:
+                self._condition.wait()
+            self._raise_error()
+
+
 class BasePersistence(BasePipelineItem):
     """
     Base module for persistence modules
+
+    Positions sent with checkpoint() can be coalesced:
+
+        - checkpoint_every_batches (int)
+            Commit the position once every this number of batches
+
+        - checkpoint_interval_seconds (int)
+            Commit the position if this number of seconds have passed since
+            the last commit
+
+        - async_commit (bool)
+            Commit positions in a background thread, so that the pipeline
+            doesn't wait for them. Only the latest position is committed.
+
+    If none of the checkpoint options is set every position is committed.
     """
+    supported_options = {
+        'checkpoint_every_batches': {'type': six.integer_types, 'default': None},
+        'checkpoint_interval_seconds': {'type': six.integer_types, 'default': None},
+        'async_commit': {'type': bool, 'default': False},
+    }
 
     def __init__(self, options, metadata):
         super(BasePersistence, self).__init__(options, metadata)
         self.set_metadata('commited_positions', 0)
+        self.checkpoint_every_batches = self.read_option('checkpoint_every_batches')
+        self.checkpoint_interval_seconds = self.read_option('checkpoint_interval_seconds')
+        self.batches_since_checkpoint = 0
+        self.last_checkpoint_time = time.time()
+        self.pending_checkpoint = None
+        self.committer = None
+        if self.read_option('async_commit'):
+            self.committer = AsyncPositionCommitter(self.commit_position)
         self.configuration = json.loads(options.get('configuration', '{}'))
         self.logger = PersistenceLogger({
             'log_level': options.get('log_level'),
@@ -53,6 +146,69 @@ class BasePersistence(BasePipelineItem):
         """
         raise NotImplementedError
 
+    def append_to_journal(self, entries):
+        """
+        Appends a list of entries (serializable objects) to the journal of
+        the job. Journals let modules save their progress step by step
+        instead of committing their whole state every time.
+        """
+        raise NotImplementedError
+
+    def read_journal(self):
+        """
+        Returns the entries appended to the journal since it was last
+        compacted, in the order they were appended.
+        """
+        raise NotImplementedError
+
+    def compact_journal(self, last_position):
+        """
+        Commits last_position, which must already include the changes stored
+        in the journal, and empties the journal.
+        """
+        raise NotImplementedError
+
+    def _checkpoint_is_due(self):
+        if self.checkpoint_every_batches is None and self.checkpoint_interval_seconds is None:
+            return True
+        if self.checkpoint_every_batches is not None and \
+                self.batches_since_checkpoint >= self.checkpoint_every_batches:
+            return True
+        return (self.checkpoint_interval_seconds is not None and
+                time.time() - self.last_checkpoint_time >= self.checkpoint_interval_seconds)
+
+    def _commit_checkpoint(self, get_last_position):
+        self.batches_since_checkpoint = 0
+        self.last_checkpoint_time = time.time()
+        self.pending_checkpoint = None
+        if self.committer:
+            self.committer.submit(deepcopy(get_last_position()))
+        else:
+            self.commit_position(get_last_position())
+
+    def checkpoint(self, get_last_position):
+        """
+        Called after every written batch with a function returning the
+        position to commit. The position is only built and committed if a
+        checkpoint is due, otherwise it is left for the next checkpoint or
+        for flush_checkpoints().
+        """
+        self.batches_since_checkpoint += 1
+        if self._checkpoint_is_due():
+            self._commit_checkpoint(get_last_position)
+        else:
+            self.pending_checkpoint = get_last_position
+
+    def flush_checkpoints(self):
+        """
+        Commits the position of the last checkpoint, if it was skipped, and
+        waits for the positions being committed in background.
+        """
+        if self.pending_checkpoint is not None:
+            self._commit_checkpoint(self.pending_checkpoint)
+        if self.committer:
+            self.committer.wait()
+
     def generate_new_job(self):
         """
         Creates and instantiates all that is needed to keep
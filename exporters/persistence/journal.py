@@ -0,0 +1,52 @@
+"""
+Helpers to keep the state of long running modules (like bypasses) with an
+append-only journal instead of committing the whole state on every step.
+"""
+
+# Number of journal entries after which the journal is folded into a new
+# snapshot of the state
+JOURNAL_COMPACTION_INTERVAL = 1000
+
+
+class JournaledState(object):
+    """
+    Stores a state as a snapshot, committed as the position of a persistence
+    module, plus a journal with the entries appended since the snapshot was
+    taken. Every compaction_interval entries the journal is compacted: the
+    current snapshot is committed and the journal is emptied.
+
+    Resuming a job means loading the last snapshot and replaying the journal
+    entries on top of it, so replaying an entry already included in the
+    snapshot must have no effect.
+    """
+
+    def __init__(self, persistence, compaction_interval=JOURNAL_COMPACTION_INTERVAL):
+        self.persistence = persistence
+        self.compaction_interval = compaction_interval
+        self.entries_since_compaction = 0
+
+    def load(self):
+        """
+        Returns the last snapshot and the journal entries appended after it.
+        The snapshot is None if the job is new.
+        """
+        snapshot = self.persistence.get_last_position()
+        if not snapshot:
+            return None, []
+        entries = self.persistence.read_journal()
+        self.entries_since_compaction = len(entries)
+        return snapshot, entries
+
+    def append(self, entry, get_snapshot):
+        """
+        Appends entry to the journal. get_snapshot is called to build the new
+        snapshot when the journal has to be compacted.
+        """
+        self.persistence.append_to_journal([entry])
+        self.entries_since_compaction += 1
+        if self.entries_since_compaction >= self.compaction_interval:
+            self.compact(get_snapshot())
+
+    def compact(self, snapshot):
+        self.persistence.compact_journal(snapshot)
+        self.entries_since_compaction = 0
@@ -14,6 +14,9 @@ class PicklePersistence(BasePersistence):
 
         - file_path (str)
             Path to store the pickle file
+
+    Journal entries are appended to a file with the same name and a
+    .journal extension.
     """
     supported_options = {
         'file_path': {'type': six.string_types, 'default': '.'}
@@ -28,6 +31,20 @@ class PicklePersistence(BasePersistence):
     def _get_persistence_file_name(self):
         return os.path.join(self.read_option('file_path'), self.persistence_state_id)
 
+    def _write_persistence_file(self, persistence_object):
+        # Write to a temporary file and rename it, so that a crash never
+        # leaves a truncated persistence file behind
+        file_name = self._get_persistence_file_name()
+        tmp_file_name = file_name + '.tmp'
+        with open(tmp_file_name, 'w') as persistence_file:
+            pickle.dump(persistence_object, persistence_file)
+            persistence_file.flush()
+            os.fsync(persistence_file.fileno())
+        os.rename(tmp_file_name, file_name)
+
+    def _get_journal_file_name(self):
+        return self._get_persistence_file_name() + '.journal'
+
     def get_last_position(self):
         if not os.path.isfile(self._get_persistence_file_name()):
             raise ValueError(
@@ -49,13 +66,42 @@ class PicklePersistence(BasePersistence):
             'last_position': self.last_position,
             'configuration': str(self.configuration)
         }
-        with open(self._get_persistence_file_name(), 'w') as persistence_file:
-            pickle.dump(persistence_object, persistence_file)
+        self._write_persistence_file(persistence_object)
         self.logger.debug('Commited batch number ' + str(self.last_position) + ' of job: ' +
                           self.persistence_state_id)
         self.set_metadata('commited_positions',
                           self.get_metadata('commited_positions') + 1)
 
+    def append_to_journal(self, entries):
+        with open(self._get_journal_file_name(), 'ab') as journal_file:
+            for entry in entries:
+                pickle.dump(entry, journal_file, pickle.HIGHEST_PROTOCOL)
+
+    def read_journal(self):
+        journal_file_name = self._get_journal_file_name()
+        if not os.path.isfile(journal_file_name):
+            return []
+        entries = []
+        with open(journal_file_name, 'r+b') as journal_file:
+            while True:
+                valid_size = journal_file.tell()
+                try:
+                    entries.append(pickle.load(journal_file))
+                except Exception:
+                    # Truncated pickles can fail with almost any exception
+                    break
+            # The job may have died while the last entry was being written:
+            # drop it, so that new entries are not appended after it
+            if valid_size != os.fstat(journal_file.fileno()).st_size:
+                self.logger.warning('Discarding incomplete entry at the end of ' +
+                                    journal_file_name)
+                journal_file.truncate(valid_size)
+        return entries
+
+    def compact_journal(self, last_position):
+        self.commit_position(last_position)
+        remove_if_exists(self._get_journal_file_name())
+
     def generate_new_job(self):
         self.persistence_state_id = str(uuid.uuid4())
         persistence_object = {
@@ -63,8 +109,7 @@ class PicklePersistence(BasePersistence):
             'last_position': None,
             'configuration': str(self.configuration)
         }
-        with open(self._get_persistence_file_name(), 'w') as persistence_file:
-            pickle.dump(persistence_object, persistence_file)
+        self._write_persistence_file(persistence_object)
 
         self.logger.debug('Created persistence pickle file in ' +
                           self.read_option('file_path') + self.persistence_state_id)
@@ -89,3 +134,4 @@ class PicklePersistence(BasePersistence):
 
     def delete(self):
         remove_if_exists(self.persistence_file_name)
+        remove_if_exists(self._get_journal_file_name())
@@ -4,24 +4,36 @@ import ast
 from .exceptions import InvalidExpression
 
 
-def create_context(**kwargs):
-    import datetime
-    import re
-    import itertools
-    import calendar
-    import math
-    import random
-    context = dict(kwargs)
-    context.update(
-        dict(
+_base_context = None
+
+
+def _get_base_context():
+    global _base_context
+    if _base_context is None:
+        import datetime
+        import re
+        import itertools
+        import calendar
+        import math
+        import random
+        _base_context = dict(
             datetime=datetime,
             re=re,
             itertools=itertools,
             calendar=calendar,
             math=math,
             random=random,
-        ),
-    )
+        )
+    return _base_context
+
+
+def create_context(**kwargs):
+    """
+    Returns a new context to evaluate expressions. Contexts can be reused
+    to evaluate expressions for many items, just replacing its item key.
+    """
+    context = dict(kwargs)
+    context.update(_get_base_context())
     return context
 
 
@@ -52,6 +64,10 @@ class Interpreter(object):
         type(None), bool  # others
     )
 
+    def __init__(self):
+        self._compiled = {}
+        self._compiled_batch = {}
+
     def check(self, expression):
         if not isinstance(expression, six.string_types):
             raise InvalidExpression('Python expressions must be defined as strings')
@@ -75,10 +91,50 @@ class Interpreter(object):
 
         self._check_node(start_node)
 
+    def compile(self, expression, check=True):
+        """
+        Returns the code object for expression, checking it only the first
+        time it is compiled. Expressions compiled without check are cached
+        apart, so they are still checked for callers asking for it.
+        """
+        code = self._compiled.get((expression, check))
+        if code is None:
+            if check:
+                self.check(expression)
+            code = compile(expression, '<expression>', 'eval')
+            self._compiled[(expression, check)] = code
+        return code
+
     def eval(self, expression, context=None, check=True):
-        if check:
+        return eval(self.compile(expression, check=check), context)
+
+    def _compile_batch(self, expression):
+        code = self._compiled_batch.get(expression)
+        if code is None:
             self.check(expression)
-        return eval(expression, context)
+            tree = ast.parse(expression, mode='eval')
+            generator = ast.comprehension(
+                target=ast.Name(id='item', ctx=ast.Store()),
+                iter=ast.Name(id='__batch__', ctx=ast.Load()),
+                ifs=[])
+            generator.is_async = 0
+            tree.body = ast.ListComp(elt=tree.body, generators=[generator])
+            code = compile(ast.fix_missing_locations(tree), '<expression>', 'eval')
+            self._compiled_batch[expression] = code
+        return code
+
+    def eval_batch(self, expression, batch, context=None):
+        """
+        Evaluates expression for every item of batch in a single call, binding
+        each of them to item. Returns the list of results.
+        """
+        if context is None:
+            context = create_context()
+        context['__batch__'] = batch
+        try:
+            return eval(self._compile_batch(expression), context)
+        finally:
+            del context['__batch__']
 
     def _check_node(self, node):
         if isinstance(node, list):
@@ -24,7 +24,7 @@ class BaseReader(BasePipelineItem):
     def get_next_batch(self):
         """
         This method is called from the manager. It must return a list or a generator
-        of BaseRecord objects.
+        of BaseRecord objects, or a RecordBatch.
         When it has nothing else to read, it must set class variable "finished" to True.
         """
         raise NotImplementedError
@@ -1,9 +1,90 @@
+import sys
+from collections import deque
+from itertools import islice
+from threading import Event, Thread
+
 import six
+from six.moves.queue import Queue, Full
+
 from exporters.default_retries import retry_generator
 from exporters.readers.base_reader import BaseReader
 from exporters.iterio import cohere_stream
-from exporters.decompressors import ZLibDecompressor
+from exporters.decompressors import RestartPoints, ZLibDecompressor
 from exporters.deserializers import JsonLinesDeserializer
+from exporters.records.record_batch import RecordBatch
+
+
+class StreamPrefetcher(object):
+    """
+    Reads up to max_streams streams at the same time in background threads
+    and returns their items in the same order the streams were given. At
+    most buffer_size items of each stream are kept in memory.
+
+    read_items is a callable receiving a stream and returning an iterable
+    with its items.
+    """
+
+    def __init__(self, read_items, max_streams, buffer_size=1000, poll_interval=0.1):
+        self.read_items = read_items
+        self.max_streams = max_streams
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self._stopped = Event()
+
+    def _put(self, queue, message):
+        while not self._stopped.is_set():
+            try:
+                queue.put(message, timeout=self.poll_interval)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _prefetch(self, stream, queue):
+        items = self.read_items(stream)
+        try:
+            for item in items:
+                if not self._put(queue, ('item', item)):
+                    return
+        except Exception:
+            self._put(queue, ('error', sys.exc_info()))
+            return
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+        self._put(queue, ('end', None))
+
+    def _start(self, stream):
+        queue = Queue(self.buffer_size)
+        thread = Thread(target=self._prefetch, args=(stream, queue))
+        thread.daemon = True
+        thread.start()
+        return stream, queue
+
+    def _iter_queue(self, queue):
+        while True:
+            kind, value = queue.get()
+            if kind == 'end':
+                return
+            elif kind == 'error':
+                six.reraise(*value)
+            yield value
+
+    def iterate(self, streams):
+        """
+        Yields (stream, items) tuples, where items is an iterator that must
+        be consumed before getting the next tuple.
+        """
+        streams = iter(streams)
+        pending = deque(self._start(stream) for stream in islice(streams, self.max_streams))
+        while pending:
+            stream, queue = pending.popleft()
+            yield stream, self._iter_queue(queue)
+            for stream in islice(streams, 1):
+                pending.append(self._start(stream))
+
+    def stop(self):
+        self._stopped.set()
 
 
 class StreamBasedReader(BaseReader):
@@ -17,57 +98,173 @@ class StreamBasedReader(BaseReader):
     Avaliable Options:
         - batch_size (int)
             Number of items to be returned in each batch
+
+        - record_batches (bool)
+            If True, batches are returned as columnar RecordBatch objects
+            instead of generators of records
+
+        - parallel_streams (int)
+            Number of streams to be read and decompressed at the same time
+            in background threads. Items are still returned in the same
+            order the streams are listed.
+
+    Besides the number of items read from a partly read stream, positions
+    keep the compressed byte where it can be reopened (the start of the last
+    gzip member for compressed streams), so resuming a job or retrying a
+    failed stream doesn't read the whole stream again.
     """
 
     # List of options to set up the reader
     supported_options = {
         'batch_size': {'type': six.integer_types, 'default': 10000},
+        'record_batches': {'type': bool, 'default': False},
+        'parallel_streams': {'type': six.integer_types, 'default': 1},
     }
 
     def __init__(self, *args, **kwargs):
         super(StreamBasedReader, self).__init__(*args, **kwargs)
         self.iterator = None
         self.batch_size = self.read_option('batch_size')
+        self.record_batches = self.read_option('record_batches')
+        self.parallel_streams = self.read_option('parallel_streams')
+        # Number of lines rejected by the deserializer line_filter
+        self.rejected_lines = 0
 
     decompressor = ZLibDecompressor({}, None)
     deserializer = JsonLinesDeserializer({}, None)
 
-    @retry_generator
-    def iteritems_retrying(self, stream_data):
-        if stream_data.filename in self.last_position['readed_streams']:
-            return
-        stream = cohere_stream(self.open_stream(stream_data))
+    # Readers whose open_stream() accepts an offset argument, to open streams
+    # at a given byte
+    seekable_streams = False
+
+    def _supports_resume_points(self):
+        return (self.seekable_streams and
+                self.decompressor.supports_restart_points and
+                self.deserializer.supports_byte_offsets)
+
+    def _iter_stream_items(self, stream_data, items_offset, resume_point=None):
+        """
+        Yields (items_readed, item, resume_point) tuples for the items of a
+        stream, skipping the first items_offset ones.
+
+        resume_point is a (compressed offset, decompressed bytes to skip) pair
+        telling where to reopen the stream to read the items after the
+        yielded one, or None if the stream can't be reopened at an offset. If
+        a resume_point is given, the stream is reopened there instead of
+        reading again the first items_offset items.
+        """
+        if not self._supports_resume_points():
+            resume_point = None
+        compressed_offset, skip = resume_point or (0, 0)
+        if compressed_offset:
+            raw_stream = cohere_stream(self.open_stream(stream_data, offset=compressed_offset))
+        else:
+            raw_stream = cohere_stream(self.open_stream(stream_data))
         try:
-            stream = self.decompressor.decompress(stream)
-            stream = cohere_stream(stream)
+            if self._supports_resume_points():
+                restart_points = RestartPoints(compressed_offset)
+                stream = cohere_stream(
+                    self.decompressor.decompress(raw_stream, restart_points=restart_points))
+                stream.seek(skip)
+                items_readed = items_offset if resume_point else 0
+                for item in self.deserializer.deserialize(stream):
+                    items_readed += 1
+                    if items_readed > items_offset:
+                        yield items_readed, item, restart_points.resume_point(stream.tell())
+                return
+            stream = cohere_stream(self.decompressor.decompress(raw_stream))
             items_readed = 0
-            stream_offset = self.last_position['stream_offset']
-            items_offset = stream_offset.get(stream_data.filename, 0)
             for item in self.deserializer.deserialize(stream):
                 items_readed += 1
                 if items_readed > items_offset:
-                    stream_offset[stream_data.filename] = items_readed
-                    yield item
+                    yield items_readed, item, None
         finally:
-            stream.close()
+            raw_stream.close()
+
+    @retry_generator
+    def iteritems_retrying(self, stream_data):
+        if stream_data.filename in self.last_position['readed_streams']:
+            return
+        stream_offset = self.last_position['stream_offset']
+        resume_points = self.last_position['stream_resume_points']
+        items_offset = stream_offset.get(stream_data.filename, 0)
+        resume_point = resume_points.get(stream_data.filename)
+        for items_readed, item, resume_point in self._iter_stream_items(
+                stream_data, items_offset, resume_point):
+            stream_offset[stream_data.filename] = items_readed
+            if resume_point:
+                resume_points[stream_data.filename] = resume_point
+            if item is not None:
+                yield item
+            else:
+                self.rejected_lines += 1
         self.last_position['readed_streams'].append(stream_data.filename)
-        del stream_offset[stream_data.filename]
+        stream_offset.pop(stream_data.filename, None)
+        resume_points.pop(stream_data.filename, None)
+
+    @retry_generator
+    def _prefetch_items_retrying(self, stream_data, state):
+        for items_readed, item, resume_point in self._iter_stream_items(
+                stream_data, state['items_offset'], state['resume_point']):
+            state['items_offset'] = items_readed
+            state['resume_point'] = resume_point
+            yield item, resume_point
+
+    def _prefetch_items(self, stream_data):
+        state = {
+            'items_offset': self.last_position['stream_offset'].get(stream_data.filename, 0),
+            'resume_point': self.last_position['stream_resume_points'].get(stream_data.filename),
+        }
+        return self._prefetch_items_retrying(stream_data, state)
+
+    def _iteritems_prefetching(self):
+        readed_streams = self.last_position['readed_streams']
+        stream_offset = self.last_position['stream_offset']
+        resume_points = self.last_position['stream_resume_points']
+        streams = (stream for stream in self.get_read_streams()
+                   if stream.filename not in readed_streams)
+        prefetcher = StreamPrefetcher(self._prefetch_items, self.parallel_streams)
+        try:
+            for stream_data, items in prefetcher.iterate(streams):
+                items_readed = stream_offset.get(stream_data.filename, 0)
+                for item, resume_point in items:
+                    items_readed += 1
+                    stream_offset[stream_data.filename] = items_readed
+                    if resume_point:
+                        resume_points[stream_data.filename] = resume_point
+                    if item is not None:
+                        yield item
+                    else:
+                        self.rejected_lines += 1
+                readed_streams.append(stream_data.filename)
+                stream_offset.pop(stream_data.filename, None)
+                resume_points.pop(stream_data.filename, None)
+        finally:
+            prefetcher.stop()
 
     def iteritems(self):
-        for stream in self.get_read_streams():
-            for record in self.iteritems_retrying(stream):
+        if self.parallel_streams > 1:
+            for record in self._iteritems_prefetching():
                 yield record
+        else:
+            for stream in self.get_read_streams():
+                for record in self.iteritems_retrying(stream):
+                    yield record
         self.finished = True
 
     def get_next_batch(self):
         """
         This method is called from the manager. It must return a list or a generator
-        of BaseRecord objects.
+        of BaseRecord objects, or a RecordBatch.
         When it has nothing else to read, it must set class variable "finished" to True.
         """
         if self.iterator is None:
             self.iterator = self.iteritems()
+        if self.record_batches:
+            return RecordBatch.from_records(islice(self.iterator, self.batch_size))
+        return self._iter_batch()
 
+    def _iter_batch(self):
         count = 0
         while count < self.batch_size:
             count += 1
@@ -88,6 +285,7 @@ class StreamBasedReader(BaseReader):
         last_position = last_position or {}
         last_position.setdefault('readed_streams', [])
         last_position.setdefault('stream_offset', {})
+        last_position.setdefault('stream_resume_points', {})
         self.last_position = last_position
 
 
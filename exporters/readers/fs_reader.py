@@ -130,8 +130,13 @@ class FSReader(StreamBasedReader):
             if all(mf(filepath) for mf in match_funcs)
         ]
 
-    def open_stream(self, stream):
-        return open(stream.filename, 'rb')
+    seekable_streams = True
+
+    def open_stream(self, stream, offset=0):
+        file_obj = open(stream.filename, 'rb')
+        if offset:
+            file_obj.seek(offset)
+        return file_obj
 
     def get_read_streams(self):
         for fpath in sorted(self.files):
@@ -1,27 +1,131 @@
 import six
-import httplib
+import json
+import os
 import re
 import datetime
-from six.moves.urllib.request import urlopen
+import sys
+import time
+from collections import deque, namedtuple
+from threading import Thread, local
+from six.moves.urllib.request import Request, urlopen
 from exporters.readers.base_stream_reader import StreamBasedReader
 from exporters.default_retries import retry_short
-from exporters.exceptions import ConfigurationError, InvalidDateRangeError
+from exporters.exceptions import (ConfigurationError, IncompleteDownloadError,
+                                  InvalidDateRangeError)
+from exporters.iterio import IterIO, DEFAULT_CHUNK_SIZE
+from exporters.task_pool import BoundedTaskPool
 import logging
 
 from exporters.utils import get_bucket_name, get_boto_connection
 
 S3_URL_EXPIRES_IN = 1800  # half an hour should be enough
+DEFAULT_LISTING_CACHE_MAX_AGE = 24 * 60 * 60
+DEFAULT_DOWNLOAD_RANGE_SIZE = 16 * 1024 * 1024
 
+# Key attributes returned by bucket listings
+S3KeyInfo = namedtuple('S3KeyInfo', 'name size etag')
 
-def patch_http_response_read(func):
-    def inner(*args):
+
+def iter_response_chunks(response, expected_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the body of an HTTP response in chunks, raising
+    IncompleteDownloadError if its size is not the expected one (for example,
+    when the connection is closed before the whole body is received).
+    """
+    received = 0
+    try:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            received += len(chunk)
+            yield chunk
+    finally:
+        response.close()
+    if received != expected_size:
+        raise IncompleteDownloadError(
+            'Expected {} bytes from {} but got {}'.format(
+                expected_size, response.geturl(), received))
+
+
+@retry_short
+def fetch_range(get_url, start, end):
+    """
+    Downloads the bytes from start to end (both included) of the object
+    whose signed url is returned by get_url.
+    """
+    request = Request(get_url(), headers={'Range': 'bytes={}-{}'.format(start, end)})
+    return ''.join(iter_response_chunks(urlopen(request), end - start + 1))
+
+
+class _RangeFetch(Thread):
+
+    def __init__(self, get_url, start, end):
+        super(_RangeFetch, self).__init__(name='s3-range-{}-{}'.format(start, end))
+        self.daemon = True
+        self.get_url = get_url
+        self.start_byte = start
+        self.end_byte = end
+        self.data = None
+        self.error = None
+
+    def run(self):
         try:
-            return func(*args)
-        except httplib.IncompleteRead, e:
-            return e.partial
+            self.data = fetch_range(self.get_url, self.start_byte, self.end_byte)
+        except Exception:
+            self.error = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            six.reraise(*self.error)
+        return self.data
+
+
+class RangedDownload(object):
+    """
+    Iterator over the bytes from start to end (both included) of an S3
+    object, split in ranges of range_size bytes that are fetched by several
+    threads. Ranges are yielded in order, and at most concurrency ranges are
+    being fetched or waiting to be consumed at the same time, so memory usage
+    is bounded to concurrency * range_size bytes.
+    """
 
-    return inner
-httplib.HTTPResponse.read = patch_http_response_read(httplib.HTTPResponse.read)
+    def __init__(self, get_url, start, end, range_size, concurrency):
+        self.get_url = get_url
+        self.end = end
+        self.range_size = range_size
+        self.concurrency = concurrency
+        self._next_start = start
+        self._fetches = deque()
+
+    def __iter__(self):
+        return self
+
+    def _start_fetches(self):
+        while self._next_start <= self.end and len(self._fetches) < self.concurrency:
+            end = min(self._next_start + self.range_size - 1, self.end)
+            fetch = _RangeFetch(self.get_url, self._next_start, end)
+            fetch.start()
+            self._fetches.append(fetch)
+            self._next_start = end + 1
+
+    def next(self):
+        self._start_fetches()
+        if not self._fetches:
+            raise StopIteration
+        data = self._fetches.popleft().result()
+        self._start_fetches()
+        return data
+
+    __next__ = next
+
+    def close(self):
+        """
+        Stops fetching new ranges. Ranges already being fetched are discarded.
+        """
+        self._next_start = self.end + 1
+        self._fetches.clear()
 
 
 def get_bucket(bucket, aws_access_key_id, aws_secret_access_key, **kwargs):
@@ -53,10 +157,27 @@ def format_prefixes(prefixes, start, end):
 
 
 class S3BucketKeysFetcher(object):
+    """
+    Lists the keys to read from a bucket, keeping the name, size and etag
+    returned by the listing so that no request per key is needed later.
+
+    Prefixes are listed by listing_concurrency threads. If listing_cache_path
+    is set, the listing of every prefix is stored in that file and reused
+    by later runs until it is older than listing_cache_max_age seconds.
+    """
+
     def __init__(self, reader_options, aws_access_key_id, aws_secret_access_key):
+        self.bucket_name = reader_options.get('bucket')
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
         self.source_bucket = get_bucket(
-            reader_options.get('bucket'), aws_access_key_id, aws_secret_access_key)
+            self.bucket_name, aws_access_key_id, aws_secret_access_key)
         self.pattern = reader_options.get('pattern', None)
+        self.listing_concurrency = reader_options.get('listing_concurrency', 1)
+        self.listing_cache_path = reader_options.get('listing_cache_path')
+        self.listing_cache_max_age = reader_options.get('listing_cache_max_age',
+                                                        DEFAULT_LISTING_CACHE_MAX_AGE)
+        self._thread_data = local()
 
         prefix = reader_options.get('prefix', '')
         prefix_pointer = reader_options.get('prefix_pointer', '')
@@ -101,18 +222,79 @@ class S3BucketKeysFetcher(object):
     def _fetch_prefixes_from_pointer(self, prefix_pointer):
         return filter(None, self._download_pointer(prefix_pointer).splitlines())
 
+    def _get_thread_bucket(self):
+        # boto connections are not thread safe, so every listing thread uses
+        # its own one
+        bucket = getattr(self._thread_data, 'bucket', None)
+        if bucket is None:
+            bucket = self._thread_data.bucket = get_bucket(
+                self.bucket_name, self.aws_access_key_id, self.aws_secret_access_key)
+        return bucket
+
+    @retry_short
+    def _list_prefix(self, prefix, bucket):
+        return [S3KeyInfo(key.name, key.size, key.etag.strip('"'))
+                for key in bucket.list(prefix=prefix)]
+
+    def _list_prefixes(self, prefixes):
+        if self.listing_concurrency <= 1 or len(prefixes) <= 1:
+            return [self._list_prefix(prefix, self.source_bucket) for prefix in prefixes]
+        listings = [None] * len(prefixes)
+
+        def list_prefix(index, prefix):
+            listings[index] = self._list_prefix(prefix, self._get_thread_bucket())
+
+        pool = BoundedTaskPool(self.listing_concurrency, name='s3-listing')
+        try:
+            for index, prefix in enumerate(prefixes):
+                pool.submit(list_prefix, index, prefix)
+            pool.wait()
+        finally:
+            pool.close()
+        return listings
+
+    def _load_listing_cache(self):
+        if not self.listing_cache_path or not os.path.isfile(self.listing_cache_path):
+            return {}
+        with open(self.listing_cache_path) as f:
+            return json.load(f)
+
+    def _save_listing_cache(self, cache):
+        tmp_path = self.listing_cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.rename(tmp_path, self.listing_cache_path)
+
+    def _list_keys(self):
+        if not self.listing_cache_path:
+            listings = self._list_prefixes(self.prefixes)
+            return [key for listing in listings for key in listing]
+        cache = self._load_listing_cache()
+        bucket_cache = cache.setdefault(self.bucket_name, {})
+        now = time.time()
+        outdated = [prefix for prefix in self.prefixes
+                    if prefix not in bucket_cache or
+                    now - bucket_cache[prefix]['listed_at'] > self.listing_cache_max_age]
+        if outdated:
+            for prefix, listing in zip(outdated, self._list_prefixes(outdated)):
+                bucket_cache[prefix] = {'listed_at': now, 'keys': listing}
+            self._save_listing_cache(cache)
+        self.logger.info('Reused cached listing of {} of {} prefixes'.format(
+            len(self.prefixes) - len(outdated), len(self.prefixes)))
+        return [S3KeyInfo(*key) for prefix in self.prefixes
+                for key in bucket_cache[prefix]['keys']]
+
     def _get_keys_from_bucket(self):
         keys = []
-        for prefix in self.prefixes:
-            for key in self.source_bucket.list(prefix=prefix):
-                if self.pattern:
-                    if self._should_add_key(key):
-                        keys.append(key.name)
-                    else:
-                        self.logger.info(
-                            'Skipping S3 key {}. No match with pattern'.format(key.name))
+        for key in self._list_keys():
+            if self.pattern:
+                if self._should_add_key(key):
+                    keys.append(key)
                 else:
-                    keys.append(key.name)
+                    self.logger.info(
+                        'Skipping S3 key {}. No match with pattern'.format(key.name))
+            else:
+                keys.append(key)
         if self.pattern and not keys:
             self.logger.warn(
                 'No S3 keys found that match provided pattern: {}'.format(self.pattern))
@@ -121,9 +303,15 @@ class S3BucketKeysFetcher(object):
     def _should_add_key(self, key):
         return bool(re.findall(self.pattern, key.name))
 
-    def pending_keys(self):
+    def pending_keys_info(self):
+        """
+        Returns a list of S3KeyInfo with the keys to read.
+        """
         return self._get_keys_from_bucket()
 
+    def pending_keys(self):
+        return [key.name for key in self._get_keys_from_bucket()]
+
 
 class S3Reader(StreamBasedReader):
     """
@@ -153,6 +341,27 @@ class S3Reader(StreamBasedReader):
             S3 key name pattern (REGEX). All files that don't match this regex string will be
             discarded by the reader.
 
+        - listing_concurrency (int)
+            Number of prefixes listed at the same time. Useful when
+            prefix_format_using_date produces many prefixes.
+
+        - listing_cache_path (str)
+            Path of a local file where the listing of every prefix is stored,
+            so that next runs don't need to list them again.
+
+        - listing_cache_max_age (int)
+            Seconds after which a cached listing is outdated and the prefix
+            is listed again. One day by default.
+
+        - download_concurrency (int)
+            Number of byte ranges of a key that are downloaded at the same
+            time. Keys bigger than download_range_size are split in ranges
+            when it is greater than 1. Memory usage is bounded to
+            download_concurrency * download_range_size bytes per stream.
+
+        - download_range_size (int)
+            Size in bytes of the ranges downloaded concurrently. 16MB by
+            default.
     """
 
     # List of options to set up the reader
@@ -169,7 +378,14 @@ class S3Reader(StreamBasedReader):
         'prefix': {'type': six.string_types + (list,), 'default': ''},
         'prefix_pointer': {'type': six.string_types, 'default': None},
         'pattern': {'type': six.string_types, 'default': None},
-        'prefix_format_using_date': {'type': six.string_types + (tuple, list), 'default': None}
+        'prefix_format_using_date': {'type': six.string_types + (tuple, list), 'default': None},
+        'listing_concurrency': {'type': six.integer_types, 'default': 1},
+        'listing_cache_path': {'type': six.string_types, 'default': None},
+        'listing_cache_max_age': {'type': six.integer_types,
+                                  'default': DEFAULT_LISTING_CACHE_MAX_AGE},
+        'download_concurrency': {'type': six.integer_types, 'default': 1},
+        'download_range_size': {'type': six.integer_types,
+                                'default': DEFAULT_DOWNLOAD_RANGE_SIZE},
     }
 
     def __init__(self, *args, **kwargs):
@@ -184,15 +400,36 @@ class S3Reader(StreamBasedReader):
         self.keys_fetcher = S3BucketKeysFetcher(self.options,
                                                 self.read_option('aws_access_key_id'),
                                                 self.read_option('aws_secret_access_key'))
-        self.keys = self.keys_fetcher.pending_keys()
+        self.keys_info = self.keys_fetcher.pending_keys_info()
+        self.keys = [key.name for key in self.keys_info]
         self.logger.info('S3Reader has been initiated')
 
-    def open_stream(self, stream):
+    seekable_streams = True
+
+    def open_stream(self, stream, offset=0):
         self.logger.info('Opening {}'.format(stream.filename))
-        return urlopen(self.bucket.get_key(stream.filename).generate_url(S3_URL_EXPIRES_IN))
+        # Signing the URL doesn't need the key metadata, so no HEAD request is made
+        key = self.bucket.new_key(stream.filename)
+
+        def get_url():
+            return key.generate_url(S3_URL_EXPIRES_IN)
+
+        concurrency = self.read_option('download_concurrency')
+        range_size = self.read_option('download_range_size')
+        if stream.size is not None and concurrency > 1 and stream.size - offset > range_size:
+            return IterIO(RangedDownload(get_url, offset, stream.size - 1,
+                                         range_size, concurrency))
+        if not offset:
+            response = urlopen(get_url())
+        else:
+            response = urlopen(Request(get_url(), headers={'Range': 'bytes={}-'.format(offset)}))
+        if stream.size is not None:
+            expected_size = stream.size - offset
+        else:
+            expected_size = int(response.info().get('Content-Length'))
+        return IterIO(iter_response_chunks(response, expected_size))
 
     def get_read_streams(self):
         from exporters.bypasses.stream_bypass import Stream
-        for key_name in self.keys:
-            key = self.bucket.get_key(key_name)
-            yield Stream(key_name, key.size, None)
+        for key in self.keys_info:
+            yield Stream(key.name, key.size, None)
@@ -7,9 +7,41 @@ class BaseRecord(dict):
           has been used to group the item
         - group_membership: grouping info. It describes the group membership of the item.
         - formatted: Item serialized to string using the configured formatter.
+        - source: raw JSON line the item was decoded from, or None (see SourcedRecord).
     """
     group_key = []
     group_membership = ()
+    source = None
 
     def __init__(self, *args, **kwargs):
         super(BaseRecord, self).__init__(*args, **kwargs)
+
+
+def _dropping_source(method):
+    def inner(self, *args, **kwargs):
+        self.source = None
+        return method(self, *args, **kwargs)
+    inner.__name__ = method.__name__
+    return inner
+
+
+class SourcedRecord(BaseRecord):
+    """
+    Record keeping in source the raw JSON line it was decoded from, so
+    formatters can write it as it is instead of encoding the item again.
+    The source is dropped when the record is changed. Changes to nested
+    values can't be detected, so sources must only be kept when no module
+    changes the items.
+    """
+
+    def __init__(self, data, source):
+        super(SourcedRecord, self).__init__(data)
+        self.source = source
+
+    __setitem__ = _dropping_source(BaseRecord.__setitem__)
+    __delitem__ = _dropping_source(BaseRecord.__delitem__)
+    clear = _dropping_source(BaseRecord.clear)
+    pop = _dropping_source(BaseRecord.pop)
+    popitem = _dropping_source(BaseRecord.popitem)
+    setdefault = _dropping_source(BaseRecord.setdefault)
+    update = _dropping_source(BaseRecord.update)
@@ -0,0 +1,162 @@
+"""
+Records decoded from JSON lines on demand.
+
+Filters and groupers usually read a couple of fields from every item, so
+decoding the whole line is wasted work for the items they drop. A
+LazyRecord keeps the raw line and decodes its top level fields one by one,
+only as far as needed to find the fields that are read.
+"""
+import json
+import re
+from json import decoder, scanner
+
+from exporters.records.base_record import BaseRecord, SourcedRecord
+from exporters.records.record_batch import MISSING, is_record_batch
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_scan_value = scanner.make_scanner(json.JSONDecoder())
+
+
+def _materializing(method):
+    def inner(self, *args, **kwargs):
+        self.materialize()
+        return method(self, *args, **kwargs)
+    inner.__name__ = method.__name__
+    return inner
+
+
+class LazyRecord(SourcedRecord):
+    """
+    Record decoded from a raw JSON line on demand.
+
+    Reading a field (item[key], item.get(key) or key in item) decodes the
+    fields of the line up to the requested one, and keeps the position to
+    continue from there. Any other operation (iterating the record, changing
+    it, pickling it...) decodes the whole line with loads first.
+
+    C code accessing the dict directly (like json.dumps) can't trigger the
+    decoding, so records must be materialized before being transformed or
+    written (see materialize_records). If a line has duplicated keys, reading
+    a field returns its first value instead of the last one.
+    """
+
+    def __init__(self, line, loads, keep_source=False):
+        super(LazyRecord, self).__init__({}, line.rstrip('\r\n') if keep_source else None)
+        self._line = line
+        self._loads = loads
+        self._fields = {}
+        self._position = None
+        self._scanned = False
+        self._materialized = False
+
+    def materialize(self):
+        """
+        Decodes all the fields of the record, so it can be used as a plain dict.
+        """
+        if not self._materialized:
+            self._materialized = True
+            dict.update(self, self._loads(self._line))
+            self._line = self._fields = None
+        return self
+
+    def _scan_to(self, key):
+        """
+        Decodes the fields of the line until key is found, returning its
+        value or MISSING.
+        """
+        line = self._line
+        whitespace = _WHITESPACE.match
+        position = self._position
+        if position is None:
+            position = whitespace(line).end()
+            if line[position:position + 1] != '{':
+                self.materialize()
+                return dict.get(self, key, MISSING)
+            position = whitespace(line, position + 1).end()
+            if line[position:position + 1] == '}':
+                self._scanned = True
+                return MISSING
+        fields = self._fields
+        while True:
+            field, position = decoder.scanstring(line, position + 1, 'utf-8', True)
+            position = whitespace(line, position).end() + 1  # skip ':'
+            value, position = _scan_value(line, whitespace(line, position).end())
+            fields.setdefault(field, value)
+            position = whitespace(line, position).end()
+            if line[position] == '}':
+                self._scanned = True
+            else:
+                position = whitespace(line, position + 1).end()  # skip ','
+            self._position = position
+            if field == key:
+                return value
+            if self._scanned:
+                return MISSING
+
+    def _get_field(self, key):
+        value = self._fields.get(key, MISSING)
+        if value is MISSING and not self._scanned:
+            value = self._scan_to(key)
+        return value
+
+    def __getitem__(self, key):
+        if self._materialized:
+            return dict.__getitem__(self, key)
+        value = self._get_field(key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if self._materialized:
+            return dict.get(self, key, default)
+        value = self._get_field(key)
+        return default if value is MISSING else value
+
+    def __contains__(self, key):
+        if self._materialized:
+            return dict.__contains__(self, key)
+        return self._get_field(key) is not MISSING
+
+    def has_key(self, key):
+        return key in self
+
+    def __reduce_ex__(self, protocol):
+        self.materialize()
+        state = {name: value for name, value in vars(self).items()
+                 if name in ('group_key', 'group_membership', 'source')}
+        return BaseRecord, (dict(self),), state
+
+    __iter__ = _materializing(SourcedRecord.__iter__)
+    __len__ = _materializing(SourcedRecord.__len__)
+    __eq__ = _materializing(SourcedRecord.__eq__)
+    __ne__ = _materializing(SourcedRecord.__ne__)
+    __repr__ = _materializing(SourcedRecord.__repr__)
+    keys = _materializing(SourcedRecord.keys)
+    values = _materializing(SourcedRecord.values)
+    items = _materializing(SourcedRecord.items)
+    copy = _materializing(SourcedRecord.copy)
+    __setitem__ = _materializing(SourcedRecord.__setitem__)
+    __delitem__ = _materializing(SourcedRecord.__delitem__)
+    clear = _materializing(SourcedRecord.clear)
+    pop = _materializing(SourcedRecord.pop)
+    popitem = _materializing(SourcedRecord.popitem)
+    setdefault = _materializing(SourcedRecord.setdefault)
+    update = _materializing(SourcedRecord.update)
+    if hasattr(dict, 'iteritems'):
+        iterkeys = _materializing(SourcedRecord.iterkeys)
+        itervalues = _materializing(SourcedRecord.itervalues)
+        iteritems = _materializing(SourcedRecord.iteritems)
+        viewkeys = _materializing(SourcedRecord.viewkeys)
+        viewvalues = _materializing(SourcedRecord.viewvalues)
+        viewitems = _materializing(SourcedRecord.viewitems)
+
+
+def materialize_records(batch):
+    """
+    Returns the batch with its lazy records fully decoded, to be handed to
+    modules that may use them as plain dicts.
+    """
+    if is_record_batch(batch):
+        return batch
+    return (item.materialize() if isinstance(item, LazyRecord) else item for item in batch)
@@ -0,0 +1,138 @@
+import six
+
+from exporters.records.base_record import BaseRecord
+
+
+class _Missing(object):
+    """
+    Marks a field that is not present in a record. It is pickled by
+    reference, so it keeps being the same object in worker processes.
+    """
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+class RecordBatch(object):
+    """
+    Columnar representation of a batch of records. Every field is stored
+    as a list of values, one per record, using MISSING for the records that
+    don't have that field.
+
+    Pipeline modules can work on whole columns instead of iterating the
+    records one by one. Iterating a RecordBatch yields BaseRecord objects,
+    so modules that don't know about columns keep working unchanged.
+
+    fields:
+        - columns: dict mapping field names to lists of values.
+        - group_key: grouping info shared by all the records of the batch.
+        - group_memberships: list with the group membership of every record,
+          or None if the batch has not been grouped.
+    """
+
+    def __init__(self, columns=None, length=None):
+        self.columns = columns or {}
+        if length is None:
+            length = len(next(iter(self.columns.values()))) if self.columns else 0
+        self.length = length
+        self.group_key = []
+        self.group_memberships = None
+
+    @classmethod
+    def from_records(cls, records):
+        columns = {}
+        length = 0
+        for record in records:
+            for field in record:
+                if field not in columns:
+                    columns[field] = [MISSING] * length
+            for field, values in six.iteritems(columns):
+                values.append(record.get(field, MISSING))
+            length += 1
+        return cls(columns, length)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self):
+        columns = list(six.iteritems(self.columns))
+        for index in range(self.length):
+            record = BaseRecord()
+            for field, values in columns:
+                value = values[index]
+                if value is not MISSING:
+                    record[field] = value
+            if self.group_memberships is not None:
+                record.group_key = self.group_key
+                record.group_membership = self.group_memberships[index]
+            yield record
+
+    def column(self, field):
+        """
+        Returns the list of values of a top level field.
+        """
+        values = self.columns.get(field)
+        if values is None:
+            return [MISSING] * self.length
+        return values
+
+    def nested_column(self, path):
+        """
+        Returns the list of values found following path (a list of keys)
+        from every record. MISSING is returned for the records where any of
+        the keys can't be found.
+        """
+        values = self.column(path[0])
+        for key in path[1:]:
+            values = [
+                value.get(key, MISSING) if isinstance(value, dict) else MISSING
+                for value in values
+            ]
+        return values
+
+    def take(self, mask):
+        """
+        Returns a new RecordBatch with the records for which mask is true.
+        """
+        return self.select([index for index, keep in enumerate(mask) if keep])
+
+    def select(self, indexes):
+        """
+        Returns a new RecordBatch with the records in the given positions.
+        """
+        columns = {
+            field: [values[index] for index in indexes]
+            for field, values in six.iteritems(self.columns)
+        }
+        batch = RecordBatch(columns, len(indexes))
+        batch.group_key = self.group_key
+        if self.group_memberships is not None:
+            batch.group_memberships = [self.group_memberships[index] for index in indexes]
+        return batch
+
+    def set_group_memberships(self, group_key, memberships):
+        self.group_key = group_key
+        self.group_memberships = list(memberships)
+
+
+def is_record_batch(batch):
+    return isinstance(batch, RecordBatch)
+
+
+def materialize_batch(batch):
+    """
+    Returns a batch that can be iterated more than once, keeping columnar
+    batches as they are.
+    """
+    if is_record_batch(batch):
+        return batch
+    return list(batch)
@@ -1,3 +1,4 @@
+import datetime
 import json
 from collections import OrderedDict
 from exporters.stats_managers.basic_stats_manager import BasicStatsManager
@@ -6,7 +7,8 @@ from exporters.stats_managers.basic_stats_manager import BasicStatsManager
 class LoggingStatsManager(BasicStatsManager):
     """
     This stats manager prints a log message with useful stats and times for every
-    pipeline iteration.
+    pipeline iteration. Entries that are not timestamps (like the per stage stats
+    reported in threaded mode) are logged as they are.
     """
 
     def iteration_report(self, times):
@@ -14,6 +16,9 @@ class LoggingStatsManager(BasicStatsManager):
         times.pop('started')
         data = OrderedDict()
         for field, value in times.iteritems():
-            data[field] = (value - prev).total_seconds()
-            prev = value
+            if isinstance(value, datetime.datetime):
+                data[field] = (value - prev).total_seconds()
+                prev = value
+            else:
+                data[field] = value
         self.logger.info(json.dumps(data))
@@ -0,0 +1,123 @@
+"""
+Helpers to run slow I/O tasks (like uploads) in background threads with
+bounded resources.
+"""
+import sys
+from threading import BoundedSemaphore, Condition, Event, Lock, Thread
+
+import six
+from six.moves.queue import Queue
+
+
+class BoundedTaskPool(object):
+    """
+    Runs tasks in a fixed number of worker threads.
+
+    At most max_pending tasks can be waiting or running at the same time:
+    submit() blocks when that limit is reached, so whoever produces the
+    tasks is slowed down instead of piling them up. If a task fails, the
+    pending ones are skipped and the error is raised by the next call to
+    submit() or wait().
+    """
+
+    def __init__(self, workers, max_pending=None, name='task-pool'):
+        self.workers = workers
+        self.max_pending = max_pending or workers
+        self.name = name
+        self._tasks = Queue()
+        self._pending = BoundedSemaphore(self.max_pending)
+        self._cancelled = Event()
+        self._error = None
+        self._error_lock = Lock()
+        self._threads = []
+
+    def _start(self):
+        for number in range(self.workers):
+            thread = Thread(target=self._work, name='{}-{}'.format(self.name, number))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            try:
+                if task is None:
+                    return
+                if not self._cancelled.is_set():
+                    func, args, kwargs = task
+                    func(*args, **kwargs)
+            except Exception:
+                with self._error_lock:
+                    if self._error is None:
+                        self._error = sys.exc_info()
+                self._cancelled.set()
+            finally:
+                if task is not None:
+                    self._pending.release()
+                self._tasks.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            six.reraise(*self._error)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules func(*args, **kwargs) to be run by a worker, blocking while
+        there are max_pending tasks waiting or running.
+        """
+        self._raise_error()
+        if not self._threads:
+            self._start()
+        self._pending.acquire()
+        self._tasks.put((func, args, kwargs))
+
+    def wait(self):
+        """
+        Blocks until all the submitted tasks are done.
+        """
+        self._tasks.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Skips the tasks that have not been started yet and stops the workers.
+        """
+        self._cancelled.set()
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class ByteBudget(object):
+    """
+    Limits the number of bytes held at the same time by several threads.
+
+    acquire() blocks until the requested bytes fit in the budget. Requests
+    bigger than the whole budget are reduced to it, so they wait until
+    nobody else holds any bytes instead of waiting forever.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.available = size
+        self._condition = Condition()
+
+    def acquire(self, size):
+        """
+        Takes size bytes from the budget and returns the number of bytes that
+        have to be released later.
+        """
+        size = min(size, self.size)
+        with self._condition:
+            while self.available < size:
+                self._condition.wait()
+            self.available -= size
+        return size
+
+    def release(self, size):
+        with self._condition:
+            self.available += size
+            self._condition.notify_all()
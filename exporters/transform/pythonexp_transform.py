@@ -21,13 +21,17 @@ class PythonexpTransform(BaseTransform):
         if not self.is_valid_python_expression(self.python_expressions):
             raise ValueError('Python expression is not valid')
         self.interpreter = Interpreter()
+        for expression in self.python_expressions:
+            self.interpreter.check(expression)
+        self.context = create_context()
         self.logger.info('PythonexpTransform has been initiated. Expressions: {!r}'.format(
             self.python_expressions)
         )
 
     def transform_batch(self, batch):
+        context = self.context
         for item in batch:
-            context = create_context(item=item)
+            context['item'] = item
             for expression in self.python_expressions:
                 self.interpreter.eval(expression, context=context)
             yield item
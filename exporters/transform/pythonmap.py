@@ -15,10 +15,11 @@ class PythonMapTransform(BaseTransform):
         self.map_expression = self.read_option('map')
         self.interpreter = Interpreter()
         self.interpreter.check(self.map_expression)
+        self.context = create_context()
 
     def _map_item(self, it):
-        context = create_context(item=it)
-        return self.interpreter.eval(expression=self.map_expression, context=context)
+        self.context['item'] = it
+        return self.interpreter.eval(expression=self.map_expression, context=self.context)
 
     def transform_batch(self, batch):
         return (self._map_item(it) for it in batch)
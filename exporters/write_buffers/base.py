@@ -24,6 +24,9 @@ class WriteBuffer(BasePipelineItem):
         self.hash_algorithm = kwargs.get('hash_algorithm')
         self.items_group_files = kwargs['items_group_files_handler']
         self.compression_format = kwargs.get('compression_format', 'gz')
+        self.items_group_files.set_file_hashing(self.hash_algorithm,
+                                                kwargs.get('multipart_part_size'))
+        self.items_group_files.set_max_open_files(kwargs.get('max_open_files'))
         self.is_new_buffer = True
 
     def buffer(self, item):
@@ -36,6 +39,22 @@ class WriteBuffer(BasePipelineItem):
         self.grouping_info.ensure_group_info(key)
         self.items_group_files.add_item_to_file(item, key)
 
+    def buffer_items(self, items, key):
+        """
+        Receive a list of items (or a RecordBatch) of the given group key
+        and write them at once.
+        """
+        self.grouping_info.ensure_group_info(key)
+        self.items_group_files.add_items_to_file(items, key)
+
+    def items_left_in_buffer(self, key):
+        """
+        Number of items that can still be added to the current buffer of
+        the given group key before it has to be written.
+        """
+        buffered_items = self.grouping_info.get(key, {}).get('buffered_items', 0)
+        return self.items_per_buffer_write - buffered_items
+
     def finish_buffer_write(self, key):
         self.items_group_files.end_group_file(key)
 
@@ -44,17 +63,27 @@ class WriteBuffer(BasePipelineItem):
         (by gathering statistics).
         """
         self.finish_buffer_write(key)
-        file_path = self.items_group_files.get_current_buffer_file_for_group(key).path
-        file_hash = None
-        if self.hash_algorithm:
-            file_hash = hash_for_file(file_path, self.hash_algorithm)
+        buffer_file = self.items_group_files.get_current_buffer_file_for_group(key)
+        file_path = buffer_file.path
+        hashing_file = buffer_file.hashing_file
+        if hashing_file is not None:
+            file_size = hashing_file.size
+            file_hash = hashing_file.hexdigest()
+            multipart_etag = hashing_file.multipart_etag()
+        else:
+            # The file could not be hashed while it was written
+            file_size = os.path.getsize(file_path)
+            file_hash = None
+            if self.hash_algorithm:
+                file_hash = hash_for_file(file_path, self.hash_algorithm)
+            multipart_etag = None
 
-        file_size = os.path.getsize(file_path)
         write_info = {
             'number_of_records': self.grouping_info[key]['buffered_items'],
             'file_path': file_path,
             'size': file_size,
             'file_hash': file_hash,
+            'multipart_etag': multipart_etag,
         }
         self.set_metadata_for_file(file_path, **write_info)
         return write_info
@@ -67,8 +96,8 @@ class WriteBuffer(BasePipelineItem):
         remove_if_exists(write_info.get('file_path'))
 
     def should_write_buffer(self, key):
-        if self.size_per_buffer_write and os.path.getsize(
-                self.grouping_info[key]['group_file'][-1].path) >= self.size_per_buffer_write:
+        if self.size_per_buffer_write and (
+                self.grouping_info[key]['group_file'][-1].size >= self.size_per_buffer_write):
             return True
         buffered_items = self.grouping_info[key].get('buffered_items', 0)
         return buffered_items >= self.items_per_buffer_write
@@ -3,11 +3,12 @@ import shutil
 import tempfile
 import uuid
 import re
+from collections import OrderedDict
 from six.moves import UserDict
 
-from exporters.compression import get_compress_file
+from exporters.compression import get_compress_file, get_compress_stream
 
-from .utils import get_filename
+from .utils import get_filename, HashingFile
 
 
 class GroupingInfo(UserDict):
@@ -51,6 +52,10 @@ class GroupingInfo(UserDict):
         self[key]['total_items'] += 1
         self[key]['buffered_items'] += 1
 
+    def add_many_to_group(self, key, count):
+        self[key]['total_items'] += count
+        self[key]['buffered_items'] += count
+
     def reset_key(self, key):
         self[key]['buffered_items'] = 0
 
@@ -59,40 +64,111 @@ class GroupingInfo(UserDict):
 
 
 class BufferFile(object):
+    """Buffer file where the formatted items of a group are written.
+
+    The size of the file is tracked in memory while it is written, so
+    checking it doesn't need any syscall:
+
+    * uncompressed_size is the exact number of bytes written to the file.
+    * size is the number of compressed bytes emitted so far. It doesn't
+      count the data still held inside the compressor (up to one deflate
+      block for gzip), so it may be lower than the final file size by that
+      amount. Formats that can't be compressed as a stream (zip) report
+      the uncompressed size, which is never lower than the compressed one.
+
+    The compressed output goes through a HashingFile, so its hash and
+    multipart ETag are known once the file is closed, without reading it.
+
+    A file can be closed with suspend() while its group gets no items, to
+    release its handle and compressor state, and resume() opens it again in
+    append mode. Compressed files get a new gzip member (or bz2 stream) for
+    every resume, and they decompress as a single file.
+    """
+
+    hashing_file = None
+    suspended = False
 
     def __init__(self, formatter, tmp_folder, compression_format,
-                 file_name=None, hash_algorithm='md5'):
+                 file_name=None, hash_algorithm='md5', multipart_part_size=None):
         self.formatter = formatter
         self.tmp_folder = tmp_folder
         self.file_extension = formatter.file_extension
         self.compression_format = compression_format
+        self.hash_algorithm = hash_algorithm
+        self.multipart_part_size = multipart_part_size
         self.path = self._get_new_path_name(file_name)
+        self.uncompressed_size = 0
         self.file = self._create_file()
         header = self.formatter.format_header()
         if header:
-            self.file.write(header)
+            self._write(header)
+
+    def _create_file(self, mode='wb'):
+        compress_stream = get_compress_stream(self.compression_format)
+        if compress_stream is None:
+            return get_compress_file(self.compression_format)(self.path)
+        if self.hashing_file is None:
+            self.hashing_file = HashingFile(open(self.path, mode), self.hash_algorithm,
+                                            self.multipart_part_size)
+        else:
+            self.hashing_file.fileobj = open(self.path, mode)
+        return compress_stream(self.hashing_file, self.path)
 
-    def _create_file(self):
-        return get_compress_file(self.compression_format)(self.path)
+    def _close_file(self):
+        self.file.close()
+        if self.hashing_file is not None:
+            self.hashing_file.close()
+
+    def suspend(self):
+        """
+        Closes the file until resume() is called.
+        """
+        if not self.suspended:
+            self._close_file()
+            self.suspended = True
+
+    def resume(self):
+        """
+        Opens again a suspended file, appending to it.
+        """
+        if self.suspended:
+            self.file = self._create_file(mode='ab')
+            self.suspended = False
 
     def _get_new_path_name(self, file_name):
         if not file_name:
             file_name = get_filename(uuid.uuid4(), self.file_extension, self.compression_format)
         return os.path.join(self.tmp_folder, file_name)
 
+    def _write(self, content):
+        self.file.write(content)
+        self.uncompressed_size += len(content)
+
+    @property
+    def size(self):
+        if self.hashing_file is not None:
+            return self.hashing_file.size
+        return self.uncompressed_size
+
     def add_item_to_file(self, item):
         content = self.formatter.format(item)
-        self.file.write(content)
+        self._write(content)
+
+    def add_items_to_file(self, items, add_separator=False):
+        content = self.formatter.format_batch(items)
+        if add_separator:
+            content = self.formatter.item_separator + content
+        self._write(content)
 
     def add_item_separator_to_file(self):
         content = self.formatter.item_separator
-        self.file.write(content)
+        self._write(content)
 
     def end_file(self):
         footer = self.formatter.format_footer()
         if footer:
-            self.file.write(footer)
-        self.file.close()
+            self._write(footer)
+        self._close_file()
 
 
 class GroupingBufferFilesTracker(object):
@@ -101,33 +177,67 @@ class GroupingBufferFilesTracker(object):
 
     Group buffer files are kept inside a temporary folder
     that is cleaned up when calling close().
+
+    If max_open_files is set, at most that many buffer files are kept open:
+    when a group needs to open its file and the limit has been reached, the
+    least recently used file is suspended (see BufferFile), and it's resumed
+    when its group gets more items. The number of suspended and resumed
+    files is kept in evicted_files and reopened_files.
     """
 
+    hash_algorithm = 'md5'
+    multipart_part_size = None
+    max_open_files = None
+
     def __init__(self, formatter, compression_format, **kwargs):
         self.grouping_info = self._create_grouping_info()
         self.file_extension = formatter.file_extension
         self.formatter = formatter
         self.tmp_folder = tempfile.mkdtemp()
         self.compression_format = compression_format
+        self.open_files = OrderedDict()
+        self.evicted_files = 0
+        self.reopened_files = 0
+
+    def set_file_hashing(self, hash_algorithm, multipart_part_size=None):
+        """
+        Sets the hash algorithm and the multipart upload part size used to
+        compute the hashes of the buffer files while they are written.
+        """
+        self.hash_algorithm = hash_algorithm
+        self.multipart_part_size = multipart_part_size
+
+    def set_max_open_files(self, max_open_files):
+        """
+        Sets the maximum number of buffer files kept open at the same time.
+        """
+        self.max_open_files = max_open_files
 
     def add_item_to_file(self, item, key):
-        buffer_file = self.get_current_buffer_file_for_group(key)
+        buffer_file = self._get_open_buffer_file(key)
         buffer_file.add_item_to_file(item)
         self.grouping_info.add_to_group(key)
 
+    def add_items_to_file(self, items, key):
+        buffer_file = self._get_open_buffer_file(key)
+        add_separator = not self.grouping_info.is_first_file_item(key)
+        buffer_file.add_items_to_file(items, add_separator=add_separator)
+        self.grouping_info.add_many_to_group(key, len(items))
+
     def add_item_separator_to_file(self, key):
-        buffer_file = self.get_current_buffer_file_for_group(key)
+        buffer_file = self._get_open_buffer_file(key)
         buffer_file.add_item_separator_to_file()
 
     def end_group_file(self, key):
-        buffer_file = self.get_current_buffer_file_for_group(key)
+        buffer_file = self._get_open_buffer_file(key)
         buffer_file.end_file()
+        self.open_files.pop(key, None)
 
     def close(self):
         shutil.rmtree(self.tmp_folder, ignore_errors=True)
 
     def create_new_group_file(self, key):
-        new_buffer_file = self._create_buffer_file()
+        new_buffer_file = self._open_buffer_file(key)
         self.grouping_info.add_buffer_file_to_group(key, new_buffer_file)
         self.grouping_info.reset_key(key)
         return new_buffer_file
@@ -139,9 +249,42 @@ class GroupingBufferFilesTracker(object):
             buffer_file = self.create_new_group_file(key)
         return buffer_file
 
+    def _get_open_buffer_file(self, key):
+        buffer_file = self.get_current_buffer_file_for_group(key)
+        if self.max_open_files:
+            if buffer_file.suspended:
+                self._close_idle_files(reserved=1)
+                buffer_file.resume()
+                self.reopened_files += 1
+            self._mark_as_used(key, buffer_file)
+        return buffer_file
+
+    def _open_buffer_file(self, key, file_name=None):
+        self._close_idle_files(reserved=1)
+        buffer_file = self._create_buffer_file(file_name=file_name)
+        self._mark_as_used(key, buffer_file)
+        return buffer_file
+
+    def _mark_as_used(self, key, buffer_file):
+        if self.max_open_files:
+            self.open_files.pop(key, None)
+            self.open_files[key] = buffer_file
+
+    def _close_idle_files(self, reserved=0):
+        """
+        Suspends the least recently used files until there is room for
+        reserved more files.
+        """
+        while self.max_open_files and len(self.open_files) + reserved > self.max_open_files:
+            _, buffer_file = self.open_files.popitem(last=False)
+            buffer_file.suspend()
+            self.evicted_files += 1
+
     def _create_grouping_info(self):
         return GroupingInfo()
 
     def _create_buffer_file(self, file_name=None):
         return BufferFile(self.formatter, self.tmp_folder,
-                          self.compression_format, file_name=file_name)
+                          self.compression_format, file_name=file_name,
+                          hash_algorithm=self.hash_algorithm,
+                          multipart_part_size=self.multipart_part_size)
@@ -29,11 +29,13 @@ class ReservoirSamplingGroupingInfo(GroupingInfo):
 class InMemoryBufferFile(BufferFile):
 
     def __init__(self, formatter, tmp_folder, compression_format, sample_size,
-                 file_name=None, hash_algorithm='md5'):
+                 file_name=None, hash_algorithm='md5', multipart_part_size=None):
         self.formatter = formatter
         self.tmp_folder = tmp_folder
         self.file_extension = formatter.file_extension
         self.compression_format = compression_format
+        self.hash_algorithm = hash_algorithm
+        self.multipart_part_size = multipart_part_size
         self.path = self._get_new_path_name(file_name)
         self.sample_size = sample_size
         self.items = []
@@ -63,7 +65,7 @@ class InMemoryBufferFile(BufferFile):
         footer = self.formatter.format_footer()
         if footer:
             self.file.write(footer)
-        self.file.close()
+        self._close_file()
 
     def end_file(self):
         self._dump_items_to_file()
@@ -79,6 +81,10 @@ class ReservoirSamplingGroupingBufferFilesTracker(GroupingBufferFilesTracker):
         super(ReservoirSamplingGroupingBufferFilesTracker, self).__init__(formatter,
                                                                           compression_format)
 
+    def set_max_open_files(self, max_open_files):
+        # Sampled items are kept in memory, files are only open while they are dumped
+        pass
+
     def add_item_to_file(self, item, key):
         buffer_file = self.get_current_buffer_file_for_group(key)
 
@@ -91,12 +97,18 @@ class ReservoirSamplingGroupingBufferFilesTracker(GroupingBufferFilesTracker):
         buffer_file.add_item_to_file(item, position)
         self.grouping_info.add_to_group(key)
 
+    def add_items_to_file(self, items, key):
+        for item in items:
+            self.add_item_to_file(item, key)
+
     def _create_grouping_info(self):
         return ReservoirSamplingGroupingInfo(sample_size=self.sample_size)
 
     def _create_buffer_file(self, file_name=None):
         return InMemoryBufferFile(self.formatter, self.tmp_folder,
-                                  self.compression_format, self.sample_size, file_name=file_name)
+                                  self.compression_format, self.sample_size, file_name=file_name,
+                                  hash_algorithm=self.hash_algorithm,
+                                  multipart_part_size=self.multipart_part_size)
 
 
 class FilebasedReservoirSamplingBufferFilesTracker(FilebasedGroupingBufferFilesTracker,
@@ -14,3 +14,63 @@ def hash_for_file(path, algorithm, block_size=256*128):
         for chunk in iter(lambda: f.read(block_size), b''):
             hash.update(chunk)
     return hash.hexdigest()
+
+
+class HashingFile(object):
+    """
+    Wraps a file open for writing, computing the size, the hash and
+    (if multipart_part_size is given) the S3 multipart ETag of the data
+    written to it, so the file doesn't have to be read again to get them.
+    """
+
+    def __init__(self, fileobj, algorithm='md5', multipart_part_size=None):
+        self.fileobj = fileobj
+        self.algorithm = algorithm
+        self.multipart_part_size = multipart_part_size
+        self.size = 0
+        self._hash = hashlib.new(algorithm) if algorithm else None
+        self._part_hashes = []
+        self._part_left = 0
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.size += len(data)
+        if self._hash is not None:
+            self._hash.update(data)
+        if self.multipart_part_size:
+            self._update_part_hashes(data)
+
+    def _update_part_hashes(self, data):
+        while data:
+            if not self._part_left:
+                self._part_hashes.append(hashlib.md5())
+                self._part_left = self.multipart_part_size
+            if len(data) <= self._part_left:
+                part, data = data, b''
+            else:
+                part, data = data[:self._part_left], data[self._part_left:]
+            self._part_hashes[-1].update(part)
+            self._part_left -= len(part)
+
+    def hexdigest(self):
+        return self._hash.hexdigest() if self._hash is not None else None
+
+    def multipart_etag(self):
+        """
+        Same value returned by exporters.utils.calculate_multipart_etag for
+        the written data and multipart_part_size.
+        """
+        if not self.multipart_part_size:
+            return None
+        digests = b''.join(part_hash.digest() for part_hash in self._part_hashes)
+        return '"{}-{}"'.format(hashlib.md5(digests).hexdigest(), len(self._part_hashes))
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        if not self.fileobj.closed:
+            self.fileobj.close()
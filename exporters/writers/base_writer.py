@@ -1,10 +1,12 @@
 import six
+from collections import OrderedDict
 from exporters.export_formatter import DEFAULT_FORMATTER_CLASS
 from exporters.compression import FILE_COMPRESSION
 from exporters.exceptions import ConfigurationError
 from exporters.logger.base_logger import WriterLogger
 from exporters.module_loader import ModuleLoader
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
+from exporters.records.record_batch import is_record_batch
 
 
 class ItemsLimitReached(Exception):
@@ -37,9 +39,13 @@ class BaseWriter(BasePipelineItem):
         'write_buffer': {'type': six.string_types,
                          'default': 'exporters.write_buffers.base.WriteBuffer'},
         'write_buffer_options': {'type': dict, 'default': {}},
+        'max_open_files': {'type': six.integer_types, 'default': 0},
     }
 
     hash_algorithm = None
+    # Writers implementing write_stream() set it to True if it can be called
+    # from several threads at the same time (see StreamBypass)
+    supports_concurrent_streams = False
 
     def __init__(self, options, metadata, *args, **kwargs):
         super(BaseWriter, self).__init__(options, metadata, *args, **kwargs)
@@ -81,9 +87,19 @@ class BaseWriter(BasePipelineItem):
              'items_group_files_handler': file_handler,
              'compression_format': self.compression_format,
              'hash_algorithm': self.hash_algorithm,
+             'multipart_part_size': self._get_multipart_part_size(),
+             'max_open_files': self.read_option('max_open_files'),
         }
         return module_loader.load_write_buffer(write_buffer_options, self.metadata, **kwargs)
 
+    def _get_multipart_part_size(self):
+        """
+        Part size of the multipart uploads done by the writer, used to compute
+        the multipart ETag of buffer files while they are written. None if the
+        writer doesn't do multipart uploads.
+        """
+        return None
+
     def _items_group_files_handler(self, write_buffer_class, **kwargs):
         return write_buffer_class.group_files_tracker_class(self.export_formatter,
                                                             self.compression_format, **kwargs)
@@ -107,13 +123,43 @@ class BaseWriter(BasePipelineItem):
         Calling this method doesn't guarantee that all items have been written.
         To ensure everything has been written you need to call flush().
         """
-        for item in batch:
-            self.write_buffer.buffer(item)
-            key = self.write_buffer.get_key_from_item(item)
+        for key, items in self._iter_group_chunks(batch):
+            self.write_buffer.buffer_items(items, key)
+            self.increment_written_items(len(items))
             if self.write_buffer.should_write_buffer(key):
                 self._write_current_buffer_for_group_key(key)
-            self.increment_written_items()
-            self._check_items_limit()
+        self._update_open_files_stats()
+        self._check_items_limit()
+
+    def _iter_group_chunks(self, batch):
+        """
+        Splits the batch in chunks of items with the same group key, yielding
+        (key, items) tuples. A chunk is yielded as soon as it fills the current
+        buffer of its group, and no more items than allowed by items_limit are
+        taken from the batch.
+        """
+        if is_record_batch(batch):
+            memberships = batch.group_memberships or [()] * len(batch)
+            entries = ((tuple(membership), index) for index, membership in enumerate(memberships))
+            make_chunk = batch.select
+        else:
+            entries = ((self.write_buffer.get_key_from_item(item), item) for item in batch)
+            make_chunk = list
+        items_left = None
+        if self.items_limit:
+            items_left = self.items_limit - self.get_metadata('items_count')
+        chunks = OrderedDict()
+        for key, entry in entries:
+            chunk = chunks.setdefault(key, [])
+            chunk.append(entry)
+            if len(chunk) >= self.write_buffer.items_left_in_buffer(key):
+                yield key, make_chunk(chunks.pop(key))
+            if items_left is not None:
+                items_left -= 1
+                if items_left <= 0:
+                    break
+        for key, chunk in chunks.items():
+            yield key, make_chunk(chunk)
 
     def _check_items_limit(self):
         """
@@ -126,6 +172,13 @@ class BaseWriter(BasePipelineItem):
     def _should_flush(self, key):
         return self.grouping_info[key].get('buffered_items', 0) > 0
 
+    def wait_for_uploads(self):
+        """
+        Blocks until the buffers handed to write() are in their destination.
+        Writers writing them in the background must override it.
+        """
+        pass
+
     def flush(self):
         """
         Ensure all remaining buffers are written.
@@ -133,6 +186,21 @@ class BaseWriter(BasePipelineItem):
         for key in self.grouping_info.keys():
             if self._should_flush(key):
                 self._write_current_buffer_for_group_key(key)
+        self._update_open_files_stats()
+
+    def _update_open_files_stats(self):
+        """
+        Keeps the eviction stats of the buffer files in the writer metadata,
+        when the number of open buffer files is limited.
+        """
+        files_tracker = self.write_buffer.items_group_files
+        if files_tracker.max_open_files:
+            self.set_metadata('buffer_files', {
+                'max_open_files': files_tracker.max_open_files,
+                'open_files': len(files_tracker.open_files),
+                'evicted_files': files_tracker.evicted_files,
+                'reopened_files': files_tracker.reopened_files,
+            })
 
     def close(self):
         """
@@ -158,8 +226,8 @@ class BaseWriter(BasePipelineItem):
         """
         self.logger.warning('Not checking write consistency')
 
-    def increment_written_items(self):
-        self.set_metadata('items_count', self.get_metadata('items_count') + 1)
+    def increment_written_items(self, count=1):
+        self.set_metadata('items_count', self.get_metadata('items_count') + count)
 
     def _write_current_buffer_for_group_key(self, key):
         """
@@ -180,6 +248,12 @@ class BaseWriter(BasePipelineItem):
         The default implementation calls self._check_write_consistency
         if option check_consistency is True.
         """
+        buffer_files = self.get_metadata('buffer_files')
+        if buffer_files and buffer_files['evicted_files']:
+            self.logger.info(
+                'Buffer files were closed {evicted_files} times to keep at most '
+                '{max_open_files} open, and reopened {reopened_files} times'.format(
+                    **buffer_files))
         if self.read_option('check_consistency'):
             self._check_write_consistency()
 
@@ -51,7 +51,8 @@ class DropboxWriter(FilebaseBaseWriter):
         filebase_path, file_name = self.create_filebase_name(group_key, file_name=file_name)
         with open(dump_path, 'r') as f:
             self._upload_file(f, '{}/{}'.format(filebase_path, file_name))
-        self.get_metadata('files_counter')[filebase_path] += 1
+        with self.metadata_lock:
+            self.get_metadata('files_counter')[filebase_path] += 1
 
     def get_file_suffix(self, path, prefix):
         number_of_keys = self.get_metadata('files_counter').get(path, 0)
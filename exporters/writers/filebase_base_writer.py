@@ -1,10 +1,13 @@
+import copy
 import datetime
 import hashlib
 import os
 import re
 import uuid
 import six
+from threading import Lock, local
 
+from exporters.task_pool import BoundedTaskPool
 from exporters.write_buffers.grouping import GroupingBufferFilesTracker
 from exporters.write_buffers.utils import get_filename
 from exporters.writers.base_writer import BaseWriter
@@ -80,15 +83,23 @@ class FilebasedGroupingBufferFilesTracker(GroupingBufferFilesTracker):
         name_without_ext = self.filebase.formatted_prefix(
                 groups=group_info, file_number=current_file_count)
         file_name = get_filename(name_without_ext, self.file_extension, self.compression_format)
+        if os.path.exists(os.path.join(group_folder, file_name)):
+            # Filebases without file number give the same name to every file
+            # of the group, and the previous one may still be waiting to be
+            # uploaded
+            group_folder = self._create_group_folder()
         file_name = os.path.join(group_folder, file_name)
-        new_buffer_file = self._create_buffer_file(file_name=file_name)
+        new_buffer_file = self._open_buffer_file(key, file_name=file_name)
         self.grouping_info.add_buffer_file_to_group(key, new_buffer_file)
         self.grouping_info.reset_key(key)
         return new_buffer_file
 
     def _get_group_folder(self, group_files):
         if group_files:
-            return os.path.dirname(group_files[0].path)
+            return os.path.dirname(group_files[-1].path)
+        return self._create_group_folder()
+
+    def _create_group_folder(self):
         group_folder = os.path.join(self.tmp_folder, str(uuid.uuid4()))
         os.mkdir(group_folder)
         return group_folder
@@ -101,22 +112,37 @@ class FilebaseBaseWriter(BaseWriter):
     - filebase
         Path to store the exported files
 
+    - upload_concurrency
+        Number of files uploaded at the same time by background workers
+        while items keep being buffered. With the default value (0) files
+        are uploaded synchronously. At most upload_concurrency packed files
+        wait in the temporary folder: when all workers are busy, buffering
+        stops until one of them finishes. Persistence checkpoints wait for the
+        files being uploaded, so the checkpoint_every_batches persistence
+        option lets uploads of several batches overlap.
+
     """
     supported_options = {
         'filebase': {'type': six.string_types},
         'start_file_count': {'type': int, 'default': 0},
-        'generate_md5': {'type': bool, 'default': False}
+        'generate_md5': {'type': bool, 'default': False},
+        'upload_concurrency': {'type': six.integer_types, 'default': 0},
     }
 
     hash_algorithm = 'md5'
 
     def __init__(self, *args, **kwargs):
+        self._thread_data = local()
+        self.metadata_lock = Lock()
         super(FilebaseBaseWriter, self).__init__(*args, **kwargs)
         self.filebase = Filebase(self.read_option('filebase'))
+        upload_concurrency = self.read_option('upload_concurrency')
+        self.upload_pool = None
+        if upload_concurrency > 0:
+            self.upload_pool = BoundedTaskPool(upload_concurrency, name='upload')
         self.set_metadata('effective_filebase', self.filebase.template)
         self.generate_md5 = self.read_option('generate_md5')
         self.written_files = {}
-        self.last_written_file = None
         self.generate_md5 = self.read_option('generate_md5')
         self.logger.info(
                 '{} has been initiated. Writing to: {}'.format(
@@ -151,20 +177,61 @@ class FilebaseBaseWriter(BaseWriter):
             file_name = self.filebase.prefix_template + '.' + extension
         return dirname, file_name
 
+    @property
+    def last_written_file(self):
+        """
+        Destination of the last file written by the current thread.
+        """
+        return getattr(self._thread_data, 'last_written_file', None)
+
+    @last_written_file.setter
+    def last_written_file(self, value):
+        self._thread_data.last_written_file = value
+
     def _write_current_buffer_for_group_key(self, key):
         write_info = self.write_buffer.pack_buffer(key)
+        group_key = self.write_buffer.grouping_info[key]['membership']
+        self.write_buffer.add_new_buffer_for_group(key)
+        if self.upload_pool is None:
+            self._upload_buffer(write_info, group_key)
+        else:
+            self.upload_pool.submit(self._upload_buffer, write_info, group_key)
+
+    def _upload_buffer(self, write_info, group_key):
         file_path = write_info['file_path']
-        self.write(file_path,
-                   self.write_buffer.grouping_info[key]['membership'],
-                   file_name=os.path.basename(file_path))
+        self.write(file_path, group_key, file_name=os.path.basename(file_path))
         self.logger.info(
             'Checksum for file {file_path}: {file_hash}'.format(**write_info))
-        self.written_files[self.last_written_file] = write_info
-
+        with self.metadata_lock:
+            self.written_files[self.last_written_file] = write_info
         self.write_buffer.clean_tmp_files(write_info)
-        self.write_buffer.add_new_buffer_for_group(key)
+
+    def get_all_metadata(self, module='writer'):
+        """
+        Returns a snapshot of the metadata, as upload workers may be changing it.
+        """
+        with self.metadata_lock:
+            return copy.deepcopy(
+                super(FilebaseBaseWriter, self).get_all_metadata(module))
+
+    def wait_for_uploads(self):
+        """
+        Blocks until all the files handed to the upload workers are written.
+        """
+        if self.upload_pool is not None:
+            self.upload_pool.wait()
+
+    def flush(self):
+        super(FilebaseBaseWriter, self).flush()
+        self.wait_for_uploads()
+
+    def close(self):
+        if self.upload_pool is not None:
+            self.upload_pool.close()
+        super(FilebaseBaseWriter, self).close()
 
     def finish_writing(self):
+        self.wait_for_uploads()
         super(FilebaseBaseWriter, self).finish_writing()
         if self.generate_md5:
             try:
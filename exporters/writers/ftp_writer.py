@@ -74,6 +74,15 @@ class FTPWriter(FilebaseBaseWriter):
             self.logger.info('Will create dir: %s' % target)
             self.ftp.mkd(target_dir)
 
+    @property
+    def ftp(self):
+        # Every upload worker thread uses its own connection
+        return getattr(self._thread_data, 'ftp', None)
+
+    @ftp.setter
+    def ftp(self, value):
+        self._thread_data.ftp = value
+
     def build_ftp_instance(self):
         import ftplib
         return ftplib.FTP()
@@ -84,7 +93,8 @@ class FTPWriter(FilebaseBaseWriter):
             'filename': destination,
             'size': buffer_info.get('size'),
         }
-        self.get_metadata('files_written').append(file_info)
+        with self.metadata_lock:
+            self.get_metadata('files_written').append(file_info)
 
     @retry_long
     def write(self, dump_path, group_key=None, file_name=None):
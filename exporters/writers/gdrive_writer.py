@@ -101,7 +101,8 @@ class GDriveWriter(FilebaseBaseWriter):
             'remote_hash': file['md5Checksum'],
             'title': file['title'],
         }
-        self.get_metadata('files_written').append(key_info)
+        with self.metadata_lock:
+            self.get_metadata('files_written').append(key_info)
 
     def _check_write_consistency(self):
         for file_info in self.get_metadata('files_written'):
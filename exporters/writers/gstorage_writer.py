@@ -43,30 +43,46 @@ class GStorageWriter(FilebaseBaseWriter):
         }
     }
 
+    # Every thread writes through its own gcloud client (see bucket)
+    supports_concurrent_streams = True
+
     def __init__(self, options, *args, **kwargs):
-        from gcloud import storage
         super(GStorageWriter, self).__init__(options, *args, **kwargs)
+        creds_opt = self.read_option('credentials')
+        if isinstance(creds_opt, six.string_types):
+            package_name, path = creds_opt.split(':')
+            try:
+                self.credentials = pkg_resources.resource_string(package_name, path)
+            except:
+                self.write_buffer.close()
+                raise
+        else:
+            self.credentials = json.dumps(creds_opt)
+        self.bucket = self._create_bucket()
+        self.set_metadata('files_written', [])
 
-        project = self.read_option('project')
-        bucket_name = self.read_option('bucket')
+    def _create_bucket(self):
+        from gcloud import storage
         with TemporaryDirectory() as temp_dir:
             credentials_file = os.path.join(temp_dir, 'credentials.json')
             with open(credentials_file, 'w') as f:
-                creds_opt = self.read_option('credentials')
-                if isinstance(creds_opt, six.string_types):
-                    package_name, path = creds_opt.split(':')
-                    try:
-                        serialized = pkg_resources.resource_string(package_name, path)
-                    except:
-                        self.write_buffer.close()
-                        raise
-                else:
-                    serialized = json.dumps(creds_opt)
-                f.write(serialized)
-            client = storage.Client.from_service_account_json(credentials_file,
-                                                              project=project)
-        self.bucket = client.bucket(bucket_name)
-        self.set_metadata('files_written', [])
+                f.write(self.credentials)
+            client = storage.Client.from_service_account_json(
+                credentials_file, project=self.read_option('project'))
+        return client.bucket(self.read_option('bucket'))
+
+    @property
+    def bucket(self):
+        # gcloud clients are not thread safe, so every thread (upload
+        # workers, concurrent stream bypass copies) uses its own one
+        bucket = getattr(self._thread_data, 'bucket', None)
+        if bucket is None:
+            bucket = self.bucket = self._create_bucket()
+        return bucket
+
+    @bucket.setter
+    def bucket(self, value):
+        self._thread_data.bucket = value
 
     def _blob_url(self, bucket_name, blob_name):
         return 'https://storage.cloud.google.com/{}/{}'.format(bucket_name, blob_name)
@@ -107,7 +123,8 @@ class GStorageWriter(FilebaseBaseWriter):
             'remote_hash': blob.md5_hash,
             'title': blob.name,
         }
-        self.get_metadata('files_written').append(key_info)
+        with self.metadata_lock:
+            self.get_metadata('files_written').append(key_info)
 
     def _check_write_consistency(self):
         for file_info in self.get_metadata('files_written'):
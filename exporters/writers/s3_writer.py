@@ -1,9 +1,13 @@
 import os
+from base64 import b64encode
+from binascii import unhexlify
 from collections import Counter
 from contextlib import closing, contextmanager
 import six
 from exporters.default_retries import retry_long
+from exporters.exceptions import ConfigurationError
 from exporters.progress_callback import BotoDownloadProgress
+from exporters.task_pool import BoundedTaskPool
 from exporters.utils import CHUNK_SIZE, split_file, calculate_multipart_etag, get_bucket_name, \
                             get_boto_connection
 from exporters.writers.base_writer import InconsistentWriteState
@@ -12,6 +16,9 @@ from exporters.writers.filebase_base_writer import FilebaseBaseWriter
 
 DEFAULT_BUCKET_REGION = 'us-east-1'
 
+# S3 rejects multipart uploads with parts smaller than this (except the last one)
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+
 
 @contextmanager
 def multipart_upload(bucket, key_name, **kwargs):
@@ -24,7 +31,7 @@ def multipart_upload(bucket, key_name, **kwargs):
         raise
 
 
-def should_use_multipart_upload(path, bucket):
+def should_use_multipart_upload(path, bucket, part_size=CHUNK_SIZE):
     from boto.exception import S3ResponseError
     # We need to check if we have READ permissions on this bucket, as they are
     # needed to perform the complete_upload operation.
@@ -35,7 +42,41 @@ def should_use_multipart_upload(path, bucket):
                 break
     except S3ResponseError:
         return False
-    return os.path.getsize(path) > CHUNK_SIZE
+    return os.path.getsize(path) > part_size
+
+
+def bind_multipart_upload(mp, bucket):
+    """
+    Returns the multipart upload mp bound to bucket, so its parts can be
+    uploaded through the connection of another thread.
+    """
+    from boto.s3.multipart import MultiPartUpload
+    if mp.bucket is bucket:
+        return mp
+    bound_mp = MultiPartUpload(bucket)
+    bound_mp.id = mp.id
+    bound_mp.key_name = mp.key_name
+    return bound_mp
+
+
+def upload_file_parts(mp, path, upload_part, part_size=CHUNK_SIZE, concurrency=1):
+    """
+    Uploads the file in path to the multipart upload mp, in parts of
+    part_size bytes. upload_part(mp, chunk) is called for every part, from
+    up to concurrency threads at the same time.
+    """
+    chunks = split_file(path, part_size)
+    if concurrency <= 1:
+        for chunk in chunks:
+            upload_part(mp, chunk)
+        return
+    pool = BoundedTaskPool(concurrency, name='multipart-upload')
+    try:
+        for chunk in chunks:
+            pool.submit(upload_part, mp, chunk)
+        pool.wait()
+    finally:
+        pool.close()
 
 
 class S3Writer(FilebaseBaseWriter):
@@ -61,6 +102,14 @@ class S3Writer(FilebaseBaseWriter):
         - save_metadata (bool)
             Save key's items count as metadata. Default: True
 
+        - multipart_part_size (int)
+            Size in bytes of the parts of multipart uploads, used for files
+            bigger than it. Must be at least 5MB. Default: 50MB
+
+        - multipart_concurrency (int)
+            Number of parts of a multipart upload uploaded at the same time.
+            Default: 1
+
         - filebase
             Path to store the exported files
     """
@@ -77,29 +126,59 @@ class S3Writer(FilebaseBaseWriter):
         'aws_region': {'type': six.string_types, 'default': None},
         'host': {'type': six.string_types, 'default': None},
         'save_pointer': {'type': six.string_types, 'default': None},
-        'save_metadata': {'type': bool, 'default': True, 'required': False}
+        'save_metadata': {'type': bool, 'default': True, 'required': False},
+        'multipart_part_size': {'type': six.integer_types, 'default': CHUNK_SIZE},
+        'multipart_concurrency': {'type': six.integer_types, 'default': 1},
     }
 
     def __init__(self, options, *args, **kwargs):
         super(S3Writer, self).__init__(options, *args, **kwargs)
-        access_key = self.read_option('aws_access_key_id')
-        secret_key = self.read_option('aws_secret_access_key')
+        self.access_key = self.read_option('aws_access_key_id')
+        self.secret_key = self.read_option('aws_secret_access_key')
         self.aws_region = self.read_option('aws_region')
         self.host = self.read_option('host')
-        bucket_name = get_bucket_name(self.read_option('bucket'))
-        self.logger.info('Starting S3Writer for bucket: %s' % bucket_name)
+        self.bucket_name = get_bucket_name(self.read_option('bucket'))
+        self.logger.info('Starting S3Writer for bucket: %s' % self.bucket_name)
 
         if self.aws_region is None:
-            self.aws_region = self._get_bucket_location(access_key, secret_key,
-                                                        bucket_name)
+            self.aws_region = self._get_bucket_location(self.access_key, self.secret_key,
+                                                        self.bucket_name)
 
-        self.conn = get_boto_connection(access_key, secret_key, self.aws_region,
-                                        bucket_name, self.host)
-        self.bucket = self.conn.get_bucket(bucket_name, validate=False)
+        self.bucket = self._create_bucket()
         self.save_metadata = self.read_option('save_metadata')
+        self.multipart_part_size = self.read_option('multipart_part_size')
+        self.multipart_concurrency = self.read_option('multipart_concurrency')
+        if self.multipart_part_size < MIN_MULTIPART_PART_SIZE:
+            raise ConfigurationError('multipart_part_size must be at least {} bytes'.format(
+                MIN_MULTIPART_PART_SIZE))
         self.set_metadata('files_counter', Counter())
         self.set_metadata('keys_written', [])
 
+    def _get_multipart_part_size(self):
+        return self.read_option('multipart_part_size')
+
+    def _create_bucket(self):
+        conn = get_boto_connection(self.access_key, self.secret_key, self.aws_region,
+                                   self.bucket_name, self.host)
+        return conn.get_bucket(self.bucket_name, validate=False)
+
+    @property
+    def bucket(self):
+        # boto connections are not thread safe, so every thread (upload
+        # workers, concurrent multipart uploads) uses its own one
+        bucket = getattr(self._thread_data, 'bucket', None)
+        if bucket is None:
+            bucket = self.bucket = self._create_bucket()
+        return bucket
+
+    @bucket.setter
+    def bucket(self, value):
+        self._thread_data.bucket = value
+
+    @property
+    def conn(self):
+        return self.bucket.connection
+
     def _get_bucket_location(self, access_key, secret_key, bucket):
         try:
             conn = get_boto_connection(access_key, secret_key, bucketname=bucket, host=self.host)
@@ -128,15 +207,32 @@ class S3Writer(FilebaseBaseWriter):
         except S3ResponseError:
             self.logger.warning('We have no READ_ACP/WRITE_ACP permissions')
 
-    def _create_key_metadata(self, dump_path, md5=None):
+    def _get_file_md5(self, dump_path):
+        """
+        Returns the same tuple as boto.utils.compute_md5, taking the hash from
+        the write buffer metadata when it is available.
+        """
         from boto.utils import compute_md5
+        buffer_info = self.write_buffer.get_metadata(dump_path)
+        if buffer_info.get('file_hash'):
+            base64md5 = b64encode(unhexlify(buffer_info['file_hash'])).decode('utf-8')
+            return buffer_info['file_hash'], base64md5, buffer_info['size']
+        with open(dump_path, 'r') as f:
+            return compute_md5(f)
+
+    def _get_multipart_etag(self, dump_path):
+        multipart_etag = self.write_buffer.get_metadata_for_file(dump_path, 'multipart_etag')
+        if multipart_etag:
+            return multipart_etag
+        return calculate_multipart_etag(dump_path, self.multipart_part_size)
+
+    def _create_key_metadata(self, dump_path, md5=None):
         metadata = {}
         metadata['total'] = self._get_total_count(dump_path)
         if md5:
             metadata['md5'] = md5
         else:
-            with open(dump_path, 'r') as f:
-                metadata['md5'] = compute_md5(f)
+            metadata['md5'] = self._get_file_md5(dump_path)
         return metadata
 
     def _save_metadata_for_key(self, key, dump_path, md5=None):
@@ -162,24 +258,33 @@ class S3Writer(FilebaseBaseWriter):
 
     @retry_long
     def _upload_chunk(self, mp, chunk):
+        # A failed attempt may have read part of the chunk already
+        chunk.bytes.seek(0)
+        mp = bind_multipart_upload(mp, self.bucket)
         mp.upload_part_from_file(chunk.bytes, part_num=chunk.number)
 
+    def _upload_part(self, mp, chunk):
+        try:
+            self._upload_chunk(mp, chunk)
+        finally:
+            chunk.bytes.close()
+        self.logger.debug('Uploaded chunk number {}'.format(chunk.number))
+
     def _upload_large_file(self, dump_path, key_name):
         self.logger.debug('Using multipart S3 uploader')
         md5 = None
         if self.save_metadata:
-            md5 = calculate_multipart_etag(dump_path, CHUNK_SIZE)
+            md5 = self._get_multipart_etag(dump_path)
         metadata = self._create_key_metadata(dump_path, md5=md5)
         with multipart_upload(self.bucket, key_name, metadata=metadata) as mp:
-            for chunk in split_file(dump_path):
-                self._upload_chunk(mp, chunk)
-                self.logger.debug(
-                        'Uploaded chunk number {}'.format(chunk.number))
+            upload_file_parts(mp, dump_path, self._upload_part,
+                              part_size=self.multipart_part_size,
+                              concurrency=self.multipart_concurrency)
 
     def _write_s3_key(self, dump_path, key_name):
         destination = 's3://{}/{}'.format(self.bucket.name, key_name)
         self.logger.info('Start uploading {} to {}'.format(dump_path, destination))
-        if should_use_multipart_upload(dump_path, self.bucket):
+        if should_use_multipart_upload(dump_path, self.bucket, self.multipart_part_size):
             self._upload_large_file(dump_path, key_name)
         else:
             self._upload_small_file(dump_path, key_name)
@@ -192,8 +297,9 @@ class S3Writer(FilebaseBaseWriter):
         filebase_path, file_name = self.create_filebase_name(group_key, file_name=file_name)
         key_name = filebase_path + '/' + file_name
         self._write_s3_key(dump_path, key_name)
-        self._update_metadata(dump_path, key_name)
-        self.get_metadata('files_counter')[filebase_path] += 1
+        with self.metadata_lock:
+            self._update_metadata(dump_path, key_name)
+            self.get_metadata('files_counter')[filebase_path] += 1
 
     @retry_long
     def _write_s3_pointer(self, save_pointer, filebase):
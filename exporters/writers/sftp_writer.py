@@ -50,7 +50,8 @@ class SFTPWriter(FilebaseBaseWriter):
             'size': buffer_info.get('size'),
             'number_of_records': buffer_info.get('number_of_records')
         }
-        self.get_metadata('files_written').append(file_info)
+        with self.metadata_lock:
+            self.get_metadata('files_written').append(file_info)
 
     @retry_long
     def write(self, dump_path, group_key=None, file_name=None):
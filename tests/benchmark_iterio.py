@@ -0,0 +1,109 @@
+"""
+Micro-benchmark for IterIO line splitting, measured through
+JsonLinesDeserializer throughput.
+
+Run it from the repository root with:
+
+    python -m tests.benchmark_iterio
+
+Every case is timed with the current IterIO and with OldIterIO, a copy of
+the line reading of IterIO before its chunks were kept in a single
+consumed buffer, which concatenated chunks until finding a new line.
+"""
+import json
+import random
+import string
+import timeit
+from io import BytesIO
+
+from exporters.deserializers import JsonLinesDeserializer
+from exporters.iterio import IterIO
+
+
+def _random_text(length):
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+def _jsonlines(number_of_items, text_length):
+    text = _random_text(text_length)
+    return ''.join(
+        json.dumps({'key': i, 'text': text, 'value': random.random()}) + '\n'
+        for i in range(number_of_items))
+
+
+CASES = [
+    # (name, number of items, length of the text field)
+    ('short lines', 100000, 50),
+    ('1KB lines', 20000, 1000),
+    ('100KB lines', 200, 100000),
+    ('1MB lines', 20, 1000000),
+]
+
+
+class OldIterIO(object):
+    """
+    Line reading of IterIO before it was rewritten, kept to compare with.
+    """
+
+    def __init__(self, file, chunk_size=1024):
+        self._unconsumed = []
+        self._iterator = iter(lambda: file.read(chunk_size), b'')
+
+    def unshift(self, chunk):
+        if chunk:
+            self._unconsumed.append(chunk)
+
+    def next_chunk(self):
+        if self._unconsumed:
+            return self._unconsumed.pop()
+        return next(self._iterator)
+
+    def readline(self):
+        line = ""
+        n_pos = -1
+        try:
+            while n_pos < 0:
+                line += self.next_chunk()
+                n_pos = line.find('\n')
+        except StopIteration:
+            pass
+
+        if n_pos >= 0:
+            line, extra = line[:n_pos+1], line[n_pos+1:]
+            self.unshift(extra)
+        return line
+
+    def iterlines(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+
+def _deserialize(iterio_class, data):
+    deserializer = JsonLinesDeserializer({}, None)
+    for _ in deserializer.deserialize(iterio_class(BytesIO(data))):
+        pass
+
+
+def _throughput(iterio_class, data, size, repeat):
+    seconds = min(timeit.repeat(lambda: _deserialize(iterio_class, data),
+                                number=1, repeat=repeat))
+    return size / seconds
+
+
+def main(repeat=3):
+    random.seed(0)
+    print('{:<14}{:>12}{:>14}{:>14}{:>10}'.format(
+        'case', 'size (MB)', 'old MB/s', 'new MB/s', 'speedup'))
+    for name, number_of_items, text_length in CASES:
+        data = _jsonlines(number_of_items, text_length)
+        size = len(data) / 1024.0 / 1024.0
+        old = _throughput(OldIterIO, data, size, repeat)
+        new = _throughput(IterIO, data, size, repeat)
+        print('{:<14}{:>12.1f}{:>14.1f}{:>14.1f}{:>9.1f}x'.format(
+            name, size, old, new, new / old))
+
+
+if __name__ == '__main__':
+    main()
@@ -201,3 +201,25 @@ class S3AzureBlobBypassTest(unittest.TestCase):
         ]
         self.assertEquals(len(azure_puts), len(keys),
                           "all keys should be put into Azure blobs")
+
+    def test_bypass_concurrently(self):
+        # given:
+        opts = create_s3_azure_blob_bypass_simple_opts(
+            exporter_options={'bypass_concurrency': 3})
+
+        # when:
+        with moto.mock_s3(), mock.patch('azure.storage.blob.BlockBlobService') as azure:
+            s3_conn = boto.connect_s3()
+            bucket = s3_conn.create_bucket(opts['reader']['options']['bucket'])
+            keys = ['some_prefix/key{}'.format(i) for i in range(10)]
+            create_s3_keys(bucket, keys)
+
+            exporter = BasicExporter(opts)
+            exporter.export()
+
+        # then:
+        copied_blobs = [
+            call[1][1] for call in azure.mock_calls if call[0] == '().copy_blob'
+        ]
+        self.assertEquals(sorted(copied_blobs), sorted(k.split('/')[-1] for k in keys),
+                          "all keys should be put into Azure blobs")
@@ -1,6 +1,7 @@
 import datetime
 import json
 import shutil
+import threading
 import unittest
 from contextlib import closing
 import boto
@@ -13,8 +14,9 @@ from tests.utils import environment
 from boto.utils import compute_md5
 from exporters.bypasses.s3_to_s3_bypass import S3Bypass
 from exporters.exporter_config import ExporterConfig
+from exporters.persistence.pickle_persistence import PicklePersistence
 from exporters.utils import remove_if_exists, TmpFile
-from .utils import meta
+from .utils import meta, serialized
 
 
 def create_fake_key():
@@ -127,6 +129,7 @@ class S3BypassTest(unittest.TestCase):
     def tearDown(self):
         self.mock_s3.stop()
         remove_if_exists(self.tmp_bypass_resume_file)
+        remove_if_exists(self.tmp_bypass_resume_file + '.journal')
 
     def test_copy_bypass_s3(self):
         # given
@@ -189,6 +192,62 @@ class S3BypassTest(unittest.TestCase):
             key.metadata = {'total': 2}
             key.set_contents_from_string(json.dumps(data))
 
+    def test_copy_bypass_s3_concurrently(self):
+        # given
+        self._create_and_populate_bucket('concurrent_bucket', number_of_items=20)
+        self.s3_conn.create_bucket('concurrent_dest_bucket')
+        options = create_s3_bypass_simple_config(exporter_options={'bypass_concurrency': 4})
+        options.reader_options['options']['bucket'] = 'concurrent_bucket'
+        options.writer_options['options']['bucket'] = 'concurrent_dest_bucket'
+
+        # when:
+        with closing(S3Bypass(options, meta())) as bypass:
+            bypass.execute()
+            state = bypass.bypass_state
+
+        # then:
+        bucket = self.s3_conn.get_bucket('concurrent_dest_bucket')
+        expected_keys = ['some_prefix/key{}'.format(i) for i in range(1, 21)]
+        self.assertEqual(sorted(k.name for k in bucket.list('some_prefix/')),
+                         sorted(expected_keys))
+        self.assertEqual(bypass.total_items, 40)
+        self.assertEqual(bypass.get_metadata('items_count'), 40)
+        self.assertEqual(state.stats['total_count'], 40)
+        self.assertTrue(bypass.valid_total_count)
+        self.assertEqual(len(bypass.get_metadata('keys_written')), 20)
+        self.assertEqual(state.pending, [])
+        self.assertEqual(sorted(state.done), sorted(expected_keys))
+
+    def test_copy_threads_use_their_own_connections(self):
+        # given
+        self._create_and_populate_bucket('threads_bucket', number_of_items=12)
+        self.s3_conn.create_bucket('threads_dest_bucket')
+        options = create_s3_bypass_simple_config(exporter_options={'bypass_concurrency': 3})
+        options.reader_options['options']['bucket'] = 'threads_bucket'
+        options.writer_options['options']['bucket'] = 'threads_dest_bucket'
+        used_buckets = {}
+
+        # when:
+        with closing(S3Bypass(options, meta())) as bypass:
+            ensure_copy_key = serialized(bypass._ensure_copy_key)
+
+            def record_buckets(dest_bucket, dest_key_name, source_bucket, key_name):
+                buckets = used_buckets.setdefault(threading.current_thread().name, set())
+                buckets.update([dest_bucket, source_bucket])
+                ensure_copy_key(dest_bucket, dest_key_name, source_bucket, key_name)
+
+            with mock.patch.object(bypass, '_ensure_copy_key', record_buckets):
+                bypass.execute()
+
+        # then:
+        self.assertTrue(all(name.startswith('bypass') for name in used_buckets))
+        self.assertTrue(all(len(buckets) == 2 for buckets in used_buckets.values()))
+        connections = set(id(bucket.connection)
+                          for buckets in used_buckets.values() for bucket in buckets)
+        self.assertEqual(len(connections), 2 * len(used_buckets))
+        bucket = self.s3_conn.get_bucket('threads_dest_bucket')
+        self.assertEqual(len(list(bucket.list('some_prefix/'))), 12)
+
     def test_resume_bypass(self):
         # given
         options = create_s3_bypass_simple_config()
@@ -223,6 +282,36 @@ class S3BypassTest(unittest.TestCase):
         self.assertEquals(expected_final_keys, bucket_keynames)
         self.assertEquals(bypass.total_items, 6, 'Wrong number of items written')
 
+    def test_resume_bypass_replays_journal(self):
+        # given
+        options = create_s3_bypass_simple_config()
+        options.reader_options['options']['bucket'] = 'resume_bucket'
+        options.writer_options['options']['bucket'] = 'resume_dest_bucket'
+        options.persistence_options.update(
+            resume=True,
+            persistence_state_id='tmp_s3_bypass_resume_persistence.pickle'
+        )
+        options.persistence_options['options']['file_path'] = 'tests/data/'
+        # key2 was copied after the last compaction of the state
+        persistence = PicklePersistence(options.persistence_options, meta())
+        persistence.append_to_journal([
+            dict(key='some_prefix/key2', stats={'total_count': 4})])
+        self._create_and_populate_bucket('resume_bucket')
+        self.s3_conn.create_bucket('resume_dest_bucket')
+
+        # when:
+        with closing(S3Bypass(options, meta())) as bypass:
+            bypass.execute()
+            state = bypass.bypass_state
+
+        # then:
+        dest_bucket = self.s3_conn.get_bucket('resume_dest_bucket')
+        self.assertEqual([k.name for k in dest_bucket.list('some_prefix/')],
+                         ['some_prefix/key3'])
+        self.assertEqual(bypass.total_items, 6)
+        self.assertEqual(state.skipped, ['some_prefix/key1', 'some_prefix/key2'])
+        self.assertEqual(state.pending, [])
+
     def test_filebase_format_bypass(self):
         # given
         writer = {
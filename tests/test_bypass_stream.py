@@ -1,14 +1,18 @@
+import os
 import shutil
+import tempfile
+import threading
 import unittest
 from contextlib import closing
 
 import mock
 from six import BytesIO
-from exporters.bypasses.stream_bypass import StreamBypass, Stream
+from exporters.bypasses.stream_bypass import StreamBypass, StreamBypassState, Stream
 from exporters.exporter_config import ExporterConfig
+from exporters.persistence.pickle_persistence import PicklePersistence
 from exporters.utils import remove_if_exists
 from exporters.iterio import IterIO
-from .utils import meta
+from .utils import meta, StreamRecorderWriter
 
 
 def create_stream_bypass_simple_config(**kwargs):
@@ -93,6 +97,7 @@ class StreamBypassTest(unittest.TestCase):
 
     def tearDown(self):
         remove_if_exists(self.data_dir + self.tmp_bypass_resume_file)
+        remove_if_exists(self.data_dir + self.tmp_bypass_resume_file + '.journal')
 
     @mock.patch('gcloud.storage.Client')
     @mock.patch('boto.connect_s3')
@@ -148,3 +153,159 @@ class StreamBypassTest(unittest.TestCase):
         write_stream_mock.assert_called_once_with(stream_b, file_obj_b)
         assert bypass.bypass_state.stats['bytes_copied'] == 100,\
             'Wrong number of bytes written'
+
+    @mock.patch('gcloud.storage.Client')
+    @mock.patch('boto.connect_s3')
+    @mock.patch('exporters.readers.s3_reader.S3Reader.get_read_streams')
+    @mock.patch('exporters.readers.s3_reader.S3Reader.open_stream')
+    @mock.patch('exporters.writers.gstorage_writer.GStorageWriter.write_stream')
+    def test_resume_bypass_replays_journal(self, write_stream_mock, open_stream_mock,
+                                           get_streams_mock, *othermocks):
+        # given
+        options = create_stream_bypass_simple_config()
+        options.persistence_options.update(
+            resume=True,
+            persistence_state_id=self.tmp_bypass_resume_file
+        )
+        options.persistence_options['options']['file_path'] = self.data_dir
+        file_len = 50
+        file_obj_c = IterIO(BytesIO('c'*file_len))
+        stream_a = Stream('file_a', file_len, None)
+        stream_b = Stream('file_b', file_len, None)
+        stream_c = Stream('file_c', file_len, None)
+        get_streams_mock.return_value = [stream_a, stream_b, stream_c]
+        open_stream_mock.return_value = file_obj_c
+        # file_b was copied after the last compaction of the state
+        persistence = PicklePersistence(options.persistence_options, meta())
+        persistence.append_to_journal([dict(stream=stream_b, stats={'bytes_copied': 100})])
+
+        # when:
+        with closing(StreamBypass(options, meta())) as bypass:
+            bypass.execute()
+
+        # then:
+        write_stream_mock.assert_called_once_with(stream_c, file_obj_c)
+        self.assertEqual(bypass.bypass_state.stats['bytes_copied'], 150)
+
+    @mock.patch('gcloud.storage.Client')
+    @mock.patch('boto.connect_s3')
+    @mock.patch('exporters.readers.s3_reader.S3Reader.get_read_streams')
+    @mock.patch('exporters.readers.s3_reader.S3Reader.open_stream')
+    @mock.patch('exporters.writers.gstorage_writer.GStorageWriter.write_stream')
+    def test_bypass_stream_concurrently(self, write_stream_mock, open_stream_mock,
+                                        get_read_streams_mock, *othermocks):
+        # given
+        streams = [Stream('file_{}'.format(i), 10 * i, None) for i in range(1, 11)]
+        get_read_streams_mock.return_value = streams
+        open_stream_mock.side_effect = lambda stream: IterIO(BytesIO('a' * stream.size))
+        options = create_stream_bypass_simple_config(exporter_options={
+            'stream_bypass_concurrency': 4,
+            'stream_bypass_memory_budget': 150,
+        })
+
+        # when:
+        with closing(StreamBypass(options, meta())) as bypass:
+            bypass.execute()
+
+        # then:
+        written = sorted(args[0] for args, kwargs in write_stream_mock.call_args_list)
+        self.assertEqual(written, sorted(streams))
+        self.assertEqual(bypass.bypass_state.stats['bytes_copied'], 550)
+
+
+class StreamBypassConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_folder = tempfile.mkdtemp()
+        self.input_folder = os.path.join(self.tmp_folder, 'input')
+        os.mkdir(self.input_folder)
+        self.contents = {}
+        for i in range(1, 11):
+            path = os.path.join(self.input_folder, 'file_{}'.format(i))
+            with open(path, 'w') as f:
+                f.write(chr(ord('a') + i) * 10 * i)
+            self.contents[path] = chr(ord('a') + i) * 10 * i
+        StreamRecorderWriter.streams.clear()
+
+    def tearDown(self):
+        StreamRecorderWriter.streams.clear()
+        shutil.rmtree(self.tmp_folder)
+
+    def _create_config(self, writer_name):
+        return create_stream_bypass_simple_config(
+            reader={
+                'name': 'exporters.readers.fs_reader.FSReader',
+                'options': {'input': {'dir': self.input_folder}}
+            },
+            writer={'name': writer_name},
+            persistence={
+                'name': 'exporters.persistence.pickle_persistence.PicklePersistence',
+                'options': {'file_path': self.tmp_folder}
+            },
+            exporter_options={
+                'stream_bypass_concurrency': 4,
+                'stream_bypass_memory_budget': 150,
+            })
+
+    def test_bypass_stream_concurrently(self):
+        # given
+        options = self._create_config('tests.utils.StreamRecorderWriter')
+
+        # when:
+        with closing(StreamBypass(options, meta())) as bypass:
+            bypass.execute()
+
+        # then:
+        written = StreamRecorderWriter.streams
+        self.assertEqual({path: content for path, (_, content) in written.items()},
+                         self.contents)
+        self.assertTrue(all(thread_name.startswith('stream-bypass')
+                            for thread_name, _ in written.values()))
+        self.assertEqual(bypass.bypass_state.stats['bytes_copied'], 550)
+
+    def test_writer_without_concurrent_streams_copies_one_at_a_time(self):
+        # given
+        options = self._create_config('tests.utils.SequentialStreamRecorderWriter')
+
+        # when:
+        with closing(StreamBypass(options, meta())) as bypass:
+            bypass.execute()
+
+        # then:
+        written = StreamRecorderWriter.streams
+        self.assertEqual({path: content for path, (_, content) in written.items()},
+                         self.contents)
+        main_thread = threading.current_thread().name
+        self.assertTrue(all(thread_name == main_thread
+                            for thread_name, _ in written.values()))
+        self.assertEqual(bypass.bypass_state.stats['bytes_copied'], 550)
+
+
+class StreamBypassStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_folder = tempfile.mkdtemp()
+        self.config = create_stream_bypass_simple_config(persistence={
+            'name': 'exporters.persistence.pickle_persistence.PicklePersistence',
+            'options': {'file_path': self.tmp_folder}
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_resume_after_out_of_order_commits(self):
+        # given
+        streams = [Stream('file_{}'.format(i), 10, None) for i in range(4)]
+        state = StreamBypassState(self.config, meta())
+        state.commit_copied(streams[2])
+        state.commit_copied(streams[0])
+
+        # when:
+        self.config.persistence_options.update(
+            resume=True, persistence_state_id=state.state.persistence_state_id)
+        resumed = StreamBypassState(self.config, meta())
+
+        # then:
+        self.assertEqual([resumed.is_skipped(stream) for stream in streams],
+                         [True, False, True, False])
+        self.assertEqual(resumed.stats['bytes_copied'], 20)
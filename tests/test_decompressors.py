@@ -1,6 +1,6 @@
 import unittest
 import zlib
-from exporters.decompressors import ZLibDecompressor, NoDecompressor
+from exporters.decompressors import ZLibDecompressor, NoDecompressor, RestartPoints
 from exporters.iterio import IterIO
 from io import BytesIO
 import random
@@ -33,3 +33,23 @@ class DecompressorsTest(unittest.TestCase):
         decompressor = NoDecompressor({}, None)
         compressed = IterIO(BytesIO('helloworld'))
         assert IterIO(decompressor.decompress(compressed)).read() == 'helloworld'
+
+    def test_zlib_restart_points(self):
+        decompressor = ZLibDecompressor({}, None)
+        parts = ['hello', 'world', 'foobar']
+        compressed_parts = [zlib.compress(part) for part in parts]
+        compressed = IterIO(BytesIO(''.join(compressed_parts)), chunk_size=4)
+        restart_points = RestartPoints(100)
+        assert IterIO(decompressor.decompress(compressed, restart_points)).read() == \
+            'helloworldfoobar'
+        first, second = [len(part) for part in compressed_parts[:2]]
+        assert list(restart_points.points) == [
+            (100, 0), (100 + first, 5), (100 + first + second, 10)]
+        assert restart_points.resume_point(3) == (100, 3)
+        assert restart_points.resume_point(12) == (100 + first + second, 2)
+
+    def test_no_compression_restart_points(self):
+        decompressor = NoDecompressor({}, None)
+        restart_points = RestartPoints(100)
+        IterIO(decompressor.decompress(IterIO(BytesIO('helloworld')), restart_points)).read()
+        assert restart_points.resume_point(7) == (107, 0)
@@ -1,20 +1,27 @@
+import gzip
+import json
 import os
 import pickle
+import random
 import shutil
 import tempfile
+import time
 import unittest
+from copy import deepcopy
 
 import mock
 from mock import DEFAULT
 
 from exporters.bypasses.base import BaseBypass
+from exporters.exceptions import ConfigurationError
+from exporters.export_managers import multiprocess_pipeline
 from exporters.export_managers.base_exporter import BaseExporter
 from exporters.export_managers.basic_exporter import BasicExporter
 from exporters.readers.random_reader import RandomReader
 from exporters.transform.no_transform import NoTransform
 from exporters.utils import TmpFile, TemporaryDirectory
 from exporters.writers.console_writer import ConsoleWriter
-from .utils import valid_config_with_updates, ErrorWriter, CopyingMagicMock
+from .utils import valid_config_with_updates, ErrorWriter, ErrorReader, CopyingMagicMock
 
 
 def get_filename(path, persistence_id):
@@ -543,6 +550,515 @@ class BaseExportManagerTest(unittest.TestCase):
             last_read = [args[0]['last_read'] for name, args, kwargs in m.mock_calls]
             self.assertEqual(last_read, [2, 5, 8, 11, 14, 16])
 
+    @mock.patch("mock.MagicMock", new=CopyingMagicMock)
+    def test_persisted_positions_every_batches(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter'
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+                'options': {'checkpoint_every_batches': 4}
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        with mock.patch.object(exporter.persistence, 'commit_position') as m:
+            exporter.export()
+            last_read = [args[0]['last_read'] for name, args, kwargs in m.mock_calls]
+            self.assertEqual(last_read, [11, 16])
+
+    def test_checkpoints_wait_for_uploads(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {'number_of_items': 10, 'batch_size': 2}
+            },
+            'writer': {
+                'name': 'exporters.writers.fs_writer.FSWriter',
+                'options': {'filebase': os.path.join(self.tmp_dir, 'export_'),
+                            'upload_concurrency': 2, 'items_per_buffer_write': 1}
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        committed = []
+        copy = shutil.copy
+
+        def slow_copy(*args):
+            time.sleep(0.01)
+            return copy(*args)
+
+        with mock.patch('shutil.copy', side_effect=slow_copy), \
+                mock.patch.object(exporter.persistence, 'commit_position',
+                                  lambda position: committed.append(deepcopy(position))):
+            exporter.export()
+        self.assertEqual(committed[-1]['last_read'], 9)
+        # every committed position has all its items uploaded
+        for position in committed:
+            self.assertEqual(len(position['writer_metadata']['files_written']),
+                             position['last_read'] + 1)
+
+    def test_prefilter_lines(self):
+        config = self.build_config(
+            exporter_options={'prefilter_lines': True},
+            reader={'name': 'exporters.readers.fs_reader.FSReader',
+                    'options': {'input': {'dir': './tests/data/fs_reader_test'}}},
+            filter={'name': 'exporters.filters.KeyValueFilter',
+                    'options': {'keys': [{'name': 'item', 'value': 'value2'}]}},
+            writer={'name': 'tests.utils.NullWriter'})
+        self.exporter = exporter = BaseExporter(config)
+        self.assertIsNotNone(exporter.reader.deserializer.line_filter)
+        exporter.export()
+        self.assertEqual(exporter.writer.get_metadata('items_count'), 1)
+
+    def test_prefilter_lines_counts_rejected_lines_as_filtered_out(self):
+        def filter_stats(mode, prefilter_lines):
+            config = self.build_config(
+                exporter_options={'prefilter_lines': prefilter_lines, 'mode': mode},
+                reader={'name': 'exporters.readers.fs_reader.FSReader',
+                        'options': {'input': {'dir': './tests/data/fs_reader_test'},
+                                    'batch_size': 2}},
+                filter={'name': 'exporters.filters.KeyValueFilter',
+                        'options': {'keys': [{'name': 'item', 'value': 'value2'}]}},
+                writer={'name': 'tests.utils.NullWriter'})
+            exporter = BaseExporter(config)
+            try:
+                exporter.export()
+            finally:
+                exporter.persistence.delete()
+            return exporter.filter_before.get_metadata('filtered_out'), exporter.filter_before.total
+
+        for mode in ('sequential', 'threaded'):
+            self.assertEqual(filter_stats(mode, prefilter_lines=True), (5, 6))
+            self.assertEqual(filter_stats(mode, prefilter_lines=False), (5, 6))
+
+    def test_raw_passthrough_without_transform(self):
+        config = self.build_config(
+            reader={'name': 'exporters.readers.fs_reader.FSReader',
+                    'options': {'input': {'dir': './tests/data/fs_reader_test'}}},
+            exporter_options={'formatter': {
+                'name': 'exporters.export_formatter.json_export_formatter.JsonExportFormatter',
+                'options': {'raw_passthrough': True}}},
+            writer={'name': 'tests.utils.NullWriter'})
+        exporter = BaseExporter(config)
+        self.assertTrue(exporter.reader.deserializer.keep_source)
+        exporter.reader.set_last_position(None)
+        item = next(iter(exporter.reader.get_next_batch()))
+        self.assertEqual(exporter.export_formatter.format(item), item.source)
+
+        config['transform'] = {
+            'name': 'exporters.transform.pythonmap.PythonMapTransform',
+            'options': {'map': 'dict(item, key=1)'}}
+        exporter = BaseExporter(config)
+        self.assertFalse(exporter.reader.deserializer.keep_source)
+
+    def test_export_lazy_records(self):
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        os.mkdir(output_dir)
+        config = self.build_config(
+            reader={'name': 'exporters.readers.fs_reader.FSReader',
+                    'options': {'input': {'dir': './tests/data/fs_reader_test'}}},
+            deserializer={'name': 'exporters.deserializers.JsonLinesDeserializer',
+                          'options': {'lazy_records': True}},
+            filter={'name': 'exporters.filters.KeyValueFilter',
+                    'options': {'keys': [{'name': 'item', 'value': 'value2'}]}},
+            grouper={'name': 'exporters.groupers.file_key_grouper.FileKeyGrouper',
+                     'options': {'keys': ['item']}},
+            writer={'name': 'exporters.writers.fs_writer.FSWriter',
+                    'options': {'filebase': os.path.join(output_dir, '{groups[0]}_'),
+                                'compression': 'none'}})
+        self.exporter = exporter = BaseExporter(config)
+        exporter.export()
+        written = []
+        for name in os.listdir(output_dir):
+            self.assertTrue(name.startswith('value2_'))
+            with open(os.path.join(output_dir, name)) as f:
+                written.extend(json.loads(line) for line in f)
+        self.assertEqual(written, [{'item': 'value2'}])
+
+    def test_persisted_positions_keep_filters_state(self):
+        index_path = os.path.join(self.tmp_dir, 'index.sqlite')
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'filter': {
+                'name': 'exporters.filters.dupe_filter.DupeFilter',
+                'options': {'key_field': 'key', 'mode': 'sqlite', 'index_path': index_path}
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter'
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        committed = []
+        with mock.patch.object(exporter.persistence, 'commit_position',
+                               lambda position: committed.append(deepcopy(position))):
+            exporter.export()
+        self.assertEqual(committed[-1]['filters_state'], {
+            'filter_before': {'path': index_path,
+                              'generation': len(committed) - 1}
+        })
+
+        resumed = BaseExporter(options)
+        with mock.patch.object(resumed.persistence, 'get_last_position',
+                               return_value=committed[2]):
+            resumed._init_export_job()
+        self.assertEqual(resumed.filter_before.key_index.generation, 3)
+        self.assertFalse(resumed.filter_before.filter({'key': 5}))
+        self.assertTrue(resumed.filter_before.filter({'key': 12}))
+
+    def test_filter_with_persistent_state_only_in_sequential_mode(self):
+        for mode in ('threaded', 'multiprocess'):
+            config = self.build_config(
+                exporter_options={'mode': mode},
+                filter_before={
+                    'name': 'exporters.filters.dupe_filter.DupeFilter',
+                    'options': {'key_field': 'key', 'mode': 'bloom'}
+                },
+                writer={'name': 'tests.utils.NullWriter'},
+                persistence={'name': 'tests.utils.NullPersistence'},
+            )
+            del config['filter']
+            with self.assertRaisesRegexp(ConfigurationError, 'sequential mode'):
+                BaseExporter(config)
+
+    def test_persisted_positions_async_commit(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter'
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+                'options': {'async_commit': True}
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        committed = []
+        exporter.persistence.committer.commit_position = committed.append
+        exporter.export()
+        self.assertTrue(committed)
+        self.assertEqual(committed[-1]['last_read'], 16)
+        self.assertEqual([p['last_read'] for p in committed],
+                         sorted(p['last_read'] for p in committed))
+
+    def test_multiprocess_export(self):
+        config = self.build_config(
+            exporter_options={'mode': 'multiprocess', 'processes': 2},
+            filter_before={
+                'name': 'exporters.filters.pythonexp_filter.PythonexpFilter',
+                'options': {'python_expression': 'item[\'key\'] % 2 == 0'}
+            },
+            grouper={
+                'name': 'exporters.groupers.file_key_grouper.FileKeyGrouper',
+                'options': {'keys': ['country_code']}
+            },
+            writer={'name': 'tests.utils.NullWriter'},
+            persistence={'name': 'tests.utils.NullPersistence'},
+        )
+        del config['filter']
+        config['reader']['options'].update(number_of_items=100, batch_size=7)
+        self.exporter = exporter = BaseExporter(config)
+        exporter.export()
+        self.assertEqual(exporter.writer.get_metadata('items_count'), 50)
+        self.assertEqual(exporter.metadata.per_module['filter']['filtered_out'], 50)
+        self.assertEqual(
+            set(exporter.writer.grouping_info.keys()),
+            {(country,) for country in exporter.reader.country_codes})
+
+    def _export_dupe_filtered_keys(self, mode):
+        config = self.build_config(
+            exporter_options={'mode': mode, 'processes': 4},
+            filter_before={
+                'name': 'exporters.filters.dupe_filter.DupeFilter',
+                'options': {'key_field': 'country_code'}
+            },
+            writer={'name': 'tests.utils.NullWriter'},
+            persistence={'name': 'tests.utils.NullPersistence'},
+        )
+        del config['filter']
+        config['reader']['options'].update(number_of_items=200, batch_size=5)
+        self.exporter = exporter = BaseExporter(config)
+        written = []
+
+        def write_batch(batch):
+            batch = list(batch)
+            written.extend(item['key'] for item in batch)
+            exporter.writer.increment_written_items(len(batch))
+
+        random.seed(42)
+        with mock.patch.object(exporter.writer, 'write_batch', write_batch):
+            exporter.export()
+        exporter.persistence.delete()
+        return written
+
+    def test_multiprocess_export_with_stateful_filter(self):
+        expected = self._export_dupe_filtered_keys('sequential')
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(self._export_dupe_filtered_keys('multiprocess'), expected)
+
+    def _split_processing_modules(self, **modules_config):
+        config = self.build_config(
+            exporter_options={'mode': 'multiprocess'},
+            writer={'name': 'tests.utils.NullWriter'},
+            persistence={'name': 'tests.utils.NullPersistence'},
+            **modules_config)
+        config.pop('filter', None)
+        self.exporter = exporter = BaseExporter(config)
+        return multiprocess_pipeline.split_processing_modules(
+            {name: getattr(exporter, name) for name in multiprocess_pipeline.PROCESSING_MODULES})
+
+    def test_multiprocess_modules_placement(self):
+        dupe_filter = {'name': 'exporters.filters.dupe_filter.DupeFilter'}
+        pythonexp_filter = {
+            'name': 'exporters.filters.pythonexp_filter.PythonexpFilter',
+            'options': {'python_expression': 'item[\'key\'] % 2 == 0'}
+        }
+        grouper = {
+            'name': 'exporters.groupers.file_key_grouper.FileKeyGrouper',
+            'options': {'keys': ['country_code']}
+        }
+        self.assertEqual(
+            self._split_processing_modules(filter_before=dupe_filter,
+                                           filter_after=pythonexp_filter, grouper=grouper),
+            (['filter_before'], ['filter_after', 'grouper'], []))
+        self.assertEqual(
+            self._split_processing_modules(filter_before=pythonexp_filter,
+                                           filter_after=dupe_filter, grouper=grouper),
+            ([], ['filter_before'], ['filter_after', 'grouper']))
+        self.assertEqual(self._split_processing_modules(filter_before=dupe_filter),
+                         (['filter_before'], [], []))
+
+    def test_multiprocess_export_without_processing_modules_skips_pool(self):
+        config = self.build_config(
+            exporter_options={'mode': 'multiprocess', 'processes': 2},
+            writer={'name': 'tests.utils.NullWriter'},
+            persistence={'name': 'tests.utils.NullPersistence'},
+        )
+        del config['filter']
+        self.exporter = exporter = BaseExporter(config)
+        with mock.patch('multiprocessing.Pool') as pool:
+            exporter.export()
+        self.assertFalse(pool.called)
+        self.assertEqual(exporter.writer.get_metadata('items_count'), 10)
+
+    def _export_to_csv_files(self, input_dir, output_dir, **exporter_options):
+        config = self.build_config(
+            reader={
+                'name': 'exporters.readers.fs_reader.FSReader',
+                'options': {
+                    'input': {'dir': input_dir},
+                    'batch_size': 7,
+                    'record_batches': exporter_options.pop('record_batches'),
+                }
+            },
+            filter={
+                'name': 'exporters.filters.key_value_filter.KeyValueFilter',
+                'options': {'keys': [{'name': 'country.code', 'operator': 'in',
+                                      'value': ['es', 'uk']}]}
+            },
+            grouper={
+                'name': 'exporters.groupers.file_key_grouper.FileKeyGrouper',
+                'options': {'keys': ['country.code']}
+            },
+            writer={
+                'name': 'exporters.writers.fs_writer.FSWriter',
+                'options': {
+                    'filebase': os.path.join(output_dir, '{groups[0]}_'),
+                    'compression': 'none',
+                }
+            },
+            persistence={'name': 'tests.utils.NullPersistence'},
+            exporter_options=dict(exporter_options, formatter={
+                'name': 'exporters.export_formatter.csv_export_formatter.CSVExportFormatter',
+                'options': {'fields': ['key', 'name', 'country']}
+            }),
+        )
+        self.exporter = exporter = BaseExporter(config)
+        exporter.export()
+        output = {}
+        for file_name in os.listdir(output_dir):
+            with open(os.path.join(output_dir, file_name)) as f:
+                output[file_name] = f.read()
+        return output
+
+    def test_record_batches_export(self):
+        input_dir = os.path.join(self.tmp_dir, 'input')
+        os.makedirs(input_dir)
+        with gzip.open(os.path.join(input_dir, 'items.jl.gz'), 'w') as f:
+            for i in range(50):
+                item = {'key': i, 'name': u'n\xe1me %d' % i,
+                        'country': {'code': ['es', 'uk', 'us'][i % 3]}}
+                f.write(json.dumps(item) + '\n')
+        expected = self._export_to_csv_files(
+            input_dir, os.path.join(self.tmp_dir, 'records'), record_batches=False)
+        self.assertEqual(sorted(expected), ['es_.csv', 'uk_.csv'])
+        for mode in ('sequential', 'threaded', 'multiprocess'):
+            output = self._export_to_csv_files(
+                input_dir, os.path.join(self.tmp_dir, mode),
+                record_batches=True, mode=mode, processes=2)
+            self.assertEqual(output, expected)
+
+    @mock.patch("mock.MagicMock", new=CopyingMagicMock)
+    def test_multiprocess_persisted_positions(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter'
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+            },
+            'exporter_options': {
+                'mode': 'multiprocess',
+                'processes': 3,
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        with mock.patch.object(exporter.persistence, 'commit_position') as m:
+            exporter.export()
+            last_read = [args[0]['last_read'] for name, args, kwargs in m.mock_calls]
+            items_count = [args[0]['writer_metadata']['items_count']
+                           for name, args, kwargs in m.mock_calls]
+        self.assertEqual(last_read, [2, 5, 8, 11, 14, 16])
+        self.assertEqual(items_count, [3, 6, 9, 12, 15, 17])
+
+    def test_multiprocess_writer_items_limit(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter',
+                'options': {
+                    'items_limit': 5
+                }
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+            },
+            'exporter_options': {
+                'mode': 'multiprocess',
+                'processes': 2,
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        exporter.export()
+        self.assertEqual(exporter.writer.get_metadata('items_count'), 5)
+
+    @mock.patch("mock.MagicMock", new=CopyingMagicMock)
+    def test_threaded_persisted_positions(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter'
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+            },
+            'exporter_options': {
+                'mode': 'threaded',
+                'thread_queue_size': 1,
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        with mock.patch.object(exporter.persistence, 'commit_position') as m:
+            exporter.export()
+            last_read = [args[0]['last_read'] for name, args, kwargs in m.mock_calls]
+            items_count = [args[0]['writer_metadata']['items_count']
+                           for name, args, kwargs in m.mock_calls]
+        self.assertEqual(last_read, [2, 5, 8, 11, 14, 16])
+        self.assertEqual(items_count, [3, 6, 9, 12, 15, 17])
+        self.assertIsNotNone(exporter.metadata.end_time)
+
+    def test_threaded_iteration_stats_report_stages(self):
+        config = self.build_config(exporter_options={'threaded': True})
+        self.exporter = exporter = BaseExporter(config)
+        with mock.patch.object(exporter.stats_manager, 'iteration_report') as m:
+            exporter.export()
+        self.assertEqual(exporter.writer.get_metadata('items_count'), 10)
+        times = m.call_args[0][0]
+        self.assertEqual(list(times.keys()),
+                         ['started', 'read', 'processed', 'written', 'persisted', 'stages'])
+        self.assertEqual(list(times['stages'].keys()), ['read', 'process', 'write'])
+
+    def test_threaded_writer_items_limit(self):
+        options = {
+            'reader': {
+                'name': 'exporters.readers.random_reader.RandomReader',
+                'options': {
+                    'number_of_items': 17,
+                    'batch_size': 3
+                }
+            },
+            'writer': {
+                'name': 'tests.utils.NullWriter',
+                'options': {
+                    'items_limit': 5
+                }
+            },
+            'persistence': {
+                'name': 'tests.utils.NullPersistence',
+            },
+            'exporter_options': {
+                'mode': 'threaded',
+            }
+        }
+        self.exporter = exporter = BaseExporter(options)
+        exporter.export()
+        self.assertEqual(exporter.writer.get_metadata('items_count'), 5)
+
+    def test_threaded_reader_error_is_raised(self):
+        config = self.build_config(
+            exporter_options={'mode': 'threaded'},
+            reader={'name': 'tests.utils.ErrorReader'})
+        self.exporter = exporter = BaseExporter(config)
+        with self.assertRaisesRegexp(RuntimeError, ErrorReader.msg):
+            exporter.export()
+
+    def test_invalid_exporter_mode(self):
+        with self.assertRaisesRegexp(ConfigurationError, 'Unsupported exporter mode'):
+            BaseExporter(self.build_config(exporter_options={'mode': 'distributed'}))
+
     def test_disabling_retries(self):
         count_holder = [0]
         options = {
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
+import os
 import random
+import shutil
+import tempfile
 import unittest
 from exporters.filters.base_filter import BaseFilter
+from exporters.exceptions import ConfigurationError
 from exporters.filters.dupe_filter import DupeFilter
 from exporters.filters.key_value_filter import KeyValueFilter
 from exporters.filters.key_value_filters import InvalidOperator
 from exporters.filters.key_value_regex_filter import KeyValueRegexFilter
 from exporters.filters.no_filter import NoFilter
 from exporters.records.base_record import BaseRecord
+from exporters.records.record_batch import RecordBatch
 
 from .utils import meta
 
@@ -150,9 +155,143 @@ class KeyValueFilterTest(unittest.TestCase):
         batch = list(batch)
         self.assertEqual(len(batch), 0, 'Resulting filtered batch should be empty')
 
+    def test_filter_record_batch(self):
+        keys = [
+            {'name': 'country.state.city', 'value': 'val'},
+            {'name': 'value', 'operator': 'in', 'value': range(500)},
+        ]
+        items = [
+            BaseRecord({'country': {
+                'state': {
+                    'city': random.choice(['val', 'es', 'uk'])
+                }
+            }, 'value': random.randint(0, 1000)}) for i in range(100)
+        ] + [BaseRecord({'value': 1})]
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        expected = list(filter.filter_batch(items))
+        filtered_out = filter.get_metadata('filtered_out')
+
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        batch = filter.filter_batch(RecordBatch.from_records(items))
+        self.assertIsInstance(batch, RecordBatch)
+        self.assertEqual(list(batch), expected)
+        self.assertEqual(filter.get_metadata('filtered_out'), filtered_out)
+
+    def test_filter_record_batch_missing_key_without_separator(self):
+        keys = [{'name': 'country_code', 'value': 'es'}]
+        filter = KeyValueFilter(
+            {'options': {'keys': keys, 'nested_field_separator': None}}, meta())
+        batch = RecordBatch.from_records([{'country_code': 'es'}, {'name': 'item'}])
+        with self.assertRaises(KeyError):
+            filter.filter_batch(batch)
+
+    def test_filter_record_batch_value_in_path_is_not_a_dict(self):
+        keys = [{'name': 'country.code', 'value': 'es'}]
+        items = [BaseRecord({'country': {'code': 'es'}}), BaseRecord({'country': 'es'})]
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        with self.assertRaises(TypeError):
+            list(filter.filter_batch(items))
+        with self.assertRaises(TypeError):
+            filter.filter_batch(RecordBatch.from_records(items))
+
+    def test_filter_record_batch_only_checks_records_kept_by_previous_keys(self):
+        items = [
+            BaseRecord({'id': 1, 'country': {'code': 'es'}}),
+            BaseRecord({'id': 2, 'country': 'es'}),
+            BaseRecord({'id': 3}),
+            BaseRecord({'id': 1, 'country': {'code': 'uk'}}),
+        ]
+        for separator in ('.', None):
+            # id is checked first, as it is the cheapest key
+            keys = [{'name': 'id', 'value': 1},
+                    {'name': 'country.code' if separator else 'country',
+                     'value': 'es' if separator else {'code': 'es'}}]
+            options = {'options': {'keys': keys, 'nested_field_separator': separator}}
+            expected = list(KeyValueFilter(options, meta()).filter_batch(items))
+
+            batch = KeyValueFilter(options, meta()).filter_batch(
+                RecordBatch.from_records(items))
+            self.assertEqual(list(batch), expected)
+            self.assertEqual(expected, items[:1])
+
+    def test_keys_are_compiled_cheapest_first(self):
+        keys = [
+            {'name': 'name', 'value': 'item.*', 'operator': 're_match'},
+            {'name': 'tags', 'value': 'a', 'operator': 'contains'},
+            {'name': 'address.country', 'value': ['es', 'us'], 'operator': 'in'},
+            {'name': 'id', 'value': 1},
+        ]
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        self.assertEqual([key.name for key in filter.plan],
+                         ['id', 'address.country', 'tags', 'name'])
+        self.assertEqual(filter.plan[1].path, ['address', 'country'])
+        item = {'id': 1, 'tags': ['a'], 'name': 'item1', 'address': {'country': 'es'}}
+        self.assertTrue(filter.filter(item))
+        self.assertFalse(filter.filter(dict(item, name='other')))
+        self.assertFalse(filter.filter(dict(item, address={})))
+
+    def test_filter_with_in_operator_and_unhashable_values(self):
+        keys = [{'name': 'value', 'value': [[1, 2], 'a', 3], 'operator': 'in'}]
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        items = [{'value': [1, 2]}, {'value': 'a'}, {'value': 3}, {'value': {'b': 1}}]
+        self.assertEqual(list(filter.filter_batch(items)), items[:3])
+
+        keys = [{'name': 'value', 'value': ['a', 3], 'operator': 'in'}]
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        self.assertEqual(list(filter.filter_batch(items)), items[1:3])
+
+    def test_filter_with_in_operator_and_string_value(self):
+        keys = [{'name': 'country_code', 'value': 'es,us', 'operator': 'in'}]
+        filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        items = [{'country_code': 'es'}, {'country_code': 'uk'}]
+        self.assertEqual(list(filter.filter_batch(items)), items[:1])
+
+    def test_raw_line_filter(self):
+        keys = [
+            {'name': 'country.code', 'value': 'es'},
+            {'name': 'tags', 'value': ['new', u'espa\xf1a'], 'operator': 'in'},
+        ]
+        line_filter = KeyValueFilter({'options': {'keys': keys}}, meta()).raw_line_filter()
+        self.assertTrue(line_filter('{"country": {"code": "es"}, "tags": "new"}'))
+        self.assertTrue(line_filter('{"country": {"code": "es"}, "tags": "espa\xc3\xb1a"}'))
+        self.assertFalse(line_filter('{"country": {"code": "uk"}, "tags": "new"}'))
+        self.assertFalse(line_filter('{"country": {"code": "es"}, "tags": "old"}'))
+        # escaped strings can't be checked without decoding them
+        self.assertTrue(line_filter('{"country": {"code": "\\u0065s"}, "tags": "new"}'))
+
+    def test_raw_line_filter_skips_keys_that_cant_be_checked(self):
+        keys = [
+            {'name': 'value', 'value': 1},
+            {'name': 'name', 'value': 'a"b'},
+            {'name': 'tags', 'value': 'es,us', 'operator': 'in'},
+        ]
+        self.assertIsNone(KeyValueFilter({'options': {'keys': keys}}, meta()).raw_line_filter())
+
+        keys = [{'name': 'value', 'value': 1}, {'name': 'tags', 'value': 'es',
+                                                'operator': 'contains'}]
+        line_filter = KeyValueFilter({'options': {'keys': keys}}, meta()).raw_line_filter()
+        self.assertTrue(line_filter('{"value": 2, "tags": ["es", "us"]}'))
+        self.assertTrue(line_filter('{"value": 1, "tags": "spanish es"}'))
+        self.assertFalse(line_filter('{"value": 1, "tags": ["uk"]}'))
+
+        options = {'keys': [{'name': 'country', 'value': 'es'}], 'nested_field_separator': None}
+        self.assertIsNone(KeyValueFilter({'options': options}, meta()).raw_line_filter())
+
 
 class KeyValueRegexFilterTest(unittest.TestCase):
 
+    def test_raw_line_filter(self):
+        keys = [{'name': 'country', 'value': 'eg?[sy]'}]
+        line_filter = KeyValueRegexFilter({'options': {'keys': keys}}, meta()).raw_line_filter()
+        self.assertTrue(line_filter('{"country": "egypt"}'))
+        self.assertTrue(line_filter('{"country": "es"}'))
+        self.assertFalse(line_filter('{"country": "uk"}'))
+
+        for pattern in ['US|3', '(?i)es', 'True', '.*es', 'x*y']:
+            keys = [{'name': 'country', 'value': pattern}]
+            regex_filter = KeyValueRegexFilter({'options': {'keys': keys}}, meta())
+            self.assertIsNone(regex_filter.raw_line_filter(), pattern)
+
     def test_filter_batch_with_key_value_regex(self):
         # given:
         items = [
@@ -403,3 +542,98 @@ class DupeFilterTest(unittest.TestCase):
         batch = filter.filter_batch(batch)
         batch = list(batch)
         self.assertEqual(3, len(batch))
+
+
+class DupeFilterModesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _filter_keys(self, dupe_filter, keys):
+        return [item['_key'] for item in dupe_filter.filter_batch({'_key': key} for key in keys)]
+
+    def test_bloom_mode(self):
+        dupe_filter = DupeFilter({'options': {'mode': 'bloom', 'capacity': 1000}}, meta())
+        keys = ['key-{}'.format(i) for i in range(1000)]
+        self.assertEqual(self._filter_keys(dupe_filter, keys + keys[:500]), keys)
+
+    def test_bloom_mode_state(self):
+        index_path = os.path.join(self.tmp_dir, 'index.bloom')
+        options = {'mode': 'bloom', 'capacity': 100, 'max_memory': 64,
+                   'index_path': index_path}
+        dupe_filter = DupeFilter({'options': options}, meta())
+        self.assertEqual(len(dupe_filter.key_index.bits), 64)
+        self._filter_keys(dupe_filter, ['a', 'b', 1])
+        states = [dupe_filter.get_state()]
+        self.assertEqual(states[0], {'path': index_path, 'generation': 0,
+                                     'size': 512, 'hashes': 4, 'count': 3})
+        self._filter_keys(dupe_filter, ['c'])
+        states.append(dupe_filter.get_state())
+        self._filter_keys(dupe_filter, ['d'])
+        states.append(dupe_filter.get_state())
+        # only the files of the last two checkpoints are kept
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ['index.bloom.1', 'index.bloom.2'])
+
+        resumed = DupeFilter({'options': options}, meta())
+        resumed.set_state(states[1])
+        self.assertEqual(resumed.key_index.generation, 2)
+        self.assertEqual(self._filter_keys(resumed, ['a', 'b', 1, 'c', 'd']), ['d'])
+
+        resumed = DupeFilter({'options': options}, meta())
+        resumed.set_state(states[0])
+        self.assertEqual(self._filter_keys(resumed, ['a', 'e']), ['a', 'e'])
+
+    def test_bloom_mode_temporary_index(self):
+        dupe_filter = DupeFilter({'options': {'mode': 'bloom', 'capacity': 100}}, meta())
+        self._filter_keys(dupe_filter, ['a'])
+        state = dupe_filter.get_state()
+        bits_path = '{}.0'.format(state['path'])
+        self.assertTrue(os.path.exists(bits_path))
+        dupe_filter.close()
+        self.assertFalse(os.path.exists(bits_path))
+
+    def test_sqlite_mode(self):
+        index_path = os.path.join(self.tmp_dir, 'index.sqlite')
+        options = {'mode': 'sqlite', 'index_path': index_path}
+        dupe_filter = DupeFilter({'options': options}, meta())
+        self.assertEqual(self._filter_keys(dupe_filter, ['a', 'b', 'a', 1, '1', 1]),
+                         ['a', 'b', 1, '1'])
+        state = dupe_filter.get_state()
+        self.assertEqual(state, {'path': index_path, 'generation': 0})
+        # keys added after the checkpoint are forgotten when resuming from it
+        self._filter_keys(dupe_filter, ['c'])
+        dupe_filter.get_state()
+
+        resumed = DupeFilter({'options': {'mode': 'sqlite'}}, meta())
+        resumed.set_state(state)
+        self.assertEqual(self._filter_keys(resumed, ['a', 'c', 'd']), ['c', 'd'])
+        self.assertEqual(resumed.get_state(), {'path': index_path, 'generation': 1})
+
+    def test_sqlite_mode_temporary_index(self):
+        dupe_filter = DupeFilter({'options': {'mode': 'sqlite'}}, meta())
+        self._filter_keys(dupe_filter, ['a'])
+        temporary_path = dupe_filter.get_state()['path']
+        self.assertTrue(os.path.exists(temporary_path))
+        dupe_filter.close()
+        self.assertFalse(os.path.exists(temporary_path))
+
+        # resumed jobs use the checkpointed index instead of a temporary one
+        index_path = os.path.join(self.tmp_dir, 'index.sqlite')
+        dupe_filter = DupeFilter({'options': {'mode': 'sqlite', 'index_path': index_path}},
+                                 meta())
+        self._filter_keys(dupe_filter, ['a'])
+        state = dupe_filter.get_state()
+        resumed = DupeFilter({'options': {'mode': 'sqlite'}}, meta())
+        resumed.set_state(state)
+        self.assertIsNone(resumed.key_index.index_path.temporary_dir)
+        self.assertEqual(self._filter_keys(resumed, ['a', 'b']), ['b'])
+        resumed.close()
+        self.assertTrue(os.path.exists(index_path))
+
+    def test_invalid_mode(self):
+        with self.assertRaisesRegexp(ConfigurationError, 'Unsupported DupeFilter mode'):
+            DupeFilter({'options': {'mode': 'tree'}}, meta())
@@ -2,6 +2,7 @@ import datetime
 import unittest
 from exporters.filters.pythonexp_filter import PythonexpFilter
 from exporters.records.base_record import BaseRecord
+from exporters.records.record_batch import RecordBatch
 
 from .utils import meta
 
@@ -21,6 +22,20 @@ class PythonexpFilterFilterTest(unittest.TestCase):
         self.assertEqual(1, len(result))
         self.assertEqual('uk', dict(result[0])['country_code'])
 
+    def test_filter_record_batch_with_python_expression(self):
+        batch = RecordBatch.from_records([
+            BaseRecord({'name': 'item1', 'country_code': 'es'}),
+            BaseRecord({'name': 'item2', 'country_code': 'uk'}),
+            BaseRecord({'name': 'item3', 'country_code': 'uk'}),
+        ])
+        python_filter = PythonexpFilter(
+            {'options': {'python_expression': 'item[\'country_code\']==\'uk\''}},
+            meta()
+        )
+        result = python_filter.filter_batch(batch)
+        self.assertEqual(['item2', 'item3'], result.column('name'))
+        self.assertEqual(1, python_filter.get_metadata('filtered_out'))
+
     def test_filter_with_datetime(self):
         now = datetime.datetime.now()
         batch = [
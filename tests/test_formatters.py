@@ -1,3 +1,4 @@
+import datetime
 import json
 import io
 import csv
@@ -7,7 +8,8 @@ from exporters.exceptions import ConfigurationError
 from exporters.export_formatter.base_export_formatter import BaseExportFormatter
 from exporters.export_formatter.csv_export_formatter import CSVExportFormatter
 from exporters.export_formatter.json_export_formatter import JsonExportFormatter
-from exporters.records.base_record import BaseRecord
+from exporters.records.base_record import BaseRecord, SourcedRecord
+from exporters.records.record_batch import RecordBatch
 from tests.utils import meta
 
 
@@ -39,6 +41,65 @@ class JsonFormatterTest(unittest.TestCase):
         item = self.export_formatter.format(item)
         self.assertIsInstance(json.loads(item), dict)
 
+    def test_format_datetime(self):
+        item = BaseRecord(key=0, updated=datetime.datetime(2016, 1, 2, 3, 4, 5))
+        formatted = self.export_formatter.format(item)
+        self.assertEqual(json.loads(formatted), {'key': 0, 'updated': '2016-01-02T03:04:05'})
+
+    def test_format_with_json_codec(self):
+        item = BaseRecord(key=0, value=u'v\xe1lue')
+        formatter = JsonExportFormatter({'options': {'json_codec': 'auto'}}, meta())
+        self.assertEqual(json.loads(formatter.format(item)), item)
+
+    def test_raw_passthrough(self):
+        source = '{"value":  "v\xc3\xa1lue", "key": 0}'
+        item = SourcedRecord(json.loads(source), source)
+        formatter = JsonExportFormatter({'options': {'raw_passthrough': True}}, meta())
+        self.assertTrue(formatter.passthrough_sources)
+        self.assertEqual(formatter.format(item), source)
+        self.assertEqual(formatter.format_batch([item, BaseRecord(key=1)]),
+                         source + '\n{"key": 1}')
+        self.assertEqual(json.loads(self.export_formatter.format(item)), item)
+
+        formatter = JsonExportFormatter(
+            {'options': {'raw_passthrough': True, 'json_codec': 'auto'}}, meta())
+        self.assertEqual(json.loads(formatter.format(item)), item)
+
+        formatter = JsonExportFormatter(
+            {'options': {'raw_passthrough': True, 'pretty_print': True}}, meta())
+        self.assertFalse(formatter.passthrough_sources)
+        self.assertNotEqual(formatter.format(item), source)
+
+    def test_raw_passthrough_of_changed_records(self):
+        formatter = JsonExportFormatter({'options': {'raw_passthrough': True}}, meta())
+        changes = [
+            lambda item: item.__setitem__('key', 1),
+            lambda item: item.__delitem__('key'),
+            lambda item: item.pop('key'),
+            lambda item: item.update(other=2),
+            lambda item: item.setdefault('other', 2),
+            lambda item: item.clear(),
+        ]
+        for change in changes:
+            item = SourcedRecord({'key': 0}, '{"key":0}')
+            change(item)
+            self.assertIsNone(item.source)
+            self.assertEqual(json.loads(formatter.format(item)), item)
+
+    def test_invalid_json_codec(self):
+        with self.assertRaisesRegexp(ConfigurationError, 'JSON codec'):
+            JsonExportFormatter({'options': {'json_codec': 'not_a_codec'}}, meta())
+
+    def test_format_batch(self):
+        batch = [
+            BaseRecord(key=0, updated=datetime.datetime(2016, 1, 2, 3, 4, 5)),
+            BaseRecord(key=1, value=u'v\xe1lue'),
+        ]
+        expected = '\n'.join(self.export_formatter.format(item) for item in batch)
+        self.assertEqual(self.export_formatter.format_batch(batch), expected)
+        self.assertEqual(
+            self.export_formatter.format_batch(RecordBatch.from_records(batch)), expected)
+
 
 class CSVFormatterTest(unittest.TestCase):
 
@@ -133,6 +194,47 @@ class CSVFormatterTest(unittest.TestCase):
         memfile = self._create_memfile((it for it in formatted_batch), header=['"key1","key2"'])
         self.assertEqual(self.batch, list(csv.DictReader(memfile)))
 
+    def test_format_columns(self):
+        # given:
+        options = {
+            'options': {
+                'fields': ['key1', 'key2', 'key3', 'key4'],
+            }
+        }
+        formatter = CSVExportFormatter(options)
+        batch = self.batch + [
+            BaseRecord({'key1': u'v\xe1lue', 'key3': 3, 'key4': {'nested': u'\xf1'}}),
+            BaseRecord({'key1': 'multi\nline', 'key2': None, 'key3': 1.5}),
+        ]
+
+        # when:
+        formatted_batch = formatter.format_columns(RecordBatch.from_records(batch))
+
+        # then:
+        self.assertEqual(formatted_batch, [formatter.format(item) for item in batch])
+
+    def test_format_batch(self):
+        # given:
+        options = {
+            'options': {
+                'fields': ['key1', 'key2', 'key3', 'key4'],
+            }
+        }
+        formatter = CSVExportFormatter(options)
+        batch = self.batch + [
+            BaseRecord({'key1': u'v\xe1lue', 'key3': 3, 'key4': {'nested': u'\xf1'}}),
+            BaseRecord({'key1': 'multi\nline', 'key2': None, 'key3': 1.5}),
+        ]
+        expected = '\n'.join(formatter.format(item) for item in batch)
+
+        # when:
+        formatted = formatter.format_batch(batch)
+        formatted_columns = formatter.format_batch(RecordBatch.from_records(batch))
+
+        # then:
+        self.assertEqual(formatted, expected)
+        self.assertEqual(formatted_columns, expected)
+
     def _create_memfile(self, lines, header=None):
         if not header:
             header = []
@@ -4,6 +4,7 @@ from exporters.groupers.base_grouper import BaseGrouper
 from exporters.groupers.file_key_grouper import FileKeyGrouper
 from exporters.groupers.python_exp_grouper import PythonExpGrouper
 from exporters.records.base_record import BaseRecord
+from exporters.records.record_batch import RecordBatch
 
 country_codes = ['es', 'uk', 'us']
 states = ['valencia', 'madrid', 'barcelona']
@@ -89,6 +90,14 @@ class FileKeyGrouperTest(unittest.TestCase):
             country, state, city = item.group_membership
             self.assertTrue(state == 'unknown')
 
+    def test_group_record_batch(self):
+        grouper = FileKeyGrouper(self.options_unknown_key['grouper'])
+        batch = get_batch()
+        expected = [item.group_membership for item in grouper.group_batch(batch)]
+        grouped = grouper.group_batch(RecordBatch.from_records(batch))
+        self.assertIsInstance(grouped, RecordBatch)
+        self.assertEqual([item.group_membership for item in grouped], expected)
+
 
 class PythonExpGrouperTest(unittest.TestCase):
     def setUp(self):
@@ -172,6 +181,16 @@ class PythonExpGrouperTest(unittest.TestCase):
             self.assertTrue((item['country_code'] in ['uk', 'us']) == is_in)
             self.assertTrue(item['value'] % 5 == modulo)
 
+    def test_group_record_batch(self):
+        grouper = PythonExpGrouper(self.options_multiple['grouper'])
+        batch = get_batch()
+        grouped = grouper.group_batch(RecordBatch.from_records(batch))
+        self.assertIsInstance(grouped, RecordBatch)
+        for item in grouped:
+            is_in, modulo = item.group_membership
+            self.assertTrue((item['country_code'] in ['uk', 'us']) == is_in)
+            self.assertTrue(item['value'] % 5 == modulo)
+
     def test_group_batch_invalid(self):
         grouper = PythonExpGrouper(self.options_invalid['grouper'])
         batch = get_batch()
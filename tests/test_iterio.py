@@ -1,4 +1,5 @@
 import unittest
+from io import BytesIO
 from exporters.iterio import IterIO
 
 
@@ -36,3 +37,45 @@ class IterIOTest(unittest.TestCase):
     def test_line_mode(self):
         io = IterIO(iter(['he\n\nllo', '\nworl\nd']), mode="lines")
         assert list(io) == ['he\n', '\n', 'llo\n', 'worl\n', 'd']
+
+    def test_read_long_lines(self):
+        lines = ['a' * 5000 + '\n', 'b' * 3 + '\n', '\n', 'c' * 7000]
+        io = IterIO(iter(['a' * 5000, '\nbbb\n', '\nc', 'c' * 6999]))
+        assert list(io.iterlines()) == lines
+        assert io.tell() == len(''.join(lines))
+        io = IterIO(iter(['a' * 5000, '\nbbb\n', '\nc', 'c' * 6999]))
+        assert [io.readline() for _ in lines] == lines
+        assert io.readline() == ''
+
+    def test_read_from_file(self):
+        data = ''.join('line {}\n'.format(i) for i in range(1000))
+        io = IterIO(BytesIO(data), chunk_size=100)
+        assert io.readlines() == data.splitlines(True)
+        assert io.tell() == len(data)
+
+    def test_mix_lines_and_reads(self):
+        io = IterIO(iter(['one\ntwo\nthree\nfour\n', 'five\n']))
+        lines = io.iterlines()
+        assert next(lines) == 'one\n'
+        assert io.read(4) == 'two\n'
+        assert next(lines) == 'three\n'
+        io.unshift('thr')
+        assert io.tell() == len('one\ntwo\n') + len('ee\n')
+        assert next(lines) == 'thrfour\n'
+        assert list(lines) == ['five\n']
+        assert io.read() == ''
+
+    def test_unshift(self):
+        io = IterIO(iter(['hello', 'world']))
+        assert io.read(7) == 'hellowo'
+        io.unshift('wo')
+        assert io.tell() == 5
+        assert io.read() == 'world'
+
+    def test_seek(self):
+        io = IterIO(iter(['hello', 'world']))
+        assert io.seek(3) == 3
+        assert io.seek(4, 1) == 7
+        assert io.read() == 'rld'
+        with self.assertRaises(NotImplementedError):
+            io.seek(0)
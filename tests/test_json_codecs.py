@@ -0,0 +1,61 @@
+import datetime
+import json
+import unittest
+
+import mock
+
+from exporters.deserializers import JsonLinesDeserializer
+from exporters.exceptions import ConfigurationError
+from exporters.iterio import IterIO
+from exporters.json_codecs import JSON_CODECS, StdlibJsonCodec, get_json_codec
+
+
+ITEM = {
+    'key': 1,
+    'text': u'v\xe1lue / with "quotes"',
+    'values': [1.5, None, True],
+    'nested': {'b': 1, 'a': 2},
+    'updated': datetime.datetime(2016, 1, 2, 3, 4, 5, 6),
+}
+
+
+class JsonCodecsTest(unittest.TestCase):
+
+    def test_available_codecs_round_trip(self):
+        expected = dict(ITEM, updated='2016-01-02T03:04:05.000006')
+        for name in JSON_CODECS:
+            for pretty_print in (False, True):
+                codec = get_json_codec(name, pretty_print=pretty_print)
+                encoded = codec.dumps(ITEM)
+                self.assertEqual(json.loads(encoded), expected, name)
+                self.assertEqual(codec.loads(encoded), expected, name)
+
+    def test_stdlib_codec_output(self):
+        codec = get_json_codec('json')
+        self.assertIsInstance(codec, StdlibJsonCodec)
+        self.assertEqual(codec.dumps(ITEM), json.dumps(ITEM, default=lambda o: o.isoformat()))
+        codec = get_json_codec('json', pretty_print=True)
+        self.assertEqual(codec.dumps({'b': 1, 'a': 2}), '{\n  "a": 2, \n  "b": 1\n}')
+
+    def test_not_serializable_values(self):
+        for name in JSON_CODECS:
+            with self.assertRaises(TypeError):
+                get_json_codec(name).dumps({'date': datetime.date(2016, 1, 1)})
+
+    def test_auto_codec(self):
+        codec = get_json_codec('auto')
+        self.assertIn(codec.__class__, JSON_CODECS.values())
+
+    def test_missing_codec_falls_back_to_stdlib(self):
+        with mock.patch.dict(JSON_CODECS, clear=True, json=StdlibJsonCodec):
+            self.assertIsInstance(get_json_codec('orjson'), StdlibJsonCodec)
+            self.assertIsInstance(get_json_codec('auto'), StdlibJsonCodec)
+
+    def test_unknown_codec(self):
+        with self.assertRaisesRegexp(ConfigurationError, 'JSON codec'):
+            get_json_codec('simplejson')
+
+    def test_jsonlines_deserializer_codec(self):
+        lines = IterIO(iter(['{"a": 1}\n{"b": [', '2]}\n']))
+        deserializer = JsonLinesDeserializer({'options': {'json_codec': 'auto'}}, None)
+        self.assertEqual(list(deserializer.deserialize(lines)), [{'a': 1}, {'b': [2]}])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import json
+import pickle
+import unittest
+
+from exporters.deserializers import JsonLinesDeserializer
+from exporters.export_formatter.json_export_formatter import JsonExportFormatter
+from exporters.filters.key_value_filters import KeyValueFilter
+from exporters.iterio import IterIO
+from exporters.records.base_record import BaseRecord
+from exporters.records.lazy_record import LazyRecord, materialize_records
+
+from .utils import meta
+
+
+class LazyRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'name': u'espa\xf1a', 'id': 3, 'nested': {'a': [1, 2]}, 'price': 1.5,
+            'empty': None, 'flag': True,
+        }
+        self.line = json.dumps(self.data) + '\n'
+
+    def test_read_fields_without_decoding_the_whole_line(self):
+        record = LazyRecord(self.line, json.loads)
+        self.assertEqual(record['id'], 3)
+        self.assertEqual(record.get('nested'), {'a': [1, 2]})
+        self.assertIn('name', record)
+        self.assertNotIn('missing', record)
+        self.assertIsNone(record.get('missing'))
+        self.assertIsNone(record['empty'])
+        with self.assertRaises(KeyError):
+            record['missing']
+        self.assertFalse(record._materialized)
+        self.assertEqual(record['name'], u'espa\xf1a')
+
+    def test_whitespace_and_empty_objects(self):
+        record = LazyRecord(' { "a" : 1 ,\t"b":{ } , "c" : [ ] }\r\n', json.loads)
+        self.assertEqual((record['c'], record['a'], record['b']), ([], 1, {}))
+        self.assertIsNone(LazyRecord('{ }\n', json.loads).get('a'))
+
+    def test_whole_record_operations_decode_the_line(self):
+        record = LazyRecord(self.line, json.loads)
+        self.assertEqual(record['id'], 3)
+        self.assertEqual(dict(record.items()), self.data)
+        self.assertTrue(record._materialized)
+        self.assertEqual(record, self.data)
+        self.assertEqual(len(LazyRecord(self.line, json.loads)), len(self.data))
+        self.assertEqual(sorted(LazyRecord(self.line, json.loads)), sorted(self.data))
+
+    def test_changes_decode_the_line_and_drop_the_source(self):
+        record = LazyRecord(self.line, json.loads, keep_source=True)
+        self.assertEqual(record.source, self.line.rstrip('\n'))
+        record['id'] = 4
+        self.assertIsNone(record.source)
+        self.assertEqual(record, dict(self.data, id=4))
+        self.assertIsNone(LazyRecord(self.line, json.loads).source)
+
+    def test_pickle(self):
+        record = LazyRecord(self.line, json.loads)
+        record.group_key = ['id']
+        record.group_membership = (3,)
+        unpickled = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        self.assertIs(type(unpickled), BaseRecord)
+        self.assertEqual(unpickled, self.data)
+        self.assertEqual(unpickled.group_key, ['id'])
+        self.assertEqual(unpickled.group_membership, (3,))
+
+    def test_filter_and_format_lazy_records(self):
+        lines = [json.dumps({'n': n, 'even': n % 2 == 0, 'padding': 'x' * n}) + '\n'
+                 for n in range(10)]
+        deserializer = JsonLinesDeserializer({'options': {'lazy_records': True}}, meta())
+        keys = [{'name': 'even', 'value': True}]
+        key_filter = KeyValueFilter({'options': {'keys': keys}}, meta())
+        records = list(key_filter.filter_batch(
+            deserializer.deserialize(IterIO(iter(lines)))))
+        self.assertTrue(all(isinstance(record, LazyRecord) for record in records))
+        self.assertFalse(any(record._materialized for record in records))
+
+        formatter = JsonExportFormatter({}, meta())
+        formatted = formatter.format_batch(materialize_records(records))
+        self.assertEqual([json.loads(line) for line in formatted.split('\n')],
+                         [json.loads(line) for line in lines[::2]])
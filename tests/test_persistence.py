@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 from mock import patch
 from exporters.exporter_config import ExporterConfig
@@ -5,7 +8,7 @@ from exporters.persistence.base_persistence import BasePersistence
 from exporters.persistence.pickle_persistence import PicklePersistence
 from exporters.utils import remove_if_exists
 
-from .utils import valid_config_with_updates, meta
+from .utils import valid_config_with_updates, meta, NullPersistence
 
 
 class BasePersistenceTest(unittest.TestCase):
@@ -74,11 +77,14 @@ class PicklePersistenceTest(unittest.TestCase):
         finally:
             remove_if_exists('/tmp/'+file_name)
 
+    @patch('os.rename', autospec=True)
+    @patch('os.fsync', autospec=True)
     @patch('os.path.isfile', autospec=True)
     @patch('__builtin__.open', autospec=True)
     @patch('pickle.dump', autospec=True)
     @patch('pickle.load', autospec=True)
-    def test_get_last_position(self, mock_load_pickle, mock_dump_pickle, mock_open, mock_is_file):
+    def test_get_last_position(self, mock_load_pickle, mock_dump_pickle, mock_open, mock_is_file,
+                               *othermocks):
         mock_dump_pickle.return_value = True
         mock_is_file.return_value = True
         mock_load_pickle.return_value = {'last_position': {'last_key': 10}}
@@ -86,13 +92,135 @@ class PicklePersistenceTest(unittest.TestCase):
         persistence = PicklePersistence(exporter_config.persistence_options, meta())
         self.assertEqual({'last_key': 10}, persistence.get_last_position())
 
+    @patch('os.rename', autospec=True)
+    @patch('os.fsync', autospec=True)
     @patch('__builtin__.open', autospec=True)
     @patch('pickle.dump', autospec=True)
     @patch('uuid.uuid4', autospec=True)
-    def test_commit(self, mock_uuid, mock_dump_pickle, mock_open):
+    def test_commit(self, mock_uuid, mock_dump_pickle, mock_open, *othermocks):
         mock_dump_pickle.return_value = True
         mock_uuid.return_value = 1
         exporter_config = ExporterConfig(self.config)
         persistence = PicklePersistence(exporter_config.persistence_options, meta())
         self.assertEqual(None, persistence.commit_position(10))
         self.assertEqual(persistence.get_metadata('commited_positions'), 1)
+
+
+class PicklePersistenceJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_folder = tempfile.mkdtemp()
+        self.options = {
+            'name': 'exporters.persistence.pickle_persistence.PicklePersistence',
+            'options': {'file_path': self.tmp_folder},
+        }
+        self.persistence = PicklePersistence(self.options, meta())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def _resume(self):
+        options = dict(self.options, resume=True,
+                       persistence_state_id=self.persistence.persistence_state_id)
+        return PicklePersistence(options, meta())
+
+    def test_read_appended_entries_after_resume(self):
+        self.persistence.commit_position({'pending': ['a', 'b', 'c']})
+        self.persistence.append_to_journal(['a'])
+        self.persistence.append_to_journal([{'key': 'b'}])
+
+        resumed = self._resume()
+
+        self.assertEqual(resumed.last_position, {'pending': ['a', 'b', 'c']})
+        self.assertEqual(resumed.read_journal(), ['a', {'key': 'b'}])
+
+    def test_compact_journal(self):
+        self.persistence.append_to_journal(['a', 'b'])
+
+        self.persistence.compact_journal({'pending': ['c']})
+
+        resumed = self._resume()
+        self.assertEqual(resumed.last_position, {'pending': ['c']})
+        self.assertEqual(resumed.read_journal(), [])
+
+    def test_incomplete_entry_is_discarded(self):
+        self.persistence.append_to_journal(['a', 'b'])
+        journal_file_name = self.persistence._get_journal_file_name()
+        with open(journal_file_name, 'r+b') as journal_file:
+            journal_file.truncate(os.path.getsize(journal_file_name) - 2)
+
+        resumed = self._resume()
+        self.assertEqual(resumed.read_journal(), ['a'])
+        resumed.append_to_journal(['c'])
+        self.assertEqual(resumed.read_journal(), ['a', 'c'])
+
+    def test_delete_removes_journal(self):
+        self.persistence.append_to_journal(['a'])
+
+        self.persistence.delete()
+
+        self.assertEqual(os.listdir(self.tmp_folder), [])
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def _persistence(self, **options):
+        persistence = NullPersistence({'options': options}, meta())
+        persistence.committed = []
+        persistence.commit_position = persistence.committed.append
+        return persistence
+
+    def test_commits_every_position_by_default(self):
+        persistence = self._persistence()
+        for position in range(3):
+            persistence.checkpoint(lambda: position)
+        self.assertEqual(persistence.committed, [0, 1, 2])
+
+    def test_checkpoint_every_batches(self):
+        persistence = self._persistence(checkpoint_every_batches=2)
+        for position in range(5):
+            persistence.checkpoint(lambda position=position: position)
+        self.assertEqual(persistence.committed, [1, 3])
+        persistence.flush_checkpoints()
+        self.assertEqual(persistence.committed, [1, 3, 4])
+
+    @patch('time.time')
+    def test_checkpoint_interval_seconds(self, mock_time):
+        mock_time.return_value = 100
+        persistence = self._persistence(checkpoint_interval_seconds=10)
+        for position, now in enumerate([101, 105, 110, 111, 125]):
+            mock_time.return_value = now
+            persistence.checkpoint(lambda position=position: position)
+        self.assertEqual(persistence.committed, [2, 4])
+
+    def test_async_commit_error_is_raised(self):
+        persistence = NullPersistence({'options': {'async_commit': True}}, meta())
+
+        def commit_position(position):
+            raise ValueError('commit failed')
+
+        persistence.committer.commit_position = commit_position
+        persistence.checkpoint(lambda: 1)
+        with self.assertRaisesRegexp(ValueError, 'commit failed'):
+            persistence.flush_checkpoints()
+
+
+class PicklePersistenceAtomicWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_commit_position_replaces_the_file(self):
+        options = {'options': {'file_path': self.tmp_folder}}
+        persistence = PicklePersistence(options, meta())
+        persistence.commit_position({'last_read': 1})
+        persistence.commit_position({'last_read': 2})
+
+        self.assertEqual(os.listdir(self.tmp_folder), [persistence.persistence_state_id])
+        resumed = PicklePersistence(
+            dict(options, resume=True, persistence_state_id=persistence.persistence_state_id),
+            meta())
+        self.assertEqual(resumed.last_position, {'last_read': 2})
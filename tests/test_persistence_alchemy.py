@@ -60,6 +60,40 @@ class SqlitePersistenceTest(unittest.TestCase):
         result = query_db(dbfile, 'SELECT * FROM job')
         self.assertTrue(result[0]['job_finished'], "Job should be marked as finished")
 
+    def test_journal(self):
+        # given:
+        dbfile = '%s/dbfile.db' % self.tmp_folder
+        persistence = SqlitePersistence(dict(options={'database': dbfile}), meta())
+        other_job = SqlitePersistence(dict(options={'database': dbfile}), meta())
+        other_job.append_to_journal(['other'])
+
+        # when:
+        persistence.append_to_journal(['a', {'key': 'b'}])
+        journal = persistence.read_journal()
+        persistence.compact_journal({'pending': ['c']})
+
+        # then:
+        self.assertEqual(journal, ['a', {'key': 'b'}])
+        self.assertEqual(persistence.read_journal(), [])
+        self.assertEqual(persistence.get_last_position(), {'pending': ['c']})
+        self.assertEqual(other_job.read_journal(), ['other'])
+
+    def test_delete_removes_journal(self):
+        # given:
+        dbfile = '%s/dbfile.db' % self.tmp_folder
+        persistence = SqlitePersistence(dict(options={'database': dbfile}), meta())
+        other_job = SqlitePersistence(dict(options={'database': dbfile}), meta())
+        persistence.append_to_journal(['a', 'b'])
+        other_job.append_to_journal(['other'])
+
+        # when:
+        persistence.close()
+        persistence.delete()
+
+        # then:
+        result = query_db(dbfile, 'SELECT * FROM journal_entry')
+        self.assertEqual([row['job_id'] for row in result], [other_job.persistence_state_id])
+
     def test_generate_new_job(self):
         # given:
         dbfile = '%s/dbfile.db' % self.tmp_folder
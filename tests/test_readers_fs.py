@@ -1,7 +1,14 @@
+import json
+import zlib
 from gzip import GzipFile
 
+import mock
+
+from exporters.decompressors import NoDecompressor
+from exporters.deserializers import JsonLinesDeserializer
 from exporters.readers import FSReader
 from exporters.exceptions import ConfigurationError
+from exporters.records.record_batch import MISSING, RecordBatch
 
 from .utils import meta
 
@@ -48,6 +55,18 @@ class FSReaderTest(object):
         batch = list(reader.get_next_batch())
         assert expected == batch
 
+    def test_read_record_batches(self):
+        options = dict(self.options, batch_size=4, record_batches=True)
+        reader = self._make_fs_reader(options)
+        batch = reader.get_next_batch()
+        assert isinstance(batch, RecordBatch)
+        assert batch.column('item') == [u'value1', u'value2', u'value3', MISSING]
+        assert batch.column('item2') == [MISSING, MISSING, MISSING, u'value1']
+        assert not reader.is_finished()
+        batch = reader.get_next_batch()
+        assert list(batch) == [{u'item2': u'value2'}, {u'item2': u'value3'}]
+        assert reader.is_finished()
+
     def test_read_from_pointer(self):
         expected = [
             {u'item': u'value1'}, {u'item': u'value2'}, {u'item': u'value3'},
@@ -153,6 +172,125 @@ class FSReaderTest(object):
         }})
         assert list(reader.get_next_batch()) == [{"foo": 1}, {"bar": 1}]
 
+    def test_parallel_streams_keep_order(self, tmpdir_with_many_files):
+        options = {'input': {'dir': tmpdir_with_many_files.strpath}, 'batch_size': 1000}
+        expected = list(self._make_fs_reader(options).get_next_batch())
+        reader = self._make_fs_reader(dict(options, parallel_streams=4))
+        assert list(reader.get_next_batch()) == expected
+        assert reader.is_finished()
+        assert len(reader.last_position['readed_streams']) == 10
+        assert reader.last_position['stream_offset'] == {}
+
+    def test_parallel_streams_resume(self, tmpdir_with_many_files):
+        options = {
+            'input': {'dir': tmpdir_with_many_files.strpath},
+            'batch_size': 25,
+            'parallel_streams': 3,
+        }
+        reader = self._make_fs_reader(options)
+        first = list(reader.get_next_batch())
+        position = reader.get_last_position()
+        assert len(position['readed_streams']) == 2
+        assert list(position['stream_offset'].values()) == [5]
+
+        reader = self._make_fs_reader(dict(options, batch_size=1000))
+        reader.set_last_position(position)
+        rest = list(reader.get_next_batch())
+        assert [item['n'] for item in first + rest] == list(range(100))
+
+    def test_parallel_streams_error(self, tmpdir_with_many_files):
+        tmpdir_with_many_files.join('file_05.jl.gz').write('not gzip')
+        reader = self._make_fs_reader({
+            'input': {'dir': tmpdir_with_many_files.strpath},
+            'batch_size': 1000,
+            'parallel_streams': 3,
+        })
+        with mock.patch('exporters.default_retries.time.sleep'), pytest.raises(zlib.error):
+            list(reader.get_next_batch())
+
+    def test_resume_from_gzip_member(self, tmpdir_with_gzip_members):
+        options = {'input': {'dir': tmpdir_with_gzip_members.strpath}, 'batch_size': 25}
+        reader = self._make_fs_reader(options)
+        first = list(reader.get_next_batch())
+        position = reader.get_last_position()
+        path = tmpdir_with_gzip_members.join('members.jl.gz').strpath
+        compressed_offset, skip = position['stream_resume_points'][path]
+        # The 3rd member starts after the compressed bytes of the first two
+        assert compressed_offset > 0
+        assert skip == len(''.join(json.dumps({'n': n}) + '\n' for n in range(20, 25)))
+
+        reader = self._make_fs_reader(dict(options, batch_size=1000))
+        reader.set_last_position(position)
+        with mock.patch.object(FSReader, 'open_stream', autospec=True,
+                               side_effect=FSReader.open_stream) as open_stream:
+            rest = list(reader.get_next_batch())
+        assert open_stream.call_args[1] == {'offset': compressed_offset}
+        assert [item['n'] for item in first + rest] == list(range(50))
+        assert reader.last_position['stream_resume_points'] == {}
+
+    def test_resume_uncompressed_stream_at_item_offset(self, tmpdir):
+        lines = [json.dumps({'n': n}) + '\n' for n in range(10)]
+        tmpdir.join('items.jl').write(''.join(lines))
+        options = {'input': {'dir': tmpdir.strpath}, 'batch_size': 4}
+        reader = self._make_fs_reader(options)
+        reader.decompressor = NoDecompressor({}, None)
+        first = list(reader.get_next_batch())
+        position = reader.get_last_position()
+        path = tmpdir.join('items.jl').strpath
+        assert position['stream_resume_points'][path] == (len(''.join(lines[:4])), 0)
+
+        reader = self._make_fs_reader(dict(options, batch_size=1000))
+        reader.decompressor = NoDecompressor({}, None)
+        reader.set_last_position(position)
+        rest = list(reader.get_next_batch())
+        assert [item['n'] for item in first + rest] == list(range(10))
+
+    def test_rejected_lines_are_not_decoded_but_counted(self, tmpdir):
+        lines = [json.dumps({'n': n, 'even': n % 2 == 0}) + '\n' for n in range(10)]
+        tmpdir.join('items.jl').write(''.join(lines))
+        options = {'input': {'dir': tmpdir.strpath}, 'batch_size': 2}
+        reader = self._make_fs_reader(options)
+        reader.decompressor = NoDecompressor({}, None)
+        reader.deserializer = JsonLinesDeserializer({}, None)
+        reader.deserializer.line_filter = lambda line: '"even": true' in line
+        with mock.patch.object(reader.deserializer.codec, 'loads',
+                               side_effect=json.loads) as loads:
+            first = list(reader.get_next_batch())
+        assert [item['n'] for item in first] == [0, 2]
+        assert loads.call_count == 2
+        position = reader.get_last_position()
+        path = tmpdir.join('items.jl').strpath
+        assert position['stream_offset'][path] == 3
+        assert position['stream_resume_points'][path] == (len(''.join(lines[:3])), 0)
+
+        reader = self._make_fs_reader(dict(options, batch_size=1000))
+        reader.decompressor = NoDecompressor({}, None)
+        reader.deserializer = JsonLinesDeserializer({}, None)
+        reader.deserializer.line_filter = lambda line: '"even": true' in line
+        reader.set_last_position(position)
+        rest = list(reader.get_next_batch())
+        assert [item['n'] for item in rest] == [4, 6, 8]
+
+
+@pytest.fixture
+def tmpdir_with_gzip_members(tmpdir):
+    with open(tmpdir.join('members.jl.gz').strpath, 'wb') as f:
+        for member in range(5):
+            with GzipFile(fileobj=f, mode='wb') as zf:
+                for n in range(member * 10, (member + 1) * 10):
+                    zf.write(json.dumps({'n': n}) + '\n')
+    return tmpdir
+
+
+@pytest.fixture
+def tmpdir_with_many_files(tmpdir):
+    for file_number in range(10):
+        path = tmpdir.join('file_{:02d}.jl.gz'.format(file_number)).strpath
+        with GzipFile(path, 'w') as zf:
+            for n in range(file_number * 10, (file_number + 1) * 10):
+                zf.write(json.dumps({'n': n}) + '\n')
+    return tmpdir
+
 
 @pytest.fixture
 def tmpdir_with_dotfiles(tmpdir):
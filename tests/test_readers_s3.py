@@ -1,5 +1,7 @@
 import gzip
 import json
+import shutil
+import tempfile
 import unittest
 import StringIO
 from contextlib import closing
@@ -10,10 +12,13 @@ import datetime
 
 import dateparser
 import moto
-from exporters.readers.s3_reader import S3Reader, S3BucketKeysFetcher, get_bucket
-from exporters.exceptions import ConfigurationError
+from exporters.bypasses.stream_bypass import Stream
+from exporters.default_retries import disabled_retries
+from exporters.readers import s3_reader
+from exporters.readers.s3_reader import S3Reader, S3BucketKeysFetcher, get_bucket, urlopen
+from exporters.exceptions import ConfigurationError, IncompleteDownloadError
 
-from .utils import meta
+from .utils import meta, serialized
 
 NO_KEYS = ['test_list/test_key_1', 'test_list/test_key_2', 'test_list/test_key_3',
            'test_list/test_key_4', 'test_list/test_key_5', 'test_list/test_key_6',
@@ -38,6 +43,22 @@ class FakeKey(object):
         return json.dumps({'name': self.name})
 
 
+class TruncatedResponse(object):
+    def __init__(self, response):
+        self.url = response.geturl()
+        self.data = StringIO.StringIO(response.read()[:-1])
+        response.close()
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        pass
+
+
 def get_keys_list(key_list):
     keys = []
     for key_name in key_list:
@@ -307,6 +328,77 @@ class S3ReaderTest(unittest.TestCase):
                 file_names.remove(name)
             assert file_names == set()
 
+    def test_get_read_streams_uses_listed_sizes(self):
+        with closing(S3Reader(self.options_valid, meta())) as reader:
+            with mock.patch.object(reader.bucket, 'get_key') as get_key:
+                streams = list(reader.get_read_streams())
+        bucket = self.s3_conn.get_bucket('valid_keys_bucket')
+        self.assertEqual([(name, size) for name, size, _ in streams],
+                         [(name, bucket.get_key(name).size) for name in reader.keys])
+        self.assertFalse(get_key.called)
+
+    def test_open_stream_at_offset(self):
+        bucket = self.s3_conn.get_bucket('valid_keys_bucket')
+        bucket.new_key('test_list/plain').set_contents_from_string('0123456789')
+        with closing(S3Reader(self.options_valid, meta())) as reader:
+            stream = Stream('test_list/plain', 10, None)
+            self.assertEqual(reader.open_stream(stream).read(), '0123456789')
+            self.assertEqual(reader.open_stream(stream, offset=4).read(), '456789')
+
+    def test_open_stream_with_ranged_download(self):
+        content = ''.join(str(i % 10) for i in range(100))
+        bucket = self.s3_conn.get_bucket('valid_keys_bucket')
+        bucket.new_key('test_list/plain').set_contents_from_string(content)
+        options = dict(self.options_valid['options'], download_concurrency=3,
+                       download_range_size=16)
+        stream = Stream('test_list/plain', 100, None)
+        with closing(S3Reader(dict(self.options_valid, options=options), meta())) as reader, \
+                mock.patch.object(s3_reader, 'fetch_range', serialized(s3_reader.fetch_range)):
+            with mock.patch('exporters.readers.s3_reader.urlopen', wraps=urlopen) as url_open:
+                self.assertEqual(reader.open_stream(stream).read(), content)
+                self.assertEqual(url_open.call_count, 7)
+                self.assertEqual(reader.open_stream(stream, offset=90).read(), content[90:])
+
+    def test_truncated_download_raises_error(self):
+        bucket = self.s3_conn.get_bucket('valid_keys_bucket')
+        bucket.new_key('test_list/plain').set_contents_from_string('0123456789')
+        stream = Stream('test_list/plain', 10, None)
+        with closing(S3Reader(self.options_valid, meta())) as reader:
+            with mock.patch('exporters.readers.s3_reader.urlopen',
+                            side_effect=lambda url: TruncatedResponse(urlopen(url))):
+                with self.assertRaisesRegexp(IncompleteDownloadError, 'Expected 10 bytes'):
+                    reader.open_stream(stream).read()
+
+    def test_truncated_range_is_downloaded_again(self):
+        content = ''.join(str(i % 10) for i in range(100))
+        bucket = self.s3_conn.get_bucket('valid_keys_bucket')
+        bucket.new_key('test_list/plain').set_contents_from_string(content)
+        options = dict(self.options_valid['options'], download_concurrency=2,
+                       download_range_size=40)
+        responses = []
+
+        def truncate_first_response(request):
+            response = urlopen(request)
+            responses.append(request.get_header('Range'))
+            if responses.count('bytes=0-39') == 1 and responses[-1] == 'bytes=0-39':
+                return TruncatedResponse(response)
+            return response
+
+        stream = Stream('test_list/plain', 100, None)
+        with closing(S3Reader(dict(self.options_valid, options=options), meta())) as reader, \
+                mock.patch.object(s3_reader, 'fetch_range', serialized(s3_reader.fetch_range)):
+            with mock.patch('exporters.readers.s3_reader.urlopen',
+                            side_effect=truncate_first_response), \
+                    mock.patch('exporters.default_retries._retry_init', None), \
+                    mock.patch('retrying.time.sleep'):
+                self.assertEqual(reader.open_stream(stream).read(), content)
+            with mock.patch('exporters.readers.s3_reader.urlopen',
+                            side_effect=lambda request: TruncatedResponse(urlopen(request))):
+                with disabled_retries(), self.assertRaises(IncompleteDownloadError):
+                    reader.open_stream(stream).read()
+        self.assertEqual(sorted(responses), ['bytes=0-39', 'bytes=0-39', 'bytes=40-79',
+                                             'bytes=80-99'])
+
     def test_invalid_date_range(self):
         self.assertRaisesRegexp(ConfigurationError,
                                 'The end date should be greater or equal to '
@@ -378,6 +470,62 @@ class TestS3BucketKeysFetcher(unittest.TestCase):
         self.assertEqual(set(POINTER_KEYS), set(fetcher.pending_keys()))
 
 
+class S3BucketKeysListingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_s3 = moto.mock_s3()
+        self.mock_s3.start()
+        self.s3_conn = boto.connect_s3()
+        bucket = self.s3_conn.create_bucket('daily_bucket')
+        self.key_names = []
+        for day in range(1, 11):
+            for number in range(3):
+                key_name = 'daily/2016-01-{:02d}/part-{}'.format(day, number)
+                bucket.new_key(key_name).set_contents_from_string('a' * (day + number))
+                self.key_names.append(key_name)
+        self.tmp_folder = tempfile.mkdtemp()
+        self.options = {
+            'bucket': 'daily_bucket',
+            'prefix': 'daily/%Y-%m-%d/',
+            'prefix_format_using_date': ['2016-01-01', '2016-01-10'],
+        }
+
+    def tearDown(self):
+        self.mock_s3.stop()
+        shutil.rmtree(self.tmp_folder)
+
+    def test_list_prefixes_concurrently(self):
+        options = dict(self.options, listing_concurrency=4)
+        fetcher = S3BucketKeysFetcher(options, 'KEY', 'SECRET')
+
+        with mock.patch.object(S3BucketKeysFetcher, '_list_prefix',
+                               serialized(S3BucketKeysFetcher._list_prefix.__func__)):
+            keys = fetcher.pending_keys_info()
+
+        bucket = self.s3_conn.get_bucket('daily_bucket')
+        self.assertEqual([key.name for key in keys], self.key_names)
+        for key in keys:
+            remote_key = bucket.get_key(key.name)
+            self.assertEqual(key.size, remote_key.size)
+            self.assertEqual(key.etag, remote_key.etag.strip('"'))
+
+    def test_listing_cache(self):
+        options = dict(self.options, listing_cache_path=self.tmp_folder + '/listing.json')
+        self.assertEqual(S3BucketKeysFetcher(options, 'KEY', 'SECRET').pending_keys(),
+                         self.key_names)
+
+        with mock.patch('boto.s3.bucket.Bucket.list') as list_keys:
+            keys = S3BucketKeysFetcher(options, 'KEY', 'SECRET').pending_keys()
+        self.assertFalse(list_keys.called)
+        self.assertEqual(keys, self.key_names)
+
+        outdated_options = dict(options, listing_cache_max_age=-1)
+        with mock.patch('boto.s3.bucket.Bucket.list', return_value=[]) as list_keys:
+            keys = S3BucketKeysFetcher(outdated_options, 'KEY', 'SECRET').pending_keys()
+        self.assertEqual(list_keys.call_count, 10)
+        self.assertEqual(keys, [])
+
+
 class GetBucketTest(unittest.TestCase):
     def setUp(self):
         self.mock_s3 = moto.mock_s3()
@@ -0,0 +1,50 @@
+import pickle
+import unittest
+
+from exporters.records.base_record import BaseRecord
+from exporters.records.record_batch import MISSING, RecordBatch, materialize_batch
+
+
+class RecordBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            BaseRecord({'name': 'a', 'country': {'code': 'es'}}),
+            BaseRecord({'name': 'b', 'value': 1}),
+            BaseRecord({'name': 'c', 'country': {'code': 'uk'}, 'value': None}),
+        ]
+
+    def test_from_records_round_trip(self):
+        batch = RecordBatch.from_records(self.records)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.column('name'), ['a', 'b', 'c'])
+        self.assertEqual(batch.column('value'), [MISSING, 1, None])
+        self.assertEqual(batch.column('not_a_field'), [MISSING] * 3)
+        records = list(batch)
+        self.assertEqual(records, self.records)
+        self.assertTrue(all(isinstance(record, BaseRecord) for record in records))
+
+    def test_nested_column(self):
+        batch = RecordBatch.from_records(self.records)
+        self.assertEqual(batch.nested_column(['country', 'code']), ['es', MISSING, 'uk'])
+        self.assertEqual(batch.nested_column(['name', 'code']), [MISSING] * 3)
+
+    def test_take_keeps_group_memberships(self):
+        batch = RecordBatch.from_records(self.records)
+        batch.set_group_memberships(['name'], [('a',), ('b',), ('c',)])
+        taken = batch.take([True, False, True])
+        self.assertEqual(len(taken), 2)
+        self.assertEqual(taken.column('name'), ['a', 'c'])
+        records = list(taken)
+        self.assertEqual([record.group_membership for record in records], [('a',), ('c',)])
+        self.assertEqual(records[0].group_key, ['name'])
+
+    def test_pickle_keeps_missing_marker(self):
+        batch = pickle.loads(pickle.dumps(RecordBatch.from_records(self.records)))
+        self.assertIs(batch.column('value')[0], MISSING)
+        self.assertEqual(list(batch), self.records)
+
+    def test_materialize_batch(self):
+        batch = RecordBatch.from_records(self.records)
+        self.assertIs(materialize_batch(batch), batch)
+        self.assertEqual(materialize_batch(iter(self.records)), self.records)
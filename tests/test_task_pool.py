@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+
+from exporters.task_pool import BoundedTaskPool, ByteBudget
+
+
+class BoundedTaskPoolTest(unittest.TestCase):
+
+    def test_runs_all_tasks(self):
+        done = []
+        pool = BoundedTaskPool(3)
+        try:
+            for i in range(20):
+                pool.submit(done.append, i)
+            pool.wait()
+        finally:
+            pool.close()
+        self.assertEqual(sorted(done), list(range(20)))
+
+    def test_submit_blocks_when_max_pending_is_reached(self):
+        release = threading.Event()
+        pool = BoundedTaskPool(2, max_pending=3)
+        submitted = []
+
+        def submit_all():
+            for i in range(5):
+                pool.submit(release.wait)
+                submitted.append(i)
+
+        producer = threading.Thread(target=submit_all)
+        producer.start()
+        try:
+            time.sleep(0.1)
+            self.assertEqual(len(submitted), 3)
+            release.set()
+            producer.join()
+            pool.wait()
+        finally:
+            release.set()
+            pool.close()
+        self.assertEqual(len(submitted), 5)
+
+    def test_task_error_is_raised_and_pending_tasks_are_skipped(self):
+        done = []
+
+        def task(i):
+            if i == 0:
+                raise ValueError('task failed')
+            done.append(i)
+
+        pool = BoundedTaskPool(1, max_pending=10)
+        started = threading.Event()
+        pool.submit(started.wait)
+        for i in range(5):
+            pool.submit(task, i)
+        started.set()
+        try:
+            with self.assertRaisesRegexp(ValueError, 'task failed'):
+                pool.wait()
+            with self.assertRaisesRegexp(ValueError, 'task failed'):
+                pool.submit(task, 6)
+        finally:
+            pool.close()
+        self.assertEqual(done, [])
+
+
+class ByteBudgetTest(unittest.TestCase):
+
+    def test_acquire_blocks_until_bytes_are_released(self):
+        budget = ByteBudget(100)
+        self.assertEqual(budget.acquire(60), 60)
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(budget.acquire(50)))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertEqual(acquired, [])
+        budget.release(60)
+        waiter.join()
+        self.assertEqual(acquired, [50])
+        self.assertEqual(budget.available, 50)
+
+    def test_requests_bigger_than_the_budget_take_the_whole_budget(self):
+        budget = ByteBudget(100)
+        self.assertEqual(budget.acquire(1000), 100)
+        self.assertEqual(budget.available, 0)
+        budget.release(100)
+        self.assertEqual(budget.available, 100)
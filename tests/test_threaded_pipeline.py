@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from exporters.export_managers.threaded_pipeline import StagedPipeline
+
+
+class StagedPipelineTest(unittest.TestCase):
+
+    def test_units_go_through_all_stages_in_order(self):
+        written = []
+        pipeline = StagedPipeline(
+            source=('read', lambda: iter(range(20))),
+            stages=[('double', lambda x: x * 2), ('write', written.append)],
+            queue_size=2)
+        pipeline.run()
+        self.assertEqual(written, [x * 2 for x in range(20)])
+        stats = pipeline.stats_report()
+        self.assertEqual(list(stats.keys()), ['read', 'double', 'write'])
+        self.assertEqual([s['processed'] for s in stats.values()], [20, 20, 20])
+        self.assertTrue(all(s['max_queue_depth'] <= 2 for s in stats.values()))
+
+    def test_error_in_stage_is_raised_and_stops_the_source(self):
+        read = []
+
+        def source():
+            for i in range(1000):
+                read.append(i)
+                yield i
+
+        def fail(unit):
+            if unit == 3:
+                raise ValueError('failed processing {}'.format(unit))
+            return unit
+
+        pipeline = StagedPipeline(
+            source=('read', source),
+            stages=[('process', fail), ('write', lambda unit: None)],
+            queue_size=2, poll_interval=0.01)
+        with self.assertRaisesRegexp(ValueError, 'failed processing 3'):
+            pipeline.run()
+        self.assertLess(len(read), 1000)
+
+    def test_error_in_source_is_raised(self):
+        def source():
+            yield 1
+            raise RuntimeError('read error')
+
+        pipeline = StagedPipeline(
+            source=('read', source), stages=[('write', lambda unit: None)],
+            poll_interval=0.01)
+        with self.assertRaisesRegexp(RuntimeError, 'read error'):
+            pipeline.run()
+
+    def test_slow_stage_blocks_previous_ones(self):
+        def slow_write(unit):
+            time.sleep(0.01)
+
+        pipeline = StagedPipeline(
+            source=('read', lambda: iter(range(10))),
+            stages=[('write', slow_write)],
+            queue_size=1, poll_interval=0.01)
+        pipeline.run()
+        stats = pipeline.stats_report()
+        self.assertGreater(stats['read']['output_wait'], 0)
+        self.assertEqual(stats['write']['processed'], 10)
@@ -11,7 +11,7 @@ from exporters.groupers.base_grouper import BaseGrouper
 from exporters.logger.base_logger import CategoryLogger
 from exporters.module_loader import ModuleLoader
 from exporters.pipeline.base_pipeline_item import BasePipelineItem
-from exporters.python_interpreter import Interpreter
+from exporters.python_interpreter import Interpreter, create_context
 from exporters.utils import nested_dict_value, TmpFile, split_file, \
     calculate_multipart_etag, str_list, dict_list, int_list, maybe_cast_list
 from .utils import environment
@@ -299,6 +299,38 @@ class PythonInterpreterTest(unittest.TestCase):
         with self.assertRaises(InvalidExpression):
             self.interpreter.check('2+2; 5+6')
 
+    def test_compile_is_cached(self):
+        code = self.interpreter.compile('item + 1')
+        self.assertIs(self.interpreter.compile('item + 1'), code)
+        context = create_context(item=1)
+        self.assertEqual(self.interpreter.eval('item + 1', context=context), 2)
+        context['item'] = 41
+        self.assertEqual(self.interpreter.eval('item + 1', context=context), 42)
+
+    def test_compile_checks_expression(self):
+        with self.assertRaises(InvalidExpression):
+            self.interpreter.compile('[i for i in range(3)]; 1')
+        with self.assertRaises(InvalidExpression):
+            self.interpreter.eval('lambda: 1')
+
+    def test_compile_unchecked_expression_is_checked_later(self):
+        self.assertEqual(self.interpreter.eval('(lambda: 1)()', check=False), 1)
+        with self.assertRaises(InvalidExpression):
+            self.interpreter.compile('(lambda: 1)()')
+        with self.assertRaises(InvalidExpression):
+            self.interpreter.eval('(lambda: 1)()')
+
+    def test_eval_batch(self):
+        context = create_context()
+        batch = [{'value': i} for i in range(5)]
+        result = self.interpreter.eval_batch(
+            "math.sqrt(item['value']) > 1  # a comment", batch, context=context)
+        self.assertEqual(result, [False, False, True, True, True])
+        self.assertNotIn('__batch__', context)
+        self.assertEqual(
+            self.interpreter.eval_batch("[v * 2 for v in item.values()]", batch),
+            [[0], [2], [4], [6], [8]])
+
 
 class BaseByPassTest(unittest.TestCase):
     def test_not_implemented(self):
@@ -4,10 +4,14 @@ import datetime
 import gzip
 import json
 import os
+import pickle
 import random
 import shutil
 import tempfile
+import threading
+import time
 import unittest
+import zipfile
 import mock
 from contextlib import closing
 from freezegun import freeze_time
@@ -17,8 +21,10 @@ from exporters.export_formatter.xml_export_formatter import XMLExportFormatter
 from exporters.records.base_record import BaseRecord
 from exporters.write_buffers.base import WriteBuffer
 from exporters.write_buffers.grouping import GroupingBufferFilesTracker
+from exporters.write_buffers.utils import HashingFile, hash_for_file
+from exporters.utils import TmpFile, calculate_multipart_etag
 from exporters.writers import FSWriter
-from exporters.writers.base_writer import BaseWriter, InconsistentWriteState
+from exporters.writers.base_writer import BaseWriter, InconsistentWriteState, ItemsLimitReached
 from exporters.writers.console_writer import ConsoleWriter
 from exporters.writers.filebase_base_writer import Filebase
 from exporters.export_formatter.json_export_formatter import JsonExportFormatter
@@ -127,6 +133,69 @@ class CustomWriterTest(unittest.TestCase):
         finally:
             writer.close()
 
+    def test_write_batch_buffers_one_chunk_per_group(self):
+        # given:
+        writer = FakeWriter({}, {})
+        batch = [
+            BaseRecord(country=u'ES', city=u'Madrid'),
+            BaseRecord(country=u'FR', city=u'Paris'),
+            BaseRecord(country=u'ES', city=u'Valencia'),
+        ]
+        for item in batch:
+            item.group_key = ['country']
+            item.group_membership = (item['country'],)
+
+        # when:
+        try:
+            with mock.patch.object(writer.write_buffer.items_group_files, 'add_items_to_file',
+                                   wraps=writer.write_buffer.items_group_files.add_items_to_file
+                                   ) as add_items:
+                writer.write_batch(batch)
+            writer.flush()
+        finally:
+            writer.close()
+
+        # then:
+        self.assertEqual([len(args[0]) for args, _ in add_items.call_args_list], [2, 1])
+        self.assertEqual([json.loads(line)['city']
+                          for line in writer.custom_output[(u'ES',)].splitlines()],
+                         [u'Madrid', u'Valencia'])
+        self.assertEqual(writer.get_metadata('items_count'), 3)
+
+    def test_write_batch_respects_items_per_buffer_write(self):
+        # given:
+        writer = FakeWriter({}, {})
+        writer.write_buffer.items_per_buffer_write = 2
+        batch = self.batch + [BaseRecord({u'key1': u'value14', u'key2': u'value24'})]
+
+        # when:
+        try:
+            writer.write_batch(batch)
+            written_before_flush = len(writer.fake_files_already_written)
+            writer.flush()
+        finally:
+            writer.close()
+
+        # then:
+        self.assertEqual(written_before_flush, 2)
+        self.assertEqual(len(writer.fake_files_already_written), 2)
+
+    def test_write_batch_stops_at_items_limit(self):
+        # given:
+        writer = FakeWriter({'options': {'items_limit': 2}}, {})
+
+        # when:
+        try:
+            with self.assertRaises(ItemsLimitReached):
+                writer.write_batch(self.batch)
+            writer.flush()
+        finally:
+            writer.close()
+
+        # then:
+        self.assertEqual(writer.get_metadata('items_count'), 2)
+        self.assertEqual(len(writer.custom_output[()].splitlines()), 2)
+
     def test_custom_writer_with_csv_formatter(self):
         # given:
 
@@ -325,6 +394,187 @@ class WriteBufferTest(unittest.TestCase):
                          'Wrong metadata')
         self.assertIsNone(self.write_buffer.get_metadata('somekey').get('nokey'))
 
+    def test_buffer_file_tracks_size(self):
+        # given:
+        items = [BaseRecord(key=i, value=random.random()) for i in range(200)]
+        for item in items:
+            item.group_membership = ()
+
+        # when:
+        self.write_buffer.buffer_items(items, ())
+        buffer_file = self.write_buffer.grouping_info[()]['group_file'][-1]
+        size = buffer_file.size
+        self.write_buffer.finish_buffer_write(())
+
+        # then:
+        with gzip.open(buffer_file.path) as f:
+            self.assertEqual(buffer_file.uncompressed_size, len(f.read()))
+        self.assertLessEqual(size, os.path.getsize(buffer_file.path))
+
+    def test_should_write_buffer_by_size_without_stat(self):
+        # given:
+        self.write_buffer.items_group_files.compression_format = 'none'
+        items = [BaseRecord(key=i, value='x' * 100) for i in range(20)]
+        results = []
+
+        # when:
+        with mock.patch('os.path.getsize') as getsize:
+            for item in items:
+                item.group_membership = ()
+                self.write_buffer.buffer_items([item], ())
+                results.append(self.write_buffer.should_write_buffer(()))
+
+        # then:
+        self.assertFalse(getsize.called)
+        buffer_file = self.write_buffer.grouping_info[()]['group_file'][-1]
+        item_size = buffer_file.size // len(items)
+        self.assertEqual(results.index(True), 1000 // item_size)
+        self.write_buffer.finish_buffer_write(())
+        self.assertEqual(buffer_file.uncompressed_size, os.path.getsize(buffer_file.path))
+
+
+class OpenFilesLimitTest(unittest.TestCase):
+
+    def _write_groups(self, compression_format, max_open_files):
+        formatter = JsonExportFormatter({}, meta())
+        files_tracker = GroupingBufferFilesTracker(formatter, compression_format)
+        write_buffer = WriteBuffer({}, meta(),
+                                   items_per_buffer_write=1000,
+                                   size_per_buffer_write=0,
+                                   items_group_files_handler=files_tracker,
+                                   hash_algorithm='md5',
+                                   max_open_files=max_open_files)
+        items = [BaseRecord(key=i, group=str(i % 5)) for i in range(100)]
+        try:
+            for item in items:
+                write_buffer.buffer_items([item], (item['group'],))
+                self.assertLessEqual(len(files_tracker.open_files), max_open_files)
+            write_infos = [write_buffer.pack_buffer((str(group),)) for group in range(5)]
+            for group, write_info in enumerate(write_infos):
+                file_path = write_info['file_path']
+                self.assertEqual(write_info['size'], os.path.getsize(file_path))
+                self.assertEqual(write_info['file_hash'], hash_for_file(file_path, 'md5'))
+                open_file = gzip.open if compression_format == 'gz' else open
+                with open_file(file_path) as f:
+                    self.assertEqual([json.loads(line) for line in f],
+                                     [item for item in items if item['group'] == str(group)])
+            return files_tracker
+        finally:
+            write_buffer.close()
+
+    def test_least_recently_used_files_are_closed_and_reopened(self):
+        for compression_format in ['gz', 'none']:
+            files_tracker = self._write_groups(compression_format, max_open_files=3)
+            self.assertEqual(files_tracker.evicted_files, 98)
+            self.assertEqual(files_tracker.reopened_files, 98)
+            self.assertEqual(files_tracker.open_files, {})
+
+    def test_no_file_is_closed_below_the_limit(self):
+        files_tracker = self._write_groups('gz', max_open_files=5)
+        self.assertEqual(files_tracker.evicted_files, 0)
+        self.assertEqual(files_tracker.reopened_files, 0)
+
+    def test_writer_reports_evictions(self):
+        tmp_dir = tempfile.mkdtemp()
+        options = {
+            'name': 'exporters.writers.fs_writer.FSWriter',
+            'options': {
+                'filebase': os.path.join(tmp_dir, '{groups[0]}/file'),
+                'max_open_files': 2,
+                'compression': 'zip',
+            }
+        }
+        items = []
+        for i in range(30):
+            item = BaseRecord(key=i, country=['ES', 'FR', 'IT'][i % 3])
+            item.group_membership = (item['country'],)
+            items.append(item)
+        writer = FSWriter(options, meta())
+        try:
+            for i in range(0, len(items), 3):
+                writer.write_batch(items[i:i + 3])
+            stats = writer.get_metadata('buffer_files')
+            self.assertEqual(stats, {
+                'max_open_files': 2,
+                'open_files': 2,
+                'evicted_files': 28,
+                'reopened_files': 27,
+            })
+            writer.flush()
+            writer.finish_writing()
+            self.assertLessEqual(writer.get_metadata('buffer_files')['open_files'], 2)
+            for country in ['ES', 'FR', 'IT']:
+                zip_path = os.path.join(tmp_dir, country, 'file0000.jl.zip')
+                with zipfile.ZipFile(zip_path) as zip_file:
+                    lines = zip_file.read('file0000.jl').splitlines()
+                self.assertEqual([json.loads(line) for line in lines],
+                                 [other for other in items if other['country'] == country])
+        finally:
+            writer.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class HashingFileTest(unittest.TestCase):
+
+    def test_hashes_written_data(self):
+        # given:
+        data = [os.urandom(random.randint(0, 3000)) for _ in range(20)]
+
+        # when:
+        with TmpFile() as tmp_filename:
+            hashing_file = HashingFile(open(tmp_filename, 'wb'), 'md5', multipart_part_size=1000)
+            for chunk in data:
+                hashing_file.write(chunk)
+            hashing_file.close()
+
+            # then:
+            self.assertEqual(hashing_file.size, os.path.getsize(tmp_filename))
+            self.assertEqual(hashing_file.hexdigest(), hash_for_file(tmp_filename, 'md5'))
+            self.assertEqual(hashing_file.multipart_etag(),
+                             calculate_multipart_etag(tmp_filename, 1000))
+
+
+class PackBufferTest(unittest.TestCase):
+
+    def _pack_buffer(self, compression_format):
+        formatter = JsonExportFormatter({}, meta())
+        files_tracker = GroupingBufferFilesTracker(formatter, compression_format)
+        write_buffer = WriteBuffer({}, meta(),
+                                   items_per_buffer_write=1000,
+                                   size_per_buffer_write=0,
+                                   items_group_files_handler=files_tracker,
+                                   hash_algorithm='md5',
+                                   multipart_part_size=1024)
+        items = [BaseRecord(key=i, value=random.random()) for i in range(500)]
+        try:
+            write_buffer.buffer_items(items, ())
+            with mock.patch('exporters.write_buffers.base.hash_for_file',
+                            wraps=hash_for_file) as hash_mock:
+                write_info = write_buffer.pack_buffer(())
+            file_path = write_info['file_path']
+            expected = {
+                'number_of_records': 500,
+                'file_path': file_path,
+                'size': os.path.getsize(file_path),
+                'file_hash': hash_for_file(file_path, 'md5'),
+                'multipart_etag': calculate_multipart_etag(file_path, 1024),
+            }
+            return write_info, expected, hash_mock.called
+        finally:
+            write_buffer.close()
+
+    def test_pack_buffer_hashes_while_writing(self):
+        for compression_format in ['gz', 'none']:
+            write_info, expected, hashed_file = self._pack_buffer(compression_format)
+            self.assertEqual(write_info, expected)
+            self.assertFalse(hashed_file)
+
+    def test_pack_buffer_zip_file(self):
+        write_info, expected, hashed_file = self._pack_buffer('zip')
+        expected['multipart_etag'] = None
+        self.assertEqual(write_info, expected)
+        self.assertTrue(hashed_file)
+
 
 class ReservoirSamplingWriterTest(unittest.TestCase):
     def setUp(self):
@@ -499,6 +749,102 @@ class FSWriterTest(unittest.TestCase):
         expected_file = '{}/exporter_test0000.jl.gz'.format(self.tmp_dir)
         self.assertTrue(expected_file in writer.written_files)
 
+    def test_upload_concurrency(self):
+        # given:
+        writer_config = self.get_writer_config()
+        writer_config['options'].update({'upload_concurrency': 3,
+                                         'items_per_buffer_write': 1,
+                                         'check_consistency': True})
+        batch = [BaseRecord(name=u'name{}'.format(i)) for i in range(10)]
+        writer = FSWriter(writer_config, meta())
+
+        # when:
+        try:
+            with mock.patch.object(writer.upload_pool, 'submit',
+                                   wraps=writer.upload_pool.submit) as submit:
+                writer.write_batch(batch)
+            writer.flush()
+            writer.finish_writing()
+        finally:
+            writer.close()
+
+        # then:
+        self.assertEqual(submit.call_count, 10)
+        expected_files = ['{}/exporter_test{:04d}.jl.gz'.format(self.tmp_dir, i)
+                          for i in range(10)]
+        self.assertEqual(sorted(writer.written_files), expected_files)
+        self.assertEqual(sorted(f['filename'] for f in writer.get_metadata('files_written')),
+                         expected_files)
+        written = []
+        for path in expected_files:
+            with gzip.open(path) as f:
+                written.extend(json.loads(line) for line in f)
+        self.assertEqual(written, batch)
+
+    def test_checkpoint_metadata_while_uploading(self):
+        # given:
+        writer_config = self.get_writer_config()
+        writer_config['options'].update({'upload_concurrency': 3,
+                                         'items_per_buffer_write': 1})
+        batch = [BaseRecord(name=u'name{}'.format(i)) for i in range(30)]
+        writer = FSWriter(writer_config, meta())
+        copy = shutil.copy
+        uploading = threading.Event()
+        done = threading.Event()
+        snapshots = []
+        errors = []
+
+        def slow_copy(*args):
+            uploading.set()
+            time.sleep(0.005)
+            return copy(*args)
+
+        def checkpoint():
+            uploading.wait()
+            while not done.is_set():
+                try:
+                    snapshot = writer.get_all_metadata()
+                    json.dumps(snapshot)
+                    pickle.dumps(snapshot)
+                    snapshots.append(snapshot)
+                except Exception as e:
+                    errors.append(e)
+
+        # when:
+        checkpointer = threading.Thread(target=checkpoint)
+        checkpointer.start()
+        try:
+            with mock.patch('shutil.copy', side_effect=slow_copy):
+                writer.write_batch(batch)
+                writer.flush()
+        finally:
+            done.set()
+            uploading.set()
+            checkpointer.join()
+            writer.close()
+
+        # then:
+        self.assertEqual(errors, [])
+        self.assertTrue(snapshots)
+        files_written = writer.get_metadata('files_written')
+        self.assertEqual(len(files_written), 30)
+        for snapshot in snapshots:
+            self.assertIsNot(snapshot['files_written'], files_written)
+            self.assertEqual(snapshot['files_written'],
+                             files_written[:len(snapshot['files_written'])])
+
+    def test_upload_error_is_raised_on_flush(self):
+        writer_config = self.get_writer_config()
+        writer_config['options'].update({'upload_concurrency': 2})
+        writer = FSWriter(writer_config, meta())
+        try:
+            with mock.patch('shutil.copy', side_effect=IOError('disk full')):
+                writer.write_batch(self.get_batch())
+                with self.assertRaisesRegexp(IOError, 'disk full'):
+                    writer.flush()
+        finally:
+            writer.close()
+
     def test_compression_gzip_format(self):
         writer_config = self.get_writer_config()
         writer_config['options'].update({'compression': 'gz'})
@@ -693,3 +1039,28 @@ class FSWriterTest(unittest.TestCase):
                     for f in fnames]
 
         self.assertEqual(sorted(expected), sorted(listdir_recursive(self.tmp_dir)))
+
+    def test_writer_with_grouped_data_and_no_file_number(self):
+        # given:
+        batch = [
+            BaseRecord(city=u'Madrid', country=u'ES'),
+            BaseRecord(city=u'Paris', country=u'FR'),
+        ]
+        grouped_batch = self._build_grouped_batch(
+            batch, python_expressions=["item['country']"])
+
+        options = self.get_writer_config()
+        options['options']['filebase'] = os.path.join(self.tmp_dir, '{groups[0]}_file')
+        writer = FSWriter(options=options, metadata=meta())
+
+        # when:
+        with closing(writer) as w:
+            w.write_batch(grouped_batch)
+            w.flush()
+            w.finish_writing()
+
+        # then:
+        for item in batch:
+            path = os.path.join(self.tmp_dir, '{}_file.jl.gz'.format(item['country']))
+            with gzip.open(path) as f:
+                self.assertEqual([json.loads(line) for line in f], [item])
@@ -1,16 +1,20 @@
+import os
+import threading
 import unittest
 
 import boto
 import moto
 import mock
 
+from exporters.default_retries import set_retry_init, reenable_retries
+from exporters.exceptions import ConfigurationError
 from exporters.meta import ExportMeta
 from exporters.records.base_record import BaseRecord
-from exporters.utils import TmpFile
+from exporters.utils import TmpFile, calculate_multipart_etag
 from exporters.writers.base_writer import InconsistentWriteState
 from exporters.writers.s3_writer import S3Writer
 
-from .utils import meta
+from .utils import meta, serialized
 
 RESERVOIR_SAMPLING_BUFFER_CLASS = \
     'exporters.write_buffers.reservoir_sampling_buffer.ReservoirSamplingWriteBuffer'
@@ -110,6 +114,120 @@ class S3WriterTest(unittest.TestCase):
         self.assertEquals(1, len(saved_keys))
         self.assertEqual(saved_keys[0].name, 'tests/0.jl.gz')
 
+    def _upload_large_file(self, content, **options):
+        writer_config = self.get_writer_config()
+        writer_config['options'].update(options)
+        # Small parts keep the test fast, both S3 limits are patched for them
+        with mock.patch('exporters.writers.s3_writer.MIN_MULTIPART_PART_SIZE', 1024), \
+                mock.patch('moto.s3.models.UPLOAD_PART_MIN_SIZE', 1024):
+            writer = S3Writer(writer_config, meta())
+            try:
+                with TmpFile() as tmp_filename:
+                    with open(tmp_filename, 'w') as f:
+                        f.write(content)
+                    writer._upload_large_file(tmp_filename, 'tests/0.jl.gz')
+                    expected_etag = calculate_multipart_etag(
+                        tmp_filename, writer.multipart_part_size)
+            finally:
+                writer.close()
+        return expected_etag
+
+    def test_write_s3_big_file_parallel_parts(self):
+        # given
+        from boto.s3.multipart import MultiPartUpload
+        content = os.urandom(1024 * 7 + 10)
+        upload_part = MultiPartUpload.upload_part_from_file
+        connections = {}
+
+        def record_connection(mp, fp, part_num, **kwargs):
+            thread_name = threading.current_thread().name
+            connections.setdefault(thread_name, set()).add(id(mp.bucket.connection))
+            return upload_part(mp, fp, part_num, **kwargs)
+
+        # when:
+        with mock.patch.object(MultiPartUpload, 'upload_part_from_file',
+                               serialized(record_connection)):
+            expected_etag = self._upload_large_file(
+                content, multipart_part_size=1024, multipart_concurrency=3)
+
+        # then:
+        self.assertTrue(all(name.startswith('multipart-upload') for name in connections))
+        self.assertTrue(all(len(ids) == 1 for ids in connections.values()))
+        self.assertEqual(len(set.union(*connections.values())), len(connections))
+        key = self.s3_conn.get_bucket('fake_bucket').get_key('tests/0.jl.gz')
+        self.assertEqual(key.etag, expected_etag)
+        self.assertTrue(expected_etag.endswith('-8"'))
+        self.assertEqual(key.get_metadata('md5'), expected_etag)
+        self.assertEqual(key.get_contents_as_string(), content)
+
+    def test_write_s3_big_file_retries_failed_parts(self):
+        # given
+        from boto.s3.multipart import MultiPartUpload
+        content = os.urandom(1024 * 3 + 10)
+        upload_part = MultiPartUpload.upload_part_from_file
+        failed_parts = []
+
+        def fail_once(mp, fp, part_num, **kwargs):
+            if part_num not in failed_parts:
+                failed_parts.append(part_num)
+                fp.read(100)
+                raise IOError('connection reset')
+            return upload_part(mp, fp, part_num, **kwargs)
+
+        # when:
+        set_retry_init(lambda args, kwargs: (args, dict(kwargs, wait_exponential_multiplier=0)))
+        try:
+            with mock.patch.object(MultiPartUpload, 'upload_part_from_file',
+                                   serialized(fail_once)):
+                expected_etag = self._upload_large_file(
+                    content, multipart_part_size=1024, multipart_concurrency=2)
+        finally:
+            reenable_retries()
+
+        # then:
+        self.assertEqual(sorted(failed_parts), [1, 2, 3, 4])
+        key = self.s3_conn.get_bucket('fake_bucket').get_key('tests/0.jl.gz')
+        self.assertEqual(key.etag, expected_etag)
+        self.assertEqual(key.get_contents_as_string(), content)
+
+    def test_upload_workers_use_their_own_connection(self):
+        # given
+        options = self.get_writer_config()
+        options['options'].update(upload_concurrency=3, items_per_buffer_write=1)
+        writer = S3Writer(options, meta())
+        write_s3_key = serialized(writer._write_s3_key)
+        buckets = []
+
+        def record_bucket(dump_path, key_name):
+            buckets.append((threading.current_thread().name, writer.bucket))
+            write_s3_key(dump_path, key_name)
+
+        # when:
+        try:
+            with mock.patch.object(writer, '_write_s3_key', record_bucket):
+                writer.write_batch([BaseRecord(key=i) for i in range(6)])
+                writer.flush()
+            main_bucket = writer.bucket
+        finally:
+            writer.close()
+
+        # then:
+        self.assertEqual(len(buckets), 6)
+        thread_buckets = {}
+        for thread_name, bucket in buckets:
+            self.assertIsNot(bucket, main_bucket)
+            self.assertIs(thread_buckets.setdefault(thread_name, bucket), bucket)
+        connections = set(id(bucket.connection) for bucket in thread_buckets.values())
+        self.assertEqual(len(connections), len(thread_buckets))
+        saved_keys = list(self.s3_conn.get_bucket('fake_bucket').list())
+        self.assertEqual(len(saved_keys), 6)
+
+    def test_invalid_multipart_part_size(self):
+        options = self.get_writer_config()
+        options['options']['multipart_part_size'] = 1024
+        with self.assertRaisesRegexp(ConfigurationError, 'multipart_part_size'):
+            S3Writer(options, meta())
+
     def test_connect_to_specific_region(self):
         # given:
         conn = boto.connect_s3()
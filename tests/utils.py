@@ -4,6 +4,7 @@ import json
 import mock
 import os
 import StringIO
+import threading
 from contextlib import closing
 from copy import deepcopy
 from exporters.meta import ExportMeta
@@ -69,6 +70,28 @@ class NullWriter(BaseWriter):
         """
 
 
+class StreamRecorderWriter(BaseWriter):
+    """
+    Keeps the contents written with write_stream() and the threads writing
+    them in the class attribute streams
+    """
+    supports_concurrent_streams = True
+    streams = {}
+    lock = threading.Lock()
+
+    def write(self, *args, **kwargs):
+        pass
+
+    def write_stream(self, stream, file_obj):
+        content = file_obj.read()
+        with self.lock:
+            self.streams[stream.filename] = (threading.current_thread().name, content)
+
+
+class SequentialStreamRecorderWriter(StreamRecorderWriter):
+    supports_concurrent_streams = False
+
+
 class ErrorWriter(BaseWriter):
     msg = "ErrorWriter error"
 
@@ -112,3 +135,17 @@ def create_s3_keys(bucket, key_names):
             with gzip.GzipFile(fileobj=out, mode='w') as f:
                 f.write(json.dumps({'name': key_name}))
             key.set_contents_from_string(out.getvalue())
+
+
+def serialized(func):
+    """
+    moto's fake HTTP layer is not thread safe, so tests with concurrent
+    requests make them one at a time.
+    """
+    lock = threading.Lock()
+
+    def inner(*args, **kwargs):
+        with lock:
+            return func(*args, **kwargs)
+
+    return inner